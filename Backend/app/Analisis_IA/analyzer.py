@@ -1,72 +1,50 @@
+import asyncio
 import json
 import os
 import re
-import time
-from typing import List, Dict, Any
-import google.generativeai as genai
-from google.api_core import exceptions
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional
+
 from dotenv import load_dotenv
+from fastapi.concurrency import run_in_threadpool
+
+from app.Analisis_IA import cache
+from app.cliente_ia import ClienteIA, ErrorIA, crear_backend, estimar_tokens
+from app.llaves_ia import PoolLlaves
 
 # Cargar variables de entorno
 load_dotenv()
 
 
-class KeyManager:
-    """
-    Gestor de claves de API para Google Gemini.
-
-    Permite la rotación automática de claves cuando se agota la cuota
-    de una de ellas.
-    """
-
-    def __init__(self):
-        """
-        Inicializa el gestor cargando las claves desde variables de entorno.
-
-        Busca GEMINI_API_KEY_1, _2, _3, o una clave única GEMINI_API_KEY.
-        Raises:
-            ValueError: Si no se encuentran claves configuradas.
-        """
-        self.keys = [
-            os.getenv("GEMINI_API_KEY_1"),
-            os.getenv("GEMINI_API_KEY_2"),
-            os.getenv("GEMINI_API_KEY_3")
-        ]
-        # Filtrar claves vacías o None
-        self.keys = [k for k in self.keys if k]
-
-        if not self.keys:
-            if os.getenv("GEMINI_API_KEY"):
-                self.keys = [os.getenv("GEMINI_API_KEY")]
-            else:
-                raise ValueError("No hay API Keys configuradas.")
-
-        self.current_index = 0
-
-    def get_current_key(self) -> str:
-        """Devuelve la clave API actual."""
-        return self.keys[self.current_index]
-
-    def switch_key(self) -> str:
-        """
-        Cambia a la siguiente clave API disponible de forma circular.
-
-        Returns:
-            str: La nueva clave API activa.
-        """
-        prev = self.current_index
-        self.current_index = (self.current_index + 1) % len(self.keys)
-        print(f"Rotando API Key: {prev + 1} -> {self.current_index + 1}")
-        return self.get_current_key()
-
-
-# Inicialización global del gestor de claves
-key_manager = KeyManager()
-genai.configure(api_key=key_manager.get_current_key())
+# Llaves del Analisis de WhatsApp (GEMINI_API_KEY_1..3)
+llaves = PoolLlaves(
+    "Analisis",
+    ["GEMINI_API_KEY_1", "GEMINI_API_KEY_2", "GEMINI_API_KEY_3"]
+)
 
 # --- CONFIGURACIÓN OPTIMIZADA ---
-# Tamaño del lote para procesamiento. 100 equilibra velocidad y contexto.
-BATCH_SIZE = 100
+# Los lotes se arman por tokens estimados, no por número de mensajes:
+# 100 mensajes cortos y 100 mensajes largos cuestan muy distinto.
+# Presupuesto inicial de tokens de entrada por lote.
+BATCH_TOKEN_BUDGET = int(os.getenv("ANALISIS_TOKENS_POR_LOTE", "4000"))
+# Límites entre los que se ajusta el presupuesto en tiempo de ejecución.
+MIN_BATCH_TOKEN_BUDGET = 500
+MAX_BATCH_TOKEN_BUDGET = int(
+    os.getenv("ANALISIS_TOKENS_POR_LOTE_MAX", "16000")
+)
+# Tope de mensajes por lote, aunque quepan en el presupuesto.
+MAX_BATCH_MESSAGES = 300
+# Tokens máximos de la respuesta del modelo.
+MAX_OUTPUT_TOKENS = 8192
+# Si la respuesta usa menos de esta fracción del máximo, el lote
+# siguiente puede ser más grande.
+GROWTH_THRESHOLD = 0.25
+GROWTH_FACTOR = 1.25
+
+# Número máximo de lotes enviados al modelo de forma simultánea.
+# Se mantiene bajo para no agotar la cuota por minuto de cada clave.
+MAX_CONCURRENT_BATCHES = int(os.getenv("ANALISIS_LOTES_CONCURRENTES", "4"))
 
 AVAILABLE_MODELS = [
     'gemini-2.5-flash-lite',
@@ -83,29 +61,168 @@ SAFETY_SETTINGS = [
     {"category": "HARM_CATEGORY_DANGEROUS_CONTENT", "threshold": "BLOCK_NONE"},
 ]
 
+# Cliente asíncrono compartido: limita las llamadas simultáneas al modelo
+# junto con el Chatbot y se encarga del cambio de modelo y de llave.
+cliente_ia = ClienteIA(crear_backend(), AVAILABLE_MODELS, llaves)
+
+
+def _message_line(local_id: int, message: Dict[str, Any]) -> str:
+    """Formatea un mensaje tal como se envía al modelo."""
+    return f"[{local_id}] {message['author']}: {message['message']}"
+
+
+class AdaptiveBatcher:
+    """
+    Arma lotes de mensajes según un presupuesto de tokens ajustable.
+
+    - Empaqueta mensajes hasta llenar el presupuesto de tokens.
+    - Reduce el presupuesto a la mitad si el modelo corta la respuesta.
+    - Lo aumenta cuando las respuestas vuelven muy por debajo del máximo.
+
+    También acumula las estadísticas de la ejecución (lotes, divisiones,
+    tokens de entrada/salida) para poder ajustar costo y latencia.
+    """
+
+    def __init__(self, token_budget: int = BATCH_TOKEN_BUDGET):
+        """
+        Inicializa el armador de lotes.
+
+        Args:
+            token_budget (int): Presupuesto inicial de tokens por lote.
+        """
+        self.token_budget = token_budget
+        # Los lotes se responden desde varios hilos a la vez
+        self._lock = threading.Lock()
+        self.stats = {
+            "lotes": 0,
+            "divisiones": 0,
+            "tokens_entrada": 0,
+            "tokens_salida": 0,
+            "presupuesto_tokens": token_budget
+        }
+
+    def batches(self, clean_messages: List[Dict[str, Any]], start: int = 0):
+        """
+        Genera lotes de forma perezosa a partir de una posición.
+
+        Cada lote se arma con el presupuesto vigente en ese momento, por
+        lo que los ajustes se aplican a los lotes que aún no se envían.
+
+        Args:
+            clean_messages (List[Dict]): Mensajes preparados.
+            start (int): Posición del primer mensaje a incluir.
+
+        Yields:
+            tuple: (posición_final, lote). posición_final es el índice del
+            primer mensaje que NO entra en el lote.
+        """
+        position = start
+        while position < len(clean_messages):
+            budget = self.token_budget
+            batch = []
+            used = 0
+            while (position < len(clean_messages)
+                   and len(batch) < MAX_BATCH_MESSAGES):
+                msg = clean_messages[position]
+                cost = estimar_tokens(_message_line(len(batch), msg))
+                # Un lote siempre lleva al menos un mensaje
+                if batch and used + cost > budget:
+                    break
+                batch.append(msg)
+                used += cost
+                position += 1
+            yield position, batch
+
+    def record_response(self, tokens_in: int, tokens_out: int):
+        """Registra una respuesta completa y ajusta el presupuesto."""
+        with self._lock:
+            self.stats["lotes"] += 1
+            self.stats["tokens_entrada"] += tokens_in
+            self.stats["tokens_salida"] += tokens_out
+            if tokens_out < MAX_OUTPUT_TOKENS * GROWTH_THRESHOLD:
+                self.token_budget = min(
+                    int(self.token_budget * GROWTH_FACTOR),
+                    MAX_BATCH_TOKEN_BUDGET
+                )
+            self.stats["presupuesto_tokens"] = self.token_budget
+
+    def record_split(self):
+        """Registra un lote cortado por MAX_TOKENS y reduce el presupuesto."""
+        with self._lock:
+            self.stats["divisiones"] += 1
+            self.token_budget = max(
+                self.token_budget // 2, MIN_BATCH_TOKEN_BUDGET
+            )
+            self.stats["presupuesto_tokens"] = self.token_budget
+
+
+def _restore_message_ids(
+    reviews: List[Dict[str, Any]],
+    messages_batch: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Traduce los IDs locales del lote a los IDs de mensaje del chat.
+
+    Args:
+        reviews (List[Dict]): Reseñas con 'autor_original_id' local.
+        messages_batch (List[Dict]): Lote original (con sus 'id').
+
+    Returns:
+        List[Dict]: Copias de las reseñas con el ID del chat.
+    """
+    restored = []
+    for review in reviews:
+        review = dict(review)
+        try:
+            local_id = int(str(review.get("autor_original_id")))
+            if 0 <= local_id < len(messages_batch):
+                review["autor_original_id"] = messages_batch[local_id]['id']
+        except ValueError:
+            pass
+        restored.append(review)
+    return restored
+
 
-def analyze_batch_with_retry(
+async def analyze_batch_with_retry(
     messages_batch: List[Dict[str, Any]],
-    max_retries: int = 5
+    max_retries: int = 3,
+    batcher: Optional[AdaptiveBatcher] = None
 ) -> List[Dict[str, Any]]:
     """
     Envía un lote de mensajes a la API de Gemini con lógica de reintento.
 
-    Maneja la rotación de modelos y claves API en caso de fallos o cuotas.
+    La rotación de modelos y claves API ante fallos de cuota la maneja el
+    cliente compartido (app.cliente_ia); aquí se reintentan los errores de
+    formato de la respuesta.
+    Si la respuesta se corta por límite de tokens, el lote se divide a la
+    mitad y se analiza cada parte en lugar de descartarlo.
 
     Args:
         messages_batch (List[Dict]): Lista de mensajes a analizar.
         max_retries (int): Número máximo de intentos antes de desistir.
+        batcher (AdaptiveBatcher): Armador de lotes que recibe las
+            estadísticas de tokens y ajusta el presupuesto (opcional).
 
     Returns:
         List[Dict]: Lista de objetos JSON limpios con la información extraída.
+
+    Raises:
+        ErrorIA: Si se agotan todos los modelos y llaves.
     """
-    # Construcción del input simplificado para el modelo
+    # Construcción del input simplificado para el modelo.
+    # Se usan IDs locales al lote (0..n-1) en lugar de la posición en el
+    # chat: así el mismo lote produce el mismo texto en cualquier subida
+    # y puede reutilizarse desde el cache.
     chat_lines = [
-        f"[{m['id']}] {m['author']}: {m['message']}" for m in messages_batch
+        _message_line(j, m) for j, m in enumerate(messages_batch)
     ]
     chat_text = "\n".join(chat_lines)
 
+    batch_key = cache.clave_lote(chat_text)
+    cached = await run_in_threadpool(cache.obtener_lote, batch_key)
+    if cached is not None:
+        return _restore_message_ids(cached, messages_batch)
+
     # Prompt con formato COMPRIMIDO para ahorrar tokens.
     # Se usan dobles llaves {{ }} para escapar el JSON en el f-string.
     prompt = f"""
@@ -130,31 +247,53 @@ def analyze_batch_with_retry(
     ]
     """
 
-    model_index = 0
+    generation_config = {
+        "response_mime_type": "application/json",
+        "max_output_tokens": MAX_OUTPUT_TOKENS,
+        "temperature": 0.0
+    }
 
-    for attempt in range(max_retries):
+    for _ in range(max_retries):
         try:
-            current_model_name = AVAILABLE_MODELS[model_index]
-            current_model = genai.GenerativeModel(current_model_name)
-
-            # Llamada a la API
-            response = current_model.generate_content(
+            # Llamada a la API (el cliente maneja cuota, modelos y llaves)
+            response = await cliente_ia.generar(
                 prompt,
-                generation_config={
-                    "response_mime_type": "application/json",
-                    "max_output_tokens": 8192,
-                    "temperature": 0.0
-                },
+                generation_config=generation_config,
                 safety_settings=SAFETY_SETTINGS
             )
 
             # --- DIAGNÓSTICO DE CORTE ---
             # Verificar si la respuesta se cortó por límite de tokens
-            if hasattr(response.candidates[0], 'finish_reason'):
-                reason = response.candidates[0].finish_reason
-                if reason == 2:  # MAX_TOKENS
-                    # Excepción manual para activar la lógica de reintento
-                    raise exceptions.ResourceExhausted("Corte por Max Tokens")
+            if response.finish_reason == 2:  # MAX_TOKENS
+                if len(messages_batch) == 1:
+                    # Un solo mensaje no se puede dividir
+                    print("Corte por Max Tokens en un solo mensaje.")
+                    return []
+
+                # Dividir el lote a la mitad en vez de descartarlo
+                half = len(messages_batch) // 2
+                print(
+                    f"Corte por Max Tokens: dividiendo lote de "
+                    f"{len(messages_batch)} mensajes."
+                )
+                if batcher:
+                    batcher.record_split()
+                first, second = await asyncio.gather(
+                    analyze_batch_with_retry(
+                        messages_batch[:half], max_retries, batcher
+                    ),
+                    analyze_batch_with_retry(
+                        messages_batch[half:], max_retries, batcher
+                    )
+                )
+                return first + second
+
+            if batcher:
+                tokens_in = response.tokens_entrada or estimar_tokens(prompt)
+                tokens_out = response.tokens_salida or (
+                    estimar_tokens(response.text)
+                )
+                batcher.record_response(tokens_in, tokens_out)
 
             raw_text = response.text
             # Limpieza básica de markdown
@@ -167,6 +306,7 @@ def analyze_batch_with_retry(
                 clean_text = match.group(0)
 
             if not clean_text or clean_text == "[]":
+                await run_in_threadpool(cache.guardar_lote, batch_key, [])
                 return []
 
             data = json.loads(clean_text)
@@ -217,100 +357,196 @@ def analyze_batch_with_retry(
 
                 data_clean.append(obj_final)
 
-            return data_clean
-
-        except (exceptions.ResourceExhausted,
-                exceptions.ServiceUnavailable) as e:
-            err_msg = str(e)
-            tipo_err = "CORTE" if "Corte" in err_msg else "CUOTA AGOTADA"
-
-            print(f"Fallo en {AVAILABLE_MODELS[model_index]}: {tipo_err}")
-
-            # Lógica de fallback: Cambiar modelo -> Fallan todos -> Rotar Key
-            if model_index < len(AVAILABLE_MODELS) - 1:
-                model_index += 1
-                print(f"Cambiando a: {AVAILABLE_MODELS[model_index]}")
-                time.sleep(1)
-                continue
-            else:
-                print("Key agotada. ROTANDO API KEY...")
-                new_key = key_manager.switch_key()
-                genai.configure(api_key=new_key)
-                model_index = 0  # Reiniciar modelo con nueva key
-                time.sleep(2)
-                continue
+            await run_in_threadpool(cache.guardar_lote, batch_key, data_clean)
+            return _restore_message_ids(data_clean, messages_batch)
+
+        except ErrorIA:
+            # No se devuelve una lista vacia: el lote se contaria como
+            # analizado y sus mensajes (ya reservados) no se volverian a
+            # analizar. El trabajo termina en error y los libera.
+            print("Modelos y llaves agotados. Se detiene el analisis.")
+            raise
 
         except json.JSONDecodeError:
             print("Error JSON. Reintentando...")
-            time.sleep(1)
+            await asyncio.sleep(1)
             continue
 
         except Exception as e:
             print(f"Error General: {e}")
-            time.sleep(1)
+            await asyncio.sleep(1)
             continue
 
     return []
 
 
-def analyze_reviews(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+async def _map_in_order(fn, items, window: int):
     """
-    Función principal que orquesta el análisis de una lista de mensajes.
+    Ejecuta la corrutina fn sobre cada elemento y entrega los resultados
+    en orden.
+
+    Solo mantiene 'window' tareas en vuelo, de modo que 'items' se consume
+    de forma perezosa.
 
-    Divide los mensajes en lotes, procesa cada lote y reasocia los IDs
-    con los nombres de los autores originales.
+    Args:
+        fn (Callable): Corrutina a ejecutar.
+        items (Iterable): Elementos de entrada (puede ser un generador).
+        window (int): Máximo de tareas pendientes al mismo tiempo.
+
+    Yields:
+        Resultado de fn para cada elemento, en el orden de entrada.
+    """
+    pending = deque()
+    try:
+        for item in items:
+            pending.append(asyncio.ensure_future(fn(item)))
+            if len(pending) >= window:
+                yield await pending.popleft()
+        while pending:
+            yield await pending.popleft()
+    finally:
+        for task in pending:
+            task.cancel()
+
+
+def prepare_messages(
+    messages: List[Dict[str, Any]]
+) -> List[Dict[str, Any]]:
+    """
+    Asigna IDs temporales a los mensajes y descarta los muy cortos.
 
     Args:
         messages (List[Dict]): Lista completa de mensajes crudos.
 
     Returns:
-        List[Dict]: Lista consolidada de todas las reseñas extraídas.
+        List[Dict]: Mensajes candidatos a contener una reseña, con su 'id'.
     """
     clean_messages = []
-
-    # Preprocesamiento: asignar IDs temporales y filtrar mensajes muy cortos
     for i, msg in enumerate(messages):
         if len(msg['message']) > 10:
             msg_with_id = msg.copy()
             msg_with_id['id'] = i
             clean_messages.append(msg_with_id)
+    return clean_messages
+
+
+def reattach_authors(
+    reviews: List[Dict[str, Any]],
+    messages_by_id: Dict[int, Dict[str, Any]]
+):
+    """
+    Reemplaza el ID del mensaje de cada reseña por el nombre de su autor.
+
+    Args:
+        reviews (List[Dict]): Reseñas con 'autor_original_id' (se
+            modifican en el lugar).
+        messages_by_id (Dict[int, Dict]): Indice ID -> mensaje.
+    """
+    for review in reviews:
+        raw_id = review.get("autor_original_id", -1)
+        found_author = "Desconocido"
+
+        try:
+            msg_id = int(str(raw_id))
+            original_msg = messages_by_id.get(msg_id)
+            if original_msg:
+                found_author = original_msg["author"]
+        except ValueError:
+            found_author = str(raw_id)
+
+        review["autor_original"] = found_author
+
+        # Limpieza final: eliminar el ID temporal interno
+        if "autor_original_id" in review:
+            del review["autor_original_id"]
+
+
+async def analyze_reviews(
+    messages: List[Dict[str, Any]],
+    start_offset: int = 0,
+    on_batch_done: Optional[
+        Callable[[int, List[Dict[str, Any]]], None]
+    ] = None,
+    stats: Optional[Dict[str, Any]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Función principal que orquesta el análisis de una lista de mensajes.
+
+    Divide los mensajes en lotes por presupuesto de tokens, procesa los
+    lotes en paralelo y reasocia los IDs con los nombres de los autores
+    originales.
+
+    Args:
+        messages (List[Dict]): Lista completa de mensajes crudos.
+        start_offset (int): Número de mensajes preparados que ya fueron
+            analizados. Permite reanudar un análisis interrumpido.
+        on_batch_done (Callable): Función opcional (bloqueante) que recibe
+            (mensajes_analizados, reseñas_del_lote) en orden, cada vez
+            que un lote termina. Se usa para guardar el progreso y se
+            ejecuta en un hilo para no bloquear el event loop.
+        stats (Dict): Diccionario opcional que se actualiza con las
+            estadísticas de la ejecución (lotes, divisiones, tokens).
+
+    Returns:
+        List[Dict]: Lista consolidada de las reseñas extraídas a partir
+        de start_offset.
+
+    Raises:
+        ErrorIA: Si se agotan los modelos y llaves. Los lotes ya
+        entregados a on_batch_done conservan su progreso.
+    """
+    # Preprocesamiento: asignar IDs temporales y filtrar mensajes muy cortos
+    clean_messages = prepare_messages(messages)
+
+    # Indice ID -> mensaje, construido una sola vez para que la
+    # reasociacion de autores sea O(1) por reseña.
+    messages_by_id = {m['id']: m for m in clean_messages}
 
     all_reviews = []
     total_messages = len(clean_messages)
+    batcher = AdaptiveBatcher()
 
     print(f"--- Iniciando analisis de {total_messages} mensajes ---")
-    print(f"--- Modelo Base: {AVAILABLE_MODELS[0]} | Lote: {BATCH_SIZE} ---")
-
-    # Procesamiento por lotes
-    for i in range(0, total_messages, BATCH_SIZE):
-        batch = clean_messages[i:i + BATCH_SIZE]
-        print(f"Procesando lote {i} a {i + len(batch)}...")
-
-        batch_reviews = analyze_batch_with_retry(batch)
+    print(
+        f"--- Modelo Base: {AVAILABLE_MODELS[0]} | "
+        f"Tokens/Lote: {batcher.token_budget} | "
+        f"Concurrencia: {MAX_CONCURRENT_BATCHES} ---"
+    )
+
+    async def _analyze(item):
+        end, batch = item
+        reviews = await analyze_batch_with_retry(batch, batcher=batcher)
+        return end, batch, reviews
+
+    # Procesamiento por lotes en paralelo.
+    # Los resultados se consumen en el mismo orden de los lotes, por lo que
+    # la salida es identica a la del procesamiento secuencial.
+    results = _map_in_order(
+        _analyze,
+        batcher.batches(clean_messages, start_offset),
+        window=MAX_CONCURRENT_BATCHES
+    )
+
+    async for end, batch, batch_reviews in results:
+        print(
+            f"Lote {end - len(batch)} a {end} de {total_messages} "
+            f"completado ({len(batch_reviews)} reseñas)."
+        )
 
         # Post-procesamiento: Recuperar el nombre del autor original
-        for review in batch_reviews:
-            raw_id = review.get("autor_original_id", -1)
-            found_author = "Desconocido"
-
-            try:
-                msg_id = int(str(raw_id))
-                # Búsqueda eficiente del mensaje original por ID
-                original_msg = next(
-                    (m for m in clean_messages if m['id'] == msg_id), None
-                )
-                if original_msg:
-                    found_author = original_msg["author"]
-            except ValueError:
-                found_author = str(raw_id)
+        reattach_authors(batch_reviews, messages_by_id)
+
+        all_reviews.extend(batch_reviews)
 
-            review["autor_original"] = found_author
+        if stats is not None:
+            stats.update(batcher.stats)
 
-            # Limpieza final: eliminar el ID temporal interno
-            if "autor_original_id" in review:
-                del review["autor_original_id"]
+        if on_batch_done:
+            await run_in_threadpool(on_batch_done, end, batch_reviews)
 
-            all_reviews.append(review)
+    if stats is not None:
+        stats.update(batcher.stats)
 
     print(f"--- Analisis finalizado. Reseñas: {len(all_reviews)} ---")
+    print(f"--- Estadisticas: {batcher.stats} ---")
     return all_reviews
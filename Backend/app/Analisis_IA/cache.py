@@ -0,0 +1,272 @@
+import hashlib
+import json
+import os
+import threading
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy import insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.Analisis_IA import modelos
+from app.database import SessionLocal
+
+# Version del prompt de extraccion. Cambiarla invalida todo el cache,
+# ya que las respuestas anteriores dejan de ser equivalentes.
+PROMPT_VERSION = "v1"
+
+# Numero maximo de lotes guardados. Al superarlo se expulsan los que
+# llevan mas tiempo sin usarse (LRU).
+CACHE_MAX_ENTRADAS = int(os.getenv("ANALISIS_CACHE_MAX_ENTRADAS", "5000"))
+
+# Las consultas IN se dividen en bloques para no generar sentencias
+# demasiado grandes con chats de decenas de miles de mensajes.
+TAMANO_BLOQUE_IN = 1000
+
+# Contadores de uso del cache (compartidos entre hilos)
+_lock = threading.Lock()
+estadisticas = {"hits": 0, "misses": 0, "expulsiones": 0}
+
+
+def _contar(evento: str, cantidad: int = 1):
+    """Incrementa un contador de estadisticas de forma segura."""
+    with _lock:
+        estadisticas[evento] += cantidad
+
+
+# ==========================================
+# CACHE DE LOTES
+# ==========================================
+
+def clave_lote(texto_lote: str) -> str:
+    """
+    Calcula la clave de cache de un lote.
+
+    Args:
+        texto_lote (str): Texto normalizado del lote tal como se envia
+            al modelo.
+
+    Returns:
+        str: Hash SHA-256 en hexadecimal.
+    """
+    contenido = f"{PROMPT_VERSION}\n{texto_lote}"
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def obtener_lote(clave: str) -> Optional[List[Dict[str, Any]]]:
+    """
+    Busca el resultado de un lote en el cache.
+
+    Args:
+        clave (str): Clave calculada con clave_lote.
+
+    Returns:
+        List[Dict] | None: Reseñas guardadas, o None si no hay acierto.
+    """
+    db = SessionLocal()
+    try:
+        entrada = db.query(modelos.CacheLoteIA).filter(
+            modelos.CacheLoteIA.clave == clave
+        ).first()
+
+        if not entrada:
+            _contar("misses")
+            return None
+
+        entrada.ultimo_uso = datetime.utcnow()
+        db.commit()
+        _contar("hits")
+        return json.loads(entrada.resultado_json)
+    except Exception as e:
+        print(f"Error leyendo cache de lotes: {e}")
+        db.rollback()
+        return None
+    finally:
+        db.close()
+
+
+def guardar_lote(clave: str, resultado: List[Dict[str, Any]]):
+    """
+    Guarda el resultado de un lote y aplica la expulsion LRU.
+
+    Args:
+        clave (str): Clave calculada con clave_lote.
+        resultado (List[Dict]): Reseñas limpias devueltas por el modelo.
+    """
+    db = SessionLocal()
+    try:
+        db.add(modelos.CacheLoteIA(
+            clave=clave,
+            resultado_json=json.dumps(resultado, ensure_ascii=False)
+        ))
+        db.commit()
+        _expulsar_excedentes(db)
+    except IntegrityError:
+        # Otro hilo guardo el mismo lote al mismo tiempo
+        db.rollback()
+    except Exception as e:
+        print(f"Error guardando cache de lotes: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+
+def _expulsar_excedentes(db: Session):
+    """Elimina las entradas menos usadas si se supera el limite."""
+    total = db.query(modelos.CacheLoteIA).count()
+    excedente = total - CACHE_MAX_ENTRADAS
+    if excedente <= 0:
+        return
+
+    claves = [
+        fila.clave for fila in db.query(modelos.CacheLoteIA.clave).order_by(
+            modelos.CacheLoteIA.ultimo_uso.asc()
+        ).limit(excedente)
+    ]
+    db.query(modelos.CacheLoteIA).filter(
+        modelos.CacheLoteIA.clave.in_(claves)
+    ).delete(synchronize_session=False)
+    db.commit()
+    _contar("expulsiones", len(claves))
+
+
+def obtener_estadisticas(db: Session) -> Dict[str, Any]:
+    """
+    Devuelve los contadores del cache y su ocupacion actual.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+
+    Returns:
+        dict: hits, misses, expulsiones, tasa de acierto y entradas.
+    """
+    with _lock:
+        datos = dict(estadisticas)
+
+    consultas = datos["hits"] + datos["misses"]
+    datos["tasa_acierto"] = (
+        round(datos["hits"] / consultas, 3) if consultas else 0.0
+    )
+    datos["entradas"] = db.query(modelos.CacheLoteIA).count()
+    datos["max_entradas"] = CACHE_MAX_ENTRADAS
+    return datos
+
+
+# ==========================================
+# DEDUPLICACION DE MENSAJES ENTRE SUBIDAS
+# ==========================================
+
+def huella_mensaje(mensaje: Dict[str, str]) -> str:
+    """Calcula la huella de un mensaje por (fecha/hora, autor, texto)."""
+    contenido = (
+        f"{mensaje['timestamp']}\x1f{mensaje['author']}\x1f"
+        f"{mensaje['message']}"
+    )
+    return hashlib.sha256(contenido.encode("utf-8")).hexdigest()
+
+
+def _huellas_existentes(db: Session, huellas: List[str]) -> set:
+    """Consulta por bloques que huellas ya estan registradas."""
+    existentes = set()
+    for i in range(0, len(huellas), TAMANO_BLOQUE_IN):
+        bloque = huellas[i:i + TAMANO_BLOQUE_IN]
+        filas = db.query(modelos.MensajeProcesado.huella).filter(
+            modelos.MensajeProcesado.huella.in_(bloque)
+        ).all()
+        existentes.update(fila.huella for fila in filas)
+    return existentes
+
+
+def reservar_mensajes_nuevos(
+    db: Session, mensajes: List[Dict[str, str]]
+) -> List[Dict[str, str]]:
+    """
+    Descarta los mensajes repetidos o ya analizados y reserva el resto.
+
+    Las huellas de los mensajes nuevos se registran al encolar el
+    trabajo (no al terminarlo), de modo que dos subidas simultaneas o
+    solapadas no analizan los mismos mensajes. No hace commit: la
+    reserva se confirma junto con los mensajes del trabajo.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        mensajes (List[Dict]): Mensajes parseados (un bloque del chat).
+
+    Returns:
+        List[Dict]: Solo los mensajes reservados, en su orden original.
+    """
+    huellas = [huella_mensaje(m) for m in mensajes]
+    unicas = list(dict.fromkeys(huellas))
+    existentes = _huellas_existentes(db, unicas)
+    candidatas = [h for h in unicas if h not in existentes]
+
+    reservadas = set()
+    if candidatas:
+        try:
+            with db.begin_nested():
+                db.execute(insert(modelos.MensajeProcesado), [
+                    {"huella": h} for h in candidatas
+                ])
+            reservadas.update(candidatas)
+        except IntegrityError:
+            # Otra subida reservo algunas al mismo tiempo: se reservan
+            # una por una las que sigan libres
+            for huella in candidatas:
+                try:
+                    with db.begin_nested():
+                        db.execute(insert(modelos.MensajeProcesado), [
+                            {"huella": huella}
+                        ])
+                    reservadas.add(huella)
+                except IntegrityError:
+                    pass
+
+    nuevos = []
+    for mensaje, huella in zip(mensajes, huellas):
+        if huella in reservadas:
+            # Solo la primera aparicion dentro del bloque
+            reservadas.discard(huella)
+            nuevos.append(mensaje)
+    return nuevos
+
+
+def liberar_mensajes(db: Session, mensajes: List[Dict[str, str]]):
+    """
+    Quita la reserva de mensajes cuyo trabajo fallo o se cancelo, para
+    que una nueva subida los analice.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        mensajes (List[Dict]): Mensajes del trabajo.
+    """
+    huellas = list({huella_mensaje(m) for m in mensajes})
+    for i in range(0, len(huellas), TAMANO_BLOQUE_IN):
+        db.query(modelos.MensajeProcesado).filter(
+            modelos.MensajeProcesado.huella.in_(
+                huellas[i:i + TAMANO_BLOQUE_IN]
+            )
+        ).delete(synchronize_session=False)
+    db.commit()
+
+
+def marcar_mensajes_procesados(db: Session, mensajes: List[Dict[str, str]]):
+    """
+    Registra las huellas de los mensajes de un chat ya analizado.
+
+    Solo para trabajos creados antes de reservar_mensajes_nuevos, cuyos
+    mensajes no se reservaron al encolarlos.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        mensajes (List[Dict]): Mensajes analizados.
+    """
+    huellas = list({huella_mensaje(m) for m in mensajes})
+    existentes = _huellas_existentes(db, huellas)
+
+    nuevas = [
+        modelos.MensajeProcesado(huella=h)
+        for h in huellas if h not in existentes
+    ]
+    db.add_all(nuevas)
+    db.commit()
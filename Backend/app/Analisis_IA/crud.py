@@ -0,0 +1,401 @@
+import json
+from typing import Any, Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, insert
+from sqlalchemy.orm import Session
+
+from app.Analisis_IA import cache, modelos
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.Creacion_mats_prof import esquemas as esquemas_catalogos
+from app.Estadistica import actividad
+from app.Estadistica.contadores import contadores
+from app.Reviews import crud as crud_reviews
+
+# Materia generica a la que se asignan las reseñas extraidas del chat,
+# ya que el chat no especifica la materia exacta.
+MATERIA_GENERICA = "General"
+
+# ID de usuario sistema para atribuir la creación de las reseñas
+SYSTEM_USER_ID = 1
+
+
+# --- GESTION DE TRABAJOS ---
+
+def create_trabajo(
+    db: Session,
+    admin_email: str,
+    nombre_archivo: str
+) -> modelos.TrabajoAnalisis:
+    """
+    Registra un nuevo trabajo en estado 'recibiendo'.
+
+    Los mensajes se agregan despues con agregar_mensajes_trabajo y el
+    trabajo pasa a la cola con activar_trabajo.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        admin_email (str): Correo del administrador que subio el chat.
+        nombre_archivo (str): Nombre del archivo original.
+
+    Returns:
+        TrabajoAnalisis: El trabajo creado.
+    """
+    trabajo = modelos.TrabajoAnalisis(
+        estado="recibiendo",
+        admin_email=admin_email,
+        nombre_archivo=nombre_archivo,
+        mensajes_json=""
+    )
+    db.add(trabajo)
+    db.commit()
+    db.refresh(trabajo)
+    return trabajo
+
+
+def agregar_mensajes_trabajo(
+    db: Session,
+    trabajo_id: int,
+    mensajes: List[Dict[str, str]],
+    posicion: int
+):
+    """
+    Guarda un bloque de mensajes del chat con un solo INSERT multiple.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        trabajo_id (int): Trabajo al que pertenecen.
+        mensajes (List[Dict]): Mensajes parseados del bloque.
+        posicion (int): Posicion del primer mensaje dentro del chat.
+    """
+    if not mensajes:
+        return
+    db.execute(insert(modelos.MensajeTrabajo), [
+        {
+            "trabajo_id": trabajo_id,
+            "posicion": posicion + i,
+            "timestamp": m["timestamp"],
+            "author": m["author"],
+            "message": m["message"],
+        }
+        for i, m in enumerate(mensajes)
+    ])
+    db.commit()
+
+
+def activar_trabajo(db: Session, trabajo_id: int, total_mensajes: int):
+    """
+    Marca como 'pendiente' un trabajo cuyos mensajes ya se guardaron.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        trabajo_id (int): ID del trabajo.
+        total_mensajes (int): Mensajes que se enviaran a la IA.
+    """
+    trabajo = get_trabajo(db, trabajo_id)
+    trabajo.estado = "pendiente"
+    trabajo.total_mensajes = total_mensajes
+    db.commit()
+
+
+def liberar_mensajes_trabajo(db: Session, trabajo_id: int):
+    """
+    Quita la reserva de los mensajes de un trabajo que no se completo,
+    para que una nueva subida los vuelva a analizar.
+    """
+    trabajo = get_trabajo(db, trabajo_id)
+    # Los trabajos antiguos (mensajes_json) no reservaban sus mensajes
+    if trabajo and not trabajo.mensajes_json:
+        cache.liberar_mensajes(db, get_mensajes_trabajo(db, trabajo))
+
+
+def eliminar_trabajo(db: Session, trabajo_id: int):
+    """Elimina un trabajo y sus mensajes (subida vacia o fallida)."""
+    db.rollback()
+    liberar_mensajes_trabajo(db, trabajo_id)
+    db.execute(delete(modelos.MensajeTrabajo).where(
+        modelos.MensajeTrabajo.trabajo_id == trabajo_id
+    ))
+    db.execute(delete(modelos.ResenasLote).where(
+        modelos.ResenasLote.trabajo_id == trabajo_id
+    ))
+    db.execute(delete(modelos.TrabajoAnalisis).where(
+        modelos.TrabajoAnalisis.id == trabajo_id
+    ))
+    db.commit()
+
+
+def eliminar_subidas_interrumpidas(db: Session):
+    """
+    Elimina los trabajos que quedaron en 'recibiendo' (el servidor se
+    detuvo mientras se subia el archivo). Se llama al iniciar.
+    """
+    ids = [
+        fila.id for fila in db.query(modelos.TrabajoAnalisis.id).filter(
+            modelos.TrabajoAnalisis.estado == "recibiendo"
+        )
+    ]
+    for trabajo_id in ids:
+        eliminar_trabajo(db, trabajo_id)
+
+
+def get_mensajes_trabajo(
+    db: Session, trabajo: modelos.TrabajoAnalisis
+) -> List[Dict[str, str]]:
+    """
+    Obtiene los mensajes de un trabajo en el orden del chat.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        trabajo (TrabajoAnalisis): Trabajo a procesar.
+
+    Returns:
+        List[Dict]: Mensajes con 'timestamp', 'author' y 'message'.
+    """
+    # Trabajos creados antes de la tabla 'mensajes_trabajo'
+    if trabajo.mensajes_json:
+        return json.loads(trabajo.mensajes_json)
+
+    filas = db.query(
+        modelos.MensajeTrabajo.timestamp,
+        modelos.MensajeTrabajo.author,
+        modelos.MensajeTrabajo.message
+    ).filter(
+        modelos.MensajeTrabajo.trabajo_id == trabajo.id
+    ).order_by(modelos.MensajeTrabajo.posicion).all()
+    return [
+        {"timestamp": f.timestamp, "author": f.author, "message": f.message}
+        for f in filas
+    ]
+
+
+def get_trabajo(
+    db: Session, trabajo_id: int
+) -> Optional[modelos.TrabajoAnalisis]:
+    """Obtiene un trabajo de analisis por su ID."""
+    return db.query(modelos.TrabajoAnalisis).filter(
+        modelos.TrabajoAnalisis.id == trabajo_id
+    ).first()
+
+
+def get_trabajos_inconclusos(db: Session) -> List[modelos.TrabajoAnalisis]:
+    """
+    Obtiene los trabajos que no terminaron (pendientes o interrumpidos).
+
+    Se usa al iniciar la aplicacion para reanudarlos.
+    """
+    return db.query(modelos.TrabajoAnalisis).filter(
+        modelos.TrabajoAnalisis.estado.in_(["pendiente", "procesando"])
+    ).order_by(modelos.TrabajoAnalisis.id).all()
+
+
+def registrar_lote(
+    db: Session,
+    trabajo: modelos.TrabajoAnalisis,
+    mensajes_analizados: int,
+    resenas_lote: List[Dict[str, Any]],
+    estadisticas: Dict[str, Any]
+):
+    """
+    Guarda el resultado de un lote y avanza el progreso del trabajo.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        trabajo (TrabajoAnalisis): Trabajo en curso.
+        mensajes_analizados (int): Mensajes analizados hasta este lote
+            (inclusive); es el punto desde el que se reanudaria.
+        resenas_lote (List[Dict]): Reseñas extraidas de ese lote.
+        estadisticas (Dict): Estadisticas acumuladas del analisis.
+    """
+    # Solo se agrega la fila del lote; las reseñas anteriores no se tocan
+    if resenas_lote:
+        db.add(modelos.ResenasLote(
+            trabajo_id=trabajo.id,
+            lote=trabajo.lotes_completados,
+            resenas_json=json.dumps(resenas_lote, ensure_ascii=False)
+        ))
+    trabajo.resenas_encontradas += len(resenas_lote)
+    trabajo.mensajes_analizados = mensajes_analizados
+    trabajo.lotes_completados += 1
+    trabajo.estadisticas_json = json.dumps(estadisticas)
+    db.commit()
+
+
+def get_resenas_trabajo(
+    db: Session, trabajo: modelos.TrabajoAnalisis
+) -> List[Dict[str, Any]]:
+    """
+    Obtiene las reseñas extraidas de un trabajo, en el orden de sus lotes.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        trabajo (TrabajoAnalisis): Trabajo del que se leen las reseñas.
+
+    Returns:
+        List[Dict]: Reseñas tal como las devolvio el analyzer.
+    """
+    # Trabajos creados antes de la tabla 'resenas_lote' (si se reanudan,
+    # sus lotes nuevos se agregan despues de estas)
+    resenas = json.loads(trabajo.resenas_json or "[]")
+
+    filas = db.query(modelos.ResenasLote.resenas_json).filter(
+        modelos.ResenasLote.trabajo_id == trabajo.id
+    ).order_by(modelos.ResenasLote.lote).all()
+    for fila in filas:
+        resenas.extend(json.loads(fila.resenas_json))
+    return resenas
+
+
+def _normalizar_resena(review_data: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Valida y normaliza una reseña extraida por la IA.
+
+    Args:
+        review_data (Dict): Reseña tal como la devuelve el analyzer.
+
+    Returns:
+        Dict: nombre del profesor, comentario final, calificacion y
+        dificultad listos para insertar.
+
+    Raises:
+        ValueError: Si la reseña no trae nombre de profesor.
+    """
+    nombre_profe = (review_data.get('profesor_nombre') or '').strip()
+    if not nombre_profe:
+        raise ValueError("La reseña no tiene nombre de profesor")
+
+    # Se anexa la fuente original al comentario para trazabilidad.
+    fuente = review_data.get('autor_original', 'Desconocido')
+    texto_final = (
+        f"{review_data.get('comentario', '')}\n"
+        f"(Fuente: Chat WhatsApp - {fuente})"
+    )
+
+    # Normalización y seguridad de la calificación
+    try:
+        calif_final = float(review_data.get('calificacion', 5))
+        if calif_final > 10:
+            calif_final = 10.0
+    except (ValueError, TypeError):
+        calif_final = 5.0
+
+    # Normalización de la dificultad
+    try:
+        dificultad_val = int(review_data.get('dificultad', 5))
+    except (ValueError, TypeError):
+        dificultad_val = 5
+
+    return {
+        "profesor_nombre": nombre_profe,
+        "comentario": texto_final,
+        "calificacion": calif_final,
+        "dificultad": dificultad_val
+    }
+
+
+def guardar_resenas_extraidas(
+    db: Session, extracted_reviews: List[Dict[str, Any]]
+) -> Tuple[int, int, List[Dict[str, Any]]]:
+    """
+    Guarda en la BD las reseñas extraidas por la IA en una sola transaccion.
+
+    1. Verifica o crea la materia 'General'.
+    2. Resuelve todos los profesores con una consulta y crea los
+       faltantes con un solo INSERT multiple.
+    3. Inserta todas las reseñas con un solo executemany.
+
+    Si el INSERT masivo falla, se reintenta fila por fila (con savepoints)
+    para identificar exactamente que reseñas son invalidas.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        extracted_reviews (List[Dict]): Reseñas normalizadas por el analyzer.
+
+    Returns:
+        tuple: (reseñas_guardadas, profesores_nuevos, errores), donde
+        errores es una lista de {"indice", "profesor", "error"}.
+    """
+    errores = []
+    normalizadas = []
+
+    print("--- Guardando en Base de Datos ---")
+
+    for indice, review_data in enumerate(extracted_reviews):
+        try:
+            normalizadas.append((indice, _normalizar_resena(review_data)))
+        except ValueError as e:
+            errores.append({
+                "indice": indice,
+                "profesor": review_data.get('profesor_nombre'),
+                "error": str(e)
+            })
+
+    if not normalizadas:
+        return 0, 0, errores
+
+    # --- GESTION DE MATERIA ---
+    materia_db = crud_catalogos.get_materia_by_name(db, MATERIA_GENERICA)
+
+    if not materia_db:
+        print(f"Creando materia automatica '{MATERIA_GENERICA}'...")
+        nueva_mat = esquemas_catalogos.MateriaCreate(nombre=MATERIA_GENERICA)
+        materia_db = crud_catalogos.create_materia(db, nueva_mat)
+
+    materia_id_final = materia_db.id
+
+    def _resolver_profesores():
+        return crud_catalogos.get_or_create_profesores_bulk(
+            db, (r["profesor_nombre"] for _, r in normalizadas)
+        )
+
+    def _fila(datos, profesores):
+        return {
+            "comentario": datos["comentario"],
+            "calificacion": datos["calificacion"],
+            "dificultad": datos["dificultad"],
+            "profesor_id": profesores[datos["profesor_nombre"].lower()].id,
+            "materia_id": materia_id_final,
+            "user_id": SYSTEM_USER_ID
+        }
+
+    # --- CAMINO RAPIDO: TODO EN UNA TRANSACCION ---
+    try:
+        profesores, profesores_nuevos = _resolver_profesores()
+        filas = [_fila(datos, profesores) for _, datos in normalizadas]
+        guardadas = crud_reviews.bulk_create_resenas(db, filas)
+        db.commit()
+        contadores.incrementar("resenas", guardadas)
+        contadores.incrementar("profesores", profesores_nuevos)
+        actividad.feed.invalidar()
+        print(
+            f"Guardadas {guardadas} reseñas "
+            f"({profesores_nuevos} profesores nuevos)."
+        )
+        return guardadas, profesores_nuevos, errores
+    except Exception as e:
+        db.rollback()
+        print(f"Fallo el guardado masivo ({e}). Reintentando fila por fila...")
+
+    # --- CAMINO LENTO: AISLAR LAS FILAS CON ERROR ---
+    profesores, profesores_nuevos = _resolver_profesores()
+    guardadas = 0
+
+    for indice, datos in normalizadas:
+        try:
+            with db.begin_nested():
+                crud_reviews.bulk_create_resenas(
+                    db, [_fila(datos, profesores)]
+                )
+            guardadas += 1
+        except Exception as e:
+            print(f"Error guardando reseña {indice}: {e}")
+            errores.append({
+                "indice": indice,
+                "profesor": datos["profesor_nombre"],
+                "error": str(e)
+            })
+
+    db.commit()
+    contadores.incrementar("resenas", guardadas)
+    contadores.incrementar("profesores", profesores_nuevos)
+    actividad.feed.invalidar()
+    return guardadas, profesores_nuevos, errores
@@ -0,0 +1,74 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from pydantic import BaseModel
+
+
+class TrabajoCreado(BaseModel):
+    """
+    Respuesta inmediata al subir un chat para su analisis.
+
+    Atributos:
+        success (bool): Indica si el trabajo fue encolado.
+        message (str): Mensaje descriptivo para el frontend.
+        job_id (Optional[int]): ID del trabajo para consultar su progreso.
+    """
+    success: bool
+    message: str
+    job_id: Optional[int] = None
+
+
+class TrabajoProgreso(BaseModel):
+    """
+    Estado y progreso de un trabajo de analisis.
+
+    Atributos:
+        id (int): ID del trabajo.
+        estado (str): 'pendiente', 'procesando', 'completado' o 'error'.
+        total_mensajes (int): Mensajes a analizar.
+        mensajes_analizados (int): Mensajes ya analizados.
+        lotes_completados (int): Lotes ya analizados.
+        resenas_encontradas (int): Reseñas extraidas hasta el momento.
+        resenas_guardadas (int): Reseñas insertadas en la BD.
+        profesores_creados (int): Profesores nuevos creados.
+        mensaje (Optional[str]): Resumen final o error.
+        estadisticas (Dict): Lotes, divisiones por corte, tokens de
+            entrada/salida y presupuesto de tokens actual.
+        creado (datetime): Fecha de creacion.
+        actualizado (Optional[datetime]): Ultima actualizacion.
+    """
+    id: int
+    estado: str
+    total_mensajes: int
+    mensajes_analizados: int
+    lotes_completados: int
+    resenas_encontradas: int
+    resenas_guardadas: int
+    profesores_creados: int
+    mensaje: Optional[str] = None
+    estadisticas: Dict[str, Any] = {}
+    creado: datetime
+    actualizado: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
+class TrabajoResultado(BaseModel):
+    """
+    Resultado final de un trabajo de analisis.
+
+    Mantiene la misma forma que la respuesta sincrona anterior para que
+    el frontend pueda reutilizar la vista de reseñas.
+
+    Atributos:
+        success (bool): True si el trabajo termino correctamente.
+        message (str): Resumen del proceso.
+        data (List[Dict]): Reseñas extraidas por la IA.
+        errores (List[Dict]): Reseñas que no se pudieron guardar, con su
+            indice dentro de 'data' y el motivo.
+    """
+    success: bool
+    message: str
+    data: List[Dict[str, Any]] = []
+    errores: List[Dict[str, Any]] = []
@@ -0,0 +1,200 @@
+import asyncio
+import json
+import os
+from typing import List
+
+from fastapi.concurrency import run_in_threadpool
+
+from app.Analisis_IA import analyzer, cache, crud
+from app.database import SessionLocal
+
+# Numero de trabajos (chats) que se procesan simultaneamente.
+# Cada trabajo ya paraleliza sus lotes, por lo que 1 suele ser suficiente.
+NUM_WORKERS = int(os.getenv("ANALISIS_WORKERS", "1"))
+
+# Cola en memoria con los IDs de trabajos pendientes. El estado real vive
+# en la tabla 'trabajos_analisis', por lo que la cola se reconstruye al
+# reiniciar el servidor.
+_cola: asyncio.Queue = None
+_workers: List[asyncio.Task] = []
+
+# Contadores del analyzer que se acumulan entre reanudaciones
+CONTADORES_ESTADISTICAS = (
+    "lotes", "divisiones", "tokens_entrada", "tokens_salida"
+)
+
+
+def _iniciar_trabajo(db, trabajo_id: int):
+    """Marca el trabajo como 'procesando' y lo devuelve (o None)."""
+    trabajo = crud.get_trabajo(db, trabajo_id)
+    if not trabajo or trabajo.estado in ("completado", "error"):
+        return None
+
+    trabajo.estado = "procesando"
+    db.commit()
+    # Se recarga aqui para no consultar la BD desde el event loop
+    db.refresh(trabajo)
+    return trabajo
+
+
+def _finalizar_trabajo(db, trabajo, mensajes: List[dict]):
+    """
+    Inserta las reseñas extraidas y marca el trabajo como completado.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        trabajo (TrabajoAnalisis): Trabajo ya analizado.
+        mensajes (List[dict]): Mensajes del chat analizado.
+    """
+    extracted_reviews = crud.get_resenas_trabajo(db, trabajo)
+
+    # Los mensajes de trabajos nuevos se reservaron al encolarlos; los
+    # de trabajos antiguos se marcan aqui para omitirlos en el futuro
+    if trabajo.mensajes_json:
+        cache.marcar_mensajes_procesados(db, mensajes)
+
+    if not extracted_reviews:
+        trabajo.estado = "completado"
+        trabajo.mensaje = "La IA analizo el chat pero no encontro reseñas."
+        db.commit()
+        return
+
+    guardadas, profesores_nuevos, errores = (
+        crud.guardar_resenas_extraidas(db, extracted_reviews)
+    )
+
+    trabajo.resenas_guardadas = guardadas
+    trabajo.profesores_creados = profesores_nuevos
+    trabajo.errores_json = json.dumps(errores, ensure_ascii=False)
+    trabajo.estado = "completado"
+    trabajo.mensaje = (
+        f"Se procesaron {len(extracted_reviews)} reseñas. "
+        f"{profesores_nuevos} profesores nuevos creados."
+    )
+    if errores:
+        trabajo.mensaje += f" {len(errores)} no se pudieron guardar."
+    db.commit()
+
+
+def _marcar_error(db, trabajo_id: int, error: Exception):
+    """
+    Deja constancia del error en el trabajo y libera sus mensajes para
+    que se analicen en una nueva subida.
+    """
+    db.rollback()
+    crud.liberar_mensajes_trabajo(db, trabajo_id)
+    trabajo = crud.get_trabajo(db, trabajo_id)
+    if trabajo:
+        trabajo.estado = "error"
+        trabajo.mensaje = f"Error procesando el chat: {error}"
+        db.commit()
+
+
+async def procesar_trabajo(trabajo_id: int):
+    """
+    Ejecuta un trabajo de analisis completo.
+
+    Reanuda desde el ultimo mensaje analizado, guarda el progreso tras
+    cada lote y al final inserta las reseñas en la base de datos.
+    Las llamadas al modelo se hacen en el event loop de la aplicacion
+    (compartiendo el limite global de app.cliente_ia); los accesos a la
+    base de datos se ejecutan en hilos para no bloquearlo.
+
+    Args:
+        trabajo_id (int): ID del trabajo a procesar.
+    """
+    db = SessionLocal()
+    try:
+        trabajo = await run_in_threadpool(_iniciar_trabajo, db, trabajo_id)
+        if not trabajo:
+            return
+
+        mensajes = await run_in_threadpool(
+            crud.get_mensajes_trabajo, db, trabajo
+        )
+
+        if trabajo.mensajes_analizados > 0:
+            print(
+                f"--- Reanudando trabajo {trabajo_id} desde el mensaje "
+                f"{trabajo.mensajes_analizados}/{trabajo.total_mensajes} ---"
+            )
+
+        # Las estadisticas de ejecuciones previas (antes de un reinicio)
+        # se suman a las de esta ejecucion.
+        previas = json.loads(trabajo.estadisticas_json or "{}")
+        stats = {}
+
+        def guardar_progreso(mensajes_analizados, resenas_lote):
+            acumuladas = dict(stats)
+            for campo in CONTADORES_ESTADISTICAS:
+                acumuladas[campo] = (
+                    previas.get(campo, 0) + stats.get(campo, 0)
+                )
+            crud.registrar_lote(
+                db, trabajo, mensajes_analizados, resenas_lote, acumuladas
+            )
+
+        await analyzer.analyze_reviews(
+            mensajes,
+            start_offset=trabajo.mensajes_analizados,
+            on_batch_done=guardar_progreso,
+            stats=stats
+        )
+
+        await run_in_threadpool(_finalizar_trabajo, db, trabajo, mensajes)
+
+    except Exception as e:
+        print(f"Error en trabajo de analisis {trabajo_id}: {e}")
+        await run_in_threadpool(_marcar_error, db, trabajo_id, e)
+    finally:
+        db.close()
+
+
+async def _worker(numero: int):
+    """Consume IDs de la cola y procesa cada trabajo."""
+    while True:
+        trabajo_id = await _cola.get()
+        try:
+            print(f"Worker {numero}: procesando trabajo {trabajo_id}")
+            await procesar_trabajo(trabajo_id)
+        finally:
+            _cola.task_done()
+
+
+async def encolar_trabajo(trabajo_id: int):
+    """Agrega un trabajo a la cola de procesamiento."""
+    await _cola.put(trabajo_id)
+
+
+async def iniciar_workers():
+    """
+    Inicia el pool de workers y reanuda los trabajos inconclusos.
+
+    Debe llamarse en el evento 'startup' de la aplicacion.
+    """
+    global _cola
+    _cola = asyncio.Queue()
+
+    for numero in range(NUM_WORKERS):
+        _workers.append(asyncio.create_task(_worker(numero + 1)))
+
+    db = SessionLocal()
+    try:
+        crud.eliminar_subidas_interrumpidas(db)
+        inconclusos = crud.get_trabajos_inconclusos(db)
+        for trabajo in inconclusos:
+            await _cola.put(trabajo.id)
+        if inconclusos:
+            print(
+                f"--- Reanudando {len(inconclusos)} trabajos de "
+                "analisis ---"
+            )
+    finally:
+        db.close()
+
+
+async def detener_workers():
+    """Cancela los workers al apagar la aplicacion."""
+    for tarea in _workers:
+        tarea.cancel()
+    _workers.clear()
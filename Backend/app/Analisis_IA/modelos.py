@@ -0,0 +1,159 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy.dialects.mysql import LONGTEXT
+
+from app.database import Base
+
+
+class TrabajoAnalisis(Base):
+    """
+    Modelo de Base de Datos para los trabajos de analisis de chats.
+
+    Cada archivo subido a /api/ia/process_reviews se convierte en un
+    trabajo que se procesa en segundo plano. El progreso se guarda lote
+    por lote para poder reanudarlo si el servidor se reinicia.
+
+    Atributos:
+        id (int): Identificador unico del trabajo.
+        estado (str): 'recibiendo' (se esta subiendo el archivo),
+            'pendiente', 'procesando', 'completado' o 'error'.
+        admin_email (str): Correo del administrador que subio el chat.
+        nombre_archivo (str): Nombre original del archivo .txt.
+        mensajes_json (str): Mensajes de trabajos anteriores a la tabla
+            'mensajes_trabajo' (JSON). Vacio en los trabajos nuevos.
+        total_mensajes (int): Mensajes candidatos a analizar.
+        mensajes_analizados (int): Mensajes ya analizados (punto de
+            reanudacion; los lotes se arman por tokens y no son fijos).
+        lotes_completados (int): Lotes ya analizados por la IA.
+        estadisticas_json (str): Lotes, divisiones y tokens usados (JSON).
+        resenas_json (str): Reseñas de trabajos anteriores a la tabla
+            'resenas_lote' (JSON). Vacio en los trabajos nuevos.
+        resenas_encontradas (int): Total de reseñas extraidas.
+        resenas_guardadas (int): Reseñas insertadas en la BD.
+        profesores_creados (int): Profesores nuevos creados.
+        errores_json (str): Reseñas que no se pudieron guardar (JSON).
+        mensaje (str): Resumen final o descripcion del error.
+        creado (datetime): Fecha de creacion (UTC).
+        actualizado (datetime): Fecha de la ultima actualizacion (UTC).
+    """
+    __tablename__ = "trabajos_analisis"
+
+    id = Column(Integer, primary_key=True, index=True)
+    estado = Column(String(20), default="pendiente", nullable=False)
+    admin_email = Column(String(100), nullable=True)
+    nombre_archivo = Column(String(255), nullable=True)
+
+    # Solo trabajos antiguos: los mensajes nuevos se guardan por bloques
+    # en 'mensajes_trabajo' mientras se sube el archivo
+    mensajes_json = Column(LONGTEXT, nullable=False, default="")
+
+    total_mensajes = Column(Integer, default=0, nullable=False)
+    mensajes_analizados = Column(Integer, default=0, nullable=False)
+    lotes_completados = Column(Integer, default=0, nullable=False)
+    estadisticas_json = Column(Text, nullable=True)
+
+    # Solo trabajos antiguos: las reseñas nuevas se guardan por lote en
+    # 'resenas_lote'
+    resenas_json = Column(LONGTEXT, nullable=True)
+    resenas_encontradas = Column(Integer, default=0, nullable=False)
+    resenas_guardadas = Column(Integer, default=0, nullable=False)
+    profesores_creados = Column(Integer, default=0, nullable=False)
+    errores_json = Column(Text, nullable=True)
+
+    mensaje = Column(Text, nullable=True)
+    creado = Column(DateTime, default=datetime.utcnow)
+    actualizado = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
+
+
+class MensajeTrabajo(Base):
+    """
+    Mensaje de un chat subido, pendiente de analizar por su trabajo.
+
+    Los mensajes se insertan por bloques conforme se lee el archivo, de
+    modo que la subida no necesita el chat completo en memoria.
+
+    Atributos:
+        id (int): Identificador unico del mensaje.
+        trabajo_id (int): Trabajo al que pertenece.
+        posicion (int): Orden del mensaje dentro del chat.
+        timestamp (str): Fecha y hora del mensaje, como en el chat.
+        author (str): Autor del mensaje.
+        message (str): Texto del mensaje.
+    """
+    __tablename__ = "mensajes_trabajo"
+
+    id = Column(Integer, primary_key=True, index=True)
+    trabajo_id = Column(
+        Integer, ForeignKey("trabajos_analisis.id"), index=True,
+        nullable=False
+    )
+    posicion = Column(Integer, nullable=False)
+    timestamp = Column(String(40), nullable=False)
+    author = Column(String(255), nullable=False)
+    message = Column(Text, nullable=False)
+
+
+class ResenasLote(Base):
+    """
+    Reseñas extraidas de un lote ya analizado de un trabajo.
+
+    Cada lote agrega su propia fila, de modo que registrar un lote no
+    vuelve a leer ni a escribir las reseñas de los lotes anteriores.
+
+    Atributos:
+        id (int): Identificador unico de la fila.
+        trabajo_id (int): Trabajo al que pertenece.
+        lote (int): Orden del lote dentro del trabajo.
+        resenas_json (str): Reseñas extraidas del lote (JSON).
+    """
+    __tablename__ = "resenas_lote"
+
+    id = Column(Integer, primary_key=True, index=True)
+    trabajo_id = Column(
+        Integer, ForeignKey("trabajos_analisis.id"), index=True,
+        nullable=False
+    )
+    lote = Column(Integer, nullable=False)
+    resenas_json = Column(LONGTEXT, nullable=False)
+
+
+class CacheLoteIA(Base):
+    """
+    Cache persistente de las respuestas de la IA por lote de mensajes.
+
+    La clave es un hash del texto normalizado del lote (y de la version
+    del prompt), de modo que volver a subir un chat con lotes identicos
+    no vuelve a consultar al modelo.
+
+    Atributos:
+        clave (str): SHA-256 del lote normalizado + version del prompt.
+        resultado_json (str): Reseñas limpias devueltas por el modelo (JSON).
+        ultimo_uso (datetime): Ultimo acierto; se usa para la expulsion LRU.
+        creado (datetime): Fecha de creacion (UTC).
+    """
+    __tablename__ = "cache_lotes_ia"
+
+    clave = Column(String(64), primary_key=True)
+    resultado_json = Column(LONGTEXT, nullable=False)
+    ultimo_uso = Column(DateTime, default=datetime.utcnow, index=True)
+    creado = Column(DateTime, default=datetime.utcnow)
+
+
+class MensajeProcesado(Base):
+    """
+    Huella de cada mensaje de WhatsApp que ya fue analizado.
+
+    Permite descartar, antes de formar los lotes, los mensajes repetidos
+    cuando se sube de nuevo un chat que ya se habia importado.
+
+    Atributos:
+        huella (str): SHA-256 de (fecha/hora, autor, texto).
+        creado (datetime): Fecha en que se analizo por primera vez (UTC).
+    """
+    __tablename__ = "mensajes_procesados"
+
+    huella = Column(String(64), primary_key=True)
+    creado = Column(DateTime, default=datetime.utcnow)
@@ -1,5 +1,112 @@
+import codecs
 import re
-from typing import List, Dict
+from typing import AsyncIterator, Dict, Iterable, Iterator, List, Optional
+
+# Regex optimizado para detectar encabezados de mensajes.
+# Se compila una sola vez al importar el modulo.
+# Soporta:
+# 1. Android/Web: "dd/mm/yyyy, hh:mm - Autor: Mensaje"
+# 2. iOS: "[dd/mm/yyyy, hh:mm:ss] Autor: Mensaje"
+# Grupos de captura:
+# (1) Fecha, (2) Hora, (3) Autor, (4) Mensaje inicial
+HEADER_PATTERN = re.compile(
+    r'^(?:\[?)(\d{1,2}/\d{1,2}/\d{2,4})[,\s].*?'
+    r'(\d{1,2}:\d{2}(?::\d{2})?(?:\s?[ap]\.?\s?m\.?)?)(?:\]?)'
+    r'\s(?:-\s)?(.*?):\s(.*)$',
+    re.IGNORECASE
+)
+
+# Tamaño de cada bloque leido del archivo subido (1 MB)
+CHUNK_SIZE = 1024 * 1024
+
+# Codificaciones probadas (en orden) sobre el primer bloque del archivo.
+# latin-1 nunca falla, por lo que actua como ultimo recurso.
+ENCODINGS = ['utf-8-sig', 'latin-1']
+
+
+class WhatsAppStreamParser:
+    """
+    Parser incremental de chats de WhatsApp.
+
+    Recibe las lineas una a una y devuelve cada mensaje en cuanto se
+    detecta el encabezado del siguiente, por lo que nunca necesita el
+    archivo completo en memoria.
+    """
+
+    def __init__(self):
+        """Inicializa el parser sin ningun mensaje en curso."""
+        self.current_message: Optional[Dict[str, str]] = None
+
+    def feed(self, line: str) -> Optional[Dict[str, str]]:
+        """
+        Procesa una linea del chat.
+
+        Args:
+            line (str): Linea cruda del archivo.
+
+        Returns:
+            Dict | None: El mensaje anterior si la linea inicia uno nuevo,
+            None en caso contrario.
+        """
+        line = line.strip()
+
+        # Saltar lineas vacias para evitar procesamiento innecesario
+        if not line:
+            return None
+
+        # Validar si la linea corresponde al inicio de un nuevo mensaje
+        match = HEADER_PATTERN.match(line)
+
+        if match:
+            # Si existia un mensaje anterior procesandose, se entrega
+            # antes de iniciar el nuevo.
+            finished = self.current_message
+            date, time_str, author, message_text = match.groups()
+
+            self.current_message = {
+                "timestamp": f"{date} {time_str}",
+                "author": author.strip(),
+                "message": message_text.strip()
+            }
+            return finished
+
+        # Logica de multilinea:
+        # Si la linea no coincide con el patron de fecha/hora,
+        # se asume que es la continuacion del mensaje anterior.
+        if self.current_message:
+            self.current_message["message"] += f"\n{line}"
+        return None
+
+    def close(self) -> Optional[Dict[str, str]]:
+        """Entrega el ultimo mensaje pendiente (si existe)."""
+        finished = self.current_message
+        self.current_message = None
+        return finished
+
+
+def iter_whatsapp_messages(
+    lines: Iterable[str]
+) -> Iterator[Dict[str, str]]:
+    """
+    Generador que convierte lineas de un chat de WhatsApp en mensajes.
+
+    Args:
+        lines (Iterable[str]): Lineas del archivo exportado.
+
+    Yields:
+        Dict[str, str]: Mensaje con las claves 'timestamp', 'author'
+        y 'message'.
+    """
+    stream_parser = WhatsAppStreamParser()
+    for line in lines:
+        message = stream_parser.feed(line)
+        if message:
+            yield message
+
+    # Asegurar que el ultimo mensaje procesado se entregue
+    last = stream_parser.close()
+    if last:
+        yield last
 
 
 def parse_whatsapp_chat(content: str) -> List[Dict[str, str]]:
@@ -19,56 +126,93 @@ def parse_whatsapp_chat(content: str) -> List[Dict[str, str]]:
         - 'author': Nombre del remitente.
         - 'message': Contenido del mensaje.
     """
-    parsed_messages = []
-
-    # Regex optimizado para detectar encabezados de mensajes.
-    # Soporta:
-    # 1. Android/Web: "dd/mm/yyyy, hh:mm - Autor: Mensaje"
-    # 2. iOS: "[dd/mm/yyyy, hh:mm:ss] Autor: Mensaje"
-    # Grupos de captura:
-    # (1) Fecha, (2) Hora, (3) Autor, (4) Mensaje inicial
-    pattern = (
-        r'^(?:\[?)(\d{1,2}/\d{1,2}/\d{2,4})[,\s].*?'
-        r'(\d{1,2}:\d{2}(?::\d{2})?(?:\s?[ap]\.?\s?m\.?)?)(?:\]?)'
-        r'\s(?:-|]?)\s(.*?):\s(.*)$'
-    )
-
-    lines = content.split('\n')
-    current_message = None
+    return list(iter_whatsapp_messages(content.split('\n')))
 
-    for line in lines:
-        line = line.strip()
 
-        # Saltar lineas vacias para evitar procesamiento innecesario
-        if not line:
+def _detect_encoding(first_block: bytes) -> str:
+    """
+    Elige la codificacion del archivo a partir de su primer bloque.
+
+    Args:
+        first_block (bytes): Primeros bytes del archivo.
+
+    Returns:
+        str: Nombre de la codificacion a usar para todo el archivo.
+    """
+    for encoding in ENCODINGS:
+        # Decodificador incremental: tolera un caracter multibyte
+        # partido al final del bloque.
+        decoder = codecs.getincrementaldecoder(encoding)()
+        try:
+            decoder.decode(first_block, final=False)
+            return encoding
+        except UnicodeDecodeError:
             continue
+    return ENCODINGS[-1]
 
-        # Validar si la linea corresponde al inicio de un nuevo mensaje
-        match = re.match(pattern, line, re.IGNORECASE)
 
-        if match:
-            # Si existia un mensaje anterior procesandose, se guarda
-            # antes de iniciar el nuevo.
-            if current_message:
-                parsed_messages.append(current_message)
+async def iter_upload_lines(
+    file, chunk_size: int = CHUNK_SIZE
+) -> AsyncIterator[str]:
+    """
+    Lee un UploadFile por bloques y entrega sus lineas ya decodificadas.
 
-            date, time_str, author, message_text = match.groups()
+    La codificacion se detecta con el primer bloque; el resto del archivo
+    se decodifica de forma incremental (los bytes invalidos posteriores se
+    reemplazan en lugar de abortar la lectura).
 
-            current_message = {
-                "timestamp": f"{date} {time_str}",
-                "author": author.strip(),
-                "message": message_text.strip()
-            }
+    Args:
+        file (UploadFile): Archivo subido por el usuario.
+        chunk_size (int): Tamaño en bytes de cada lectura.
+
+    Yields:
+        str: Cada linea del archivo (sin el salto de linea).
+    """
+    decoder = None
+    pending = ""
+
+    while True:
+        block = await file.read(chunk_size)
+        if not block:
+            break
 
-        else:
-            # Logica de multilinea:
-            # Si la linea no coincide con el patron de fecha/hora,
-            # se asume que es la continuacion del mensaje anterior.
-            if current_message:
-                current_message["message"] += f"\n{line}"
+        if decoder is None:
+            encoding = _detect_encoding(block)
+            decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
 
-    # Asegurar que el ultimo mensaje procesado se agregue a la lista
-    if current_message:
-        parsed_messages.append(current_message)
+        pending += decoder.decode(block)
+        lines = pending.split('\n')
+        # La ultima linea puede estar incompleta: se conserva para el
+        # siguiente bloque.
+        pending = lines.pop()
+        for line in lines:
+            yield line
 
-    return parsed_messages
+    if decoder is not None:
+        pending += decoder.decode(b"", final=True)
+    if pending:
+        yield pending
+
+
+async def parse_whatsapp_upload(file) -> AsyncIterator[Dict[str, str]]:
+    """
+    Version en streaming de parse_whatsapp_chat para archivos subidos.
+
+    Consume el UploadFile por bloques, de modo que la memoria usada no
+    depende del tamaño del chat exportado.
+
+    Args:
+        file (UploadFile): Archivo .txt exportado de WhatsApp.
+
+    Yields:
+        Dict[str, str]: Mensajes con 'timestamp', 'author' y 'message'.
+    """
+    stream_parser = WhatsAppStreamParser()
+    async for line in iter_upload_lines(file):
+        message = stream_parser.feed(line)
+        if message:
+            yield message
+
+    last = stream_parser.close()
+    if last:
+        yield last
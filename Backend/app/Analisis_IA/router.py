@@ -1,33 +1,55 @@
+import json
+
 from fastapi import APIRouter, Depends, File, HTTPException, UploadFile
+from fastapi.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app import dependencias
-from app.Analisis_IA import analyzer, parser
-from app.Creacion_mats_prof import crud as crud_catalogos
-from app.Creacion_mats_prof import esquemas as esquemas_catalogos
+from app import cliente_ia, dependencias, llaves_ia
+from app.Analisis_IA import analyzer, cache, crud, esquemas, jobs, parser
 from app.database import get_db
-from app.Reviews import crud as crud_reviews
-from app.Reviews import esquemas as esquemas_reviews
 from app.Usuarios import esquemas as user_schemas
 
 router = APIRouter()
 
 
-@router.post("/process_reviews")
+# Mensajes del chat que se guardan por bloque mientras se lee el archivo
+BLOQUE_MENSAJES = 2000
+
+
+def _guardar_bloque(db: Session, trabajo_id: int, bloque, posicion: int):
+    """
+    Descarta los mensajes ya analizados (o reservados por otra subida)
+    de un bloque y guarda el resto, con su reserva, en una transaccion.
+
+    Returns:
+        tuple: (mensajes_nuevos, candidatos_a_analizar)
+    """
+    try:
+        nuevos = cache.reservar_mensajes_nuevos(db, bloque)
+        crud.agregar_mensajes_trabajo(db, trabajo_id, nuevos, posicion)
+    except Exception:
+        db.rollback()
+        raise
+    return len(nuevos), len(analyzer.prepare_messages(nuevos))
+
+
+@router.post("/process_reviews", response_model=esquemas.TrabajoCreado)
 async def process_reviews_file(
     file: UploadFile = File(...),
     db: Session = Depends(get_db),
     admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
 ):
     """
-    Procesa un archivo de historial de chat para extraer y guardar reseñas.
+    Recibe un historial de chat y encola su analisis en segundo plano.
 
     Flujo principal:
-    1. Valida y lee el archivo de texto.
-    2. Parsea el chat (limpieza y estructuración).
-    3. Analiza el contenido con IA para extraer reseñas.
-    4. Verifica o crea la materia 'General'.
-    5. Verifica o crea los profesores mencionados.
-    6. Guarda las reseñas en la base de datos.
+    1. Valida el archivo de texto.
+    2. Lo lee y parsea en streaming, por bloques de mensajes.
+    3. De cada bloque descarta los mensajes ya analizados o en cola en
+       otras subidas, y reserva y guarda el resto en el trabajo.
+    4. Envia el trabajo a la cola de analisis.
+
+    El analisis con IA y el guardado de reseñas los realiza un worker
+    (ver jobs.py). El progreso se consulta en /jobs/{job_id}.
 
     Args:
         file (UploadFile): Archivo .txt con el historial de chat.
@@ -35,10 +57,10 @@ async def process_reviews_file(
         admin_user (UserResponse): Usuario administrador autenticado.
 
     Returns:
-        dict: Resumen del proceso indicando éxito, mensaje y datos procesados.
+        TrabajoCreado: Indica si se encolo el trabajo y su ID.
 
     Raises:
-        HTTPException: Si el archivo no es .txt o no se puede decodificar.
+        HTTPException: Si el archivo no es .txt.
     """
     # 1. Validar extensión del archivo
     if not file.filename.endswith('.txt'):
@@ -47,141 +69,194 @@ async def process_reviews_file(
             detail="Solo se aceptan archivos .txt"
         )
 
-    # 2. Leer contenido con manejo de errores de encoding
-    # Se intentan varias codificaciones comunes para evitar errores
-    # al leer archivos generados en diferentes sistemas operativos (Win/Mac).
-    content_bytes = await file.read()
-    content_str = ""
-    for encoding in ['utf-8', 'latin-1', 'cp1252']:
-        try:
-            content_str = content_bytes.decode(encoding)
-            break
-        except UnicodeDecodeError:
-            continue
-
-    if not content_str:
-        raise HTTPException(
-            status_code=400,
-            detail="No se pudo leer el archivo (encoding desconocido)."
+    trabajo = await run_in_threadpool(
+        crud.create_trabajo,
+        db,
+        admin_email=admin_user.email,
+        nombre_archivo=file.filename
+    )
+
+    # 2. y 3. Leer, parsear y guardar por bloques
+    # El archivo se consume por bloques: la codificacion se detecta con el
+    # primer bloque (archivos generados en Win/Mac) y solo se mantiene en
+    # memoria un bloque de mensajes a la vez. El acceso a la BD se
+    # ejecuta en un hilo para no bloquear el event loop.
+    leidos = nuevos = candidatos = 0
+    bloque = []
+
+    async def guardar():
+        nonlocal nuevos, candidatos
+        n, c = await run_in_threadpool(
+            _guardar_bloque, db, trabajo.id, bloque, nuevos
         )
+        nuevos += n
+        candidatos += c
+        bloque.clear()
+
+    try:
+        async for message in parser.parse_whatsapp_upload(file):
+            bloque.append(message)
+            leidos += 1
+            if len(bloque) >= BLOQUE_MENSAJES:
+                await guardar()
+        await guardar()
+    except Exception:
+        await run_in_threadpool(crud.eliminar_trabajo, db, trabajo.id)
+        raise
 
-    # 3. Parsear (Limpieza y estructuración de mensajes)
-    clean_messages = parser.parse_whatsapp_chat(content_str)
     print(
         f"--- Chat cargado por Admin {admin_user.email}: "
-        f"{len(clean_messages)} mensajes ---"
+        f"{leidos} mensajes ---"
     )
 
-    if not clean_messages:
+    if not leidos or not nuevos:
+        await run_in_threadpool(crud.eliminar_trabajo, db, trabajo.id)
         return {
             "success": False,
-            "message": "El archivo no contiene mensajes validos."
+            "message": (
+                "El archivo no contiene mensajes validos." if not leidos
+                else "Todos los mensajes de este chat ya fueron analizados."
+            )
         }
 
-    # 4. Analizar con IA
-    extracted_reviews = analyzer.analyze_reviews(clean_messages)
+    # 4. Encolar el trabajo
+    await run_in_threadpool(
+        crud.activar_trabajo, db, trabajo.id, candidatos
+    )
+    await jobs.encolar_trabajo(trabajo.id)
 
-    if not extracted_reviews:
-        return {
-            "success": True,
-            "message": "La IA analizo el chat pero no encontro reseñas.",
-            "data": []
-        }
+    return {
+        "success": True,
+        "message": (
+            f"Chat recibido ({nuevos} mensajes nuevos, "
+            f"{leidos - nuevos} ya analizados). "
+            "El analisis se esta procesando."
+        ),
+        "job_id": trabajo.id
+    }
 
-    saved_reviews = []
-    profesores_nuevos = 0
 
-    # ID de usuario sistema para atribuir la creación de la reseña
-    # Se usa un ID fijo (1) o el del admin actual.
-    system_user_id = 1
+def _get_trabajo_or_404(db: Session, job_id: int):
+    """Obtiene el trabajo o lanza 404 si no existe."""
+    trabajo = crud.get_trabajo(db, job_id)
+    if not trabajo:
+        raise HTTPException(
+            status_code=404,
+            detail="Trabajo de analisis no encontrado"
+        )
+    return trabajo
 
-    print("--- Guardando en Base de Datos ---")
 
-    # --- GESTION DE MATERIA ---
-    # Se busca una materia genérica "General" para asignar las reseñas
-    # extraídas del chat, ya que el chat no especifica la materia exacta.
-    materia_generica_nombre = "General"
-    materia_db = crud_catalogos.get_materia_by_name(
-        db, materia_generica_nombre
-    )
+@router.get("/jobs/{job_id}", response_model=esquemas.TrabajoProgreso)
+def progreso_trabajo(
+    job_id: int,
+    db: Session = Depends(get_db),
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Consulta el progreso de un trabajo de analisis.
 
-    if not materia_db:
-        print(f"Creando materia automatica '{materia_generica_nombre}'...")
-        nueva_mat = esquemas_catalogos.MateriaCreate(
-            nombre=materia_generica_nombre
-        )
-        materia_db = crud_catalogos.create_materia(db, nueva_mat)
+    Args:
+        job_id (int): ID devuelto por /process_reviews.
+        db (Session): Sesión de base de datos.
+        admin_user (UserResponse): Usuario administrador autenticado.
 
-    materia_id_final = materia_db.id
+    Returns:
+        TrabajoProgreso: Estado, mensajes y lotes analizados, reseñas
+        encontradas, profesores creados y estadisticas de tokens.
+    """
+    trabajo = _get_trabajo_or_404(db, job_id)
+    progreso = esquemas.TrabajoProgreso.model_validate(trabajo)
+    progreso.estadisticas = json.loads(trabajo.estadisticas_json or "{}")
+    return progreso
 
-    # Iteración sobre las reseñas extraídas para guardarlas
-    for review_data in extracted_reviews:
-        nombre_profe = review_data['profesor_nombre']
 
-        # A. Gestión del Profesor
-        # Verifica si existe; si no, lo crea automáticamente.
-        db_profesor = crud_catalogos.get_profesor_by_name(
-            db, nombre=nombre_profe
-        )
+@router.get(
+    "/jobs/{job_id}/resultado",
+    response_model=esquemas.TrabajoResultado
+)
+def resultado_trabajo(
+    job_id: int,
+    db: Session = Depends(get_db),
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Devuelve las reseñas extraidas de un trabajo terminado.
 
-        if not db_profesor:
-            print(f"Nuevo profesor detectado: {nombre_profe}")
-            nuevo_profe_schema = esquemas_catalogos.ProfesorCreate(
-                nombre=nombre_profe
-            )
-            db_profesor = crud_catalogos.create_profesor(
-                db=db, profesor=nuevo_profe_schema
-            )
-            profesores_nuevos += 1
+    Args:
+        job_id (int): ID del trabajo.
+        db (Session): Sesión de base de datos.
+        admin_user (UserResponse): Usuario administrador autenticado.
 
-        real_profesor_id = db_profesor.id
+    Returns:
+        TrabajoResultado: Resumen y lista de reseñas extraidas.
 
-        # B. Creación de la Reseña
-        # Se anexa la fuente original al comentario para trazabilidad.
-        fuente = review_data['autor_original']
-        texto_final = (
-            f"{review_data['comentario']}\n"
-            f"(Fuente: Chat WhatsApp - {fuente})"
-        )
+    Raises:
+        HTTPException (409): Si el trabajo aun no termina.
+    """
+    trabajo = _get_trabajo_or_404(db, job_id)
 
-        # Normalización y seguridad de la calificación
-        try:
-            calif_final = float(review_data.get('calificacion', 5))
-            if calif_final > 10:
-                calif_final = 10.0
-        except (ValueError, TypeError):
-            calif_final = 5.0
-
-        # Normalización de la dificultad
-        try:
-            dificultad_val = int(review_data.get('dificultad', 5))
-        except (ValueError, TypeError):
-            dificultad_val = 5
-
-        nueva_resena = esquemas_reviews.ResenaCreate(
-            profesor_id=real_profesor_id,
-            materia_nombre=materia_generica_nombre,
-            comentario=texto_final,
-            calificacion=calif_final,
-            dificultad=dificultad_val
+    if trabajo.estado not in ("completado", "error"):
+        raise HTTPException(
+            status_code=409,
+            detail="El trabajo aun se esta procesando"
         )
 
-        try:
-            saved = crud_reviews.create_resena(
-                db=db,
-                resena=nueva_resena,
-                materia_id=materia_id_final,
-                user_id=system_user_id
-            )
-            saved_reviews.append(saved)
-        except Exception as e:
-            print(f"Error guardando reseña: {e}")
-
     return {
-        "success": True,
-        "message": (
-            f"Se procesaron {len(extracted_reviews)} reseñas. "
-            f"{profesores_nuevos} profesores nuevos creados."
-        ),
-        "data": extracted_reviews
+        "success": trabajo.estado == "completado",
+        "message": trabajo.mensaje or "",
+        "data": crud.get_resenas_trabajo(db, trabajo),
+        "errores": json.loads(trabajo.errores_json or "[]")
     }
+
+
+@router.get("/cache/stats")
+def estadisticas_cache(
+    db: Session = Depends(get_db),
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra el uso del cache de lotes de la IA.
+
+    Args:
+        db (Session): Sesión de base de datos.
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Aciertos, fallos, expulsiones y ocupacion del cache.
+    """
+    return cache.obtener_estadisticas(db)
+
+
+@router.get("/llaves/stats")
+def estadisticas_llaves(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra el uso y la salud de las API Keys de Gemini.
+
+    Incluye los pools del Chatbot y del Analisis de WhatsApp.
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Por pool, usos, fallos y enfriamiento de cada llave.
+    """
+    return llaves_ia.obtener_estadisticas()
+
+
+@router.get("/modelos/stats")
+def estadisticas_modelos(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra la latencia de las llamadas a cada modelo de Gemini.
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Por modelo, percentiles p50/p90/p99 (ms) y errores.
+    """
+    return cliente_ia.obtener_estadisticas()
@@ -0,0 +1,69 @@
+from collections import deque
+from typing import Dict, List, Optional, Tuple
+
+
+class AhoCorasick:
+    """
+    Automata de Aho-Corasick sobre un conjunto de frases.
+
+    Encuentra en una sola pasada sobre el texto todas las frases que
+    aparecen como subcadena y devuelve el menor ID asociado. Es inmutable:
+    para agregar frases se construye uno nuevo.
+    """
+
+    def __init__(self, frases: List[Tuple[int, str]]):
+        """
+        Args:
+            frases (List[Tuple]): Pares (id, frase en minusculas). Una
+                misma ID puede tener varias frases.
+        """
+        self.transiciones: List[Dict[str, int]] = [{}]
+        self.fallo: List[int] = [0]
+        self.salidas: List[List[int]] = [[]]
+
+        for id_frase, frase in frases:
+            if not frase:
+                continue
+            estado = 0
+            for caracter in frase:
+                siguiente = self.transiciones[estado].get(caracter)
+                if siguiente is None:
+                    siguiente = len(self.transiciones)
+                    self.transiciones.append({})
+                    self.fallo.append(0)
+                    self.salidas.append([])
+                    self.transiciones[estado][caracter] = siguiente
+                estado = siguiente
+            self.salidas[estado].append(id_frase)
+
+        # Enlaces de fallo por recorrido en anchura
+        cola = deque(self.transiciones[0].values())
+        while cola:
+            estado = cola.popleft()
+            for caracter, siguiente in self.transiciones[estado].items():
+                cola.append(siguiente)
+                fallo = self.fallo[estado]
+                while fallo and caracter not in self.transiciones[fallo]:
+                    fallo = self.fallo[fallo]
+                self.fallo[siguiente] = self.transiciones[fallo].get(
+                    caracter, 0
+                )
+                self.salidas[siguiente] = (
+                    self.salidas[siguiente]
+                    + self.salidas[self.fallo[siguiente]]
+                )
+
+    def buscar(self, texto: str) -> Optional[int]:
+        """
+        Devuelve el menor ID cuya frase aparece en el texto (o None).
+        """
+        mejor = None
+        estado = 0
+        for caracter in texto:
+            while estado and caracter not in self.transiciones[estado]:
+                estado = self.fallo[estado]
+            estado = self.transiciones[estado].get(caracter, 0)
+            for id_frase in self.salidas[estado]:
+                if mejor is None or id_frase < mejor:
+                    mejor = id_frase
+        return mejor
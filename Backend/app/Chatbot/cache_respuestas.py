@@ -0,0 +1,276 @@
+import hashlib
+import math
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+# Numero maximo de respuestas guardadas (expulsion LRU)
+CACHE_MAX_ENTRADAS = int(os.getenv("CHATBOT_CACHE_MAX_ENTRADAS", "1000"))
+
+# Segundos que una respuesta se considera vigente
+CACHE_TTL_SEGUNDOS = float(os.getenv("CHATBOT_CACHE_TTL", "3600"))
+
+# Similitud coseno minima para reutilizar la respuesta de una pregunta
+# parecida. Con 1 o mas solo se aceptan preguntas identicas.
+CACHE_SIMILITUD_MINIMA = float(os.getenv("CHATBOT_CACHE_SIMILITUD", "0.9"))
+
+# Preguntas parecidas (las mas recientes del mismo grupo) que se comparan
+# como maximo al buscar una casi identica. Acota el trabajo bajo el lock.
+CACHE_MAX_COMPARACIONES = int(
+    os.getenv("CHATBOT_CACHE_MAX_COMPARACIONES", "200")
+)
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def normalizar_pregunta(texto: str) -> str:
+    """
+    Normaliza una pregunta: minusculas, sin acentos ni signos y con los
+    espacios colapsados.
+    """
+    texto = unicodedata.normalize("NFKD", texto.lower())
+    texto = "".join(c for c in texto if not unicodedata.combining(c))
+    return " ".join(TOKEN_PATTERN.findall(texto))
+
+
+def huella_historial(mensajes: Sequence[Dict[str, Any]]) -> str:
+    """
+    Resume el historial de la conversacion para la clave del cache.
+
+    La respuesta del modelo depende del historial incluido en el prompt,
+    asi que solo se reutiliza entre conversaciones con el mismo contexto.
+    Sin historial la huella es "" y la respuesta se comparte entre todos.
+
+    Args:
+        mensajes (List[Dict]): Mensajes con 'role' y 'content'.
+
+    Returns:
+        str: Huella del historial ("" si esta vacio).
+    """
+    if not mensajes:
+        return ""
+    resumen = hashlib.sha1()
+    for mensaje in mensajes:
+        resumen.update(f"{mensaje['role']}\0{mensaje['content']}\0".encode())
+    return resumen.hexdigest()
+
+
+def _vector(pregunta_normalizada: str) -> Tuple[Dict[str, int], float]:
+    """
+    Vector disperso de palabras y pares de palabras, con su norma.
+
+    Las palabras cortas (de, la, el) se omiten para que no dominen la
+    similitud entre preguntas breves.
+    """
+    palabras = [p for p in pregunta_normalizada.split() if len(p) > 2]
+    rasgos: Dict[str, int] = {}
+    for rasgo in palabras + [
+        f"{a} {b}" for a, b in zip(palabras, palabras[1:])
+    ]:
+        rasgos[rasgo] = rasgos.get(rasgo, 0) + 1
+    norma = math.sqrt(sum(v * v for v in rasgos.values()))
+    return rasgos, norma
+
+
+def _similitud(a: Tuple[Dict[str, int], float], b) -> float:
+    """Similitud coseno entre dos vectores de _vector."""
+    (rasgos_a, norma_a), (rasgos_b, norma_b) = a, b
+    if not norma_a or not norma_b:
+        return 0.0
+    if len(rasgos_a) > len(rasgos_b):
+        rasgos_a, rasgos_b = rasgos_b, rasgos_a
+    producto = sum(v * rasgos_b.get(k, 0) for k, v in rasgos_a.items())
+    return producto / (norma_a * norma_b)
+
+
+class CacheRespuestas:
+    """
+    Cache en memoria de las respuestas del Chatbot por materia.
+
+    La clave es (materia_id, huella del historial, version de recursos,
+    pregunta normalizada). La version de una materia cambia cada vez que
+    se agregan o borran sus recursos, de modo que las respuestas
+    anteriores dejan de usarse. Si no hay coincidencia exacta, se busca
+    una pregunta parecida entre las CACHE_MAX_COMPARACIONES mas recientes
+    del mismo grupo (materia, historial y version), por similitud coseno
+    de palabras.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # clave -> {respuesta, vector, creado, latencia}
+        self._entradas: "OrderedDict[tuple, Dict[str, Any]]" = OrderedDict()
+        # grupo (materia, huella, version) -> claves, de la mas antigua
+        # a la mas reciente
+        self._grupos: Dict[tuple, "OrderedDict[tuple, None]"] = {}
+        self._versiones: Dict[Optional[int], int] = {}
+        # Se incrementa al invalidar todo; forma parte de cada version
+        self._epoca = 0
+        self.estadisticas = {
+            "hits": 0,
+            "hits_similares": 0,
+            "misses": 0,
+            "segundos_ahorrados": 0.0,
+        }
+
+    def _version(self, materia_id: Optional[int]) -> Tuple[int, int]:
+        return self._epoca, self._versiones.get(materia_id, 0)
+
+    def _usar(self, clave: tuple):
+        """Marca una entrada como la mas reciente (con el lock)."""
+        self._entradas.move_to_end(clave)
+        self._grupos[clave[:3]].move_to_end(clave)
+
+    def _quitar(self, clave: tuple):
+        """Borra una entrada y su referencia en el grupo (con el lock)."""
+        del self._entradas[clave]
+        grupo = self._grupos[clave[:3]]
+        del grupo[clave]
+        if not grupo:
+            del self._grupos[clave[:3]]
+
+    def version(self, materia_id: Optional[int]) -> Tuple[int, int]:
+        """
+        Version actual de los recursos de una materia.
+
+        Debe leerse antes de consultar los recursos y pasarse a guardar(),
+        para no guardar una respuesta basada en recursos ya reemplazados.
+        """
+        with self._lock:
+            return self._version(materia_id)
+
+    def obtener(
+        self, materia_id: Optional[int], pregunta: str, huella: str = ""
+    ) -> Optional[str]:
+        """
+        Busca una respuesta guardada para la pregunta.
+
+        Args:
+            materia_id (int): Materia de la conversacion.
+            pregunta (str): Pregunta original del usuario.
+            huella (str): huella_historial() del historial del prompt.
+
+        Returns:
+            str | None: Respuesta guardada, o None si no hay acierto.
+        """
+        normalizada = normalizar_pregunta(pregunta)
+        vector = _vector(normalizada) if CACHE_SIMILITUD_MINIMA < 1 else None
+        ahora = time.monotonic()
+
+        with self._lock:
+            version = self._version(materia_id)
+            clave = (materia_id, huella, version, normalizada)
+            entrada = self._entradas.get(clave)
+            tipo = "hits"
+
+            grupo = self._grupos.get(clave[:3], ())
+            if entrada is None and vector is not None and grupo:
+                mejor = CACHE_SIMILITUD_MINIMA
+                for comparadas, otra_clave in enumerate(reversed(grupo)):
+                    if comparadas >= CACHE_MAX_COMPARACIONES:
+                        break
+                    otra = self._entradas[otra_clave]
+                    similitud = _similitud(vector, otra["vector"])
+                    if similitud > mejor or (
+                        similitud == mejor and entrada is None
+                    ):
+                        mejor, clave, entrada = similitud, otra_clave, otra
+                tipo = "hits_similares"
+
+            if entrada and ahora - entrada["creado"] > CACHE_TTL_SEGUNDOS:
+                self._quitar(clave)
+                entrada = None
+
+            if entrada is None:
+                self.estadisticas["misses"] += 1
+                return None
+
+            self._usar(clave)
+            self.estadisticas[tipo] += 1
+            self.estadisticas["segundos_ahorrados"] += entrada["latencia"]
+            return entrada["respuesta"]
+
+    def guardar(
+        self,
+        materia_id: Optional[int],
+        pregunta: str,
+        respuesta: str,
+        version: Tuple[int, int],
+        latencia: float = 0.0,
+        huella: str = ""
+    ):
+        """
+        Guarda la respuesta generada para una pregunta.
+
+        Args:
+            materia_id (int): Materia de la conversacion.
+            pregunta (str): Pregunta original del usuario.
+            respuesta (str): Respuesta final enviada al usuario.
+            version (Tuple): Version leida con version() antes de
+                consultar los recursos. Si cambio, no se guarda.
+            latencia (float): Segundos que tardo el modelo en generarla.
+            huella (str): huella_historial() del historial del prompt.
+        """
+        normalizada = normalizar_pregunta(pregunta)
+        entrada = {
+            "respuesta": respuesta,
+            "vector": _vector(normalizada),
+            "creado": time.monotonic(),
+            "latencia": latencia,
+        }
+        with self._lock:
+            if version != self._version(materia_id):
+                return
+            clave = (materia_id, huella, version, normalizada)
+            self._entradas[clave] = entrada
+            self._grupos.setdefault(clave[:3], OrderedDict())[clave] = None
+            self._usar(clave)
+            while len(self._entradas) > CACHE_MAX_ENTRADAS:
+                self._quitar(next(iter(self._entradas)))
+
+    def invalidar_materia(self, materia_id: Optional[int]):
+        """
+        Descarta las respuestas de una materia (sus recursos cambiaron).
+
+        Args:
+            materia_id (int): Materia cuyos recursos se modificaron.
+        """
+        with self._lock:
+            self._versiones[materia_id] = (
+                self._versiones.get(materia_id, 0) + 1
+            )
+            for grupo in [g for g in self._grupos if g[0] == materia_id]:
+                for clave in self._grupos.pop(grupo):
+                    del self._entradas[clave]
+
+    def invalidar_todo(self):
+        """Descarta todas las respuestas guardadas."""
+        with self._lock:
+            self._epoca += 1
+            self._entradas.clear()
+            self._grupos.clear()
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Devuelve aciertos, fallos, tasa de acierto y tiempo ahorrado.
+        """
+        with self._lock:
+            datos = dict(self.estadisticas)
+            datos["entradas"] = len(self._entradas)
+
+        aciertos = datos["hits"] + datos["hits_similares"]
+        consultas = aciertos + datos["misses"]
+        datos["tasa_acierto"] = (
+            round(aciertos / consultas, 3) if consultas else 0.0
+        )
+        datos["segundos_ahorrados"] = round(datos["segundos_ahorrados"], 2)
+        datos["max_entradas"] = CACHE_MAX_ENTRADAS
+        return datos
+
+
+# Instancia global compartida por el Chatbot y el Portal de Estudio
+cache = CacheRespuestas()
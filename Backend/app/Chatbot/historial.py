@@ -0,0 +1,349 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import desc, insert
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.orm import Session
+
+from app.Chatbot.modelos import HistorialChat
+from app.database import SessionLocal
+
+# Segundos maximos que un mensaje espera en memoria antes de guardarse
+INTERVALO_VOLCADO_SEGUNDOS = float(
+    os.getenv("CHATBOT_HISTORIAL_INTERVALO", "2")
+)
+
+# Con este numero de mensajes pendientes se guardan sin esperar
+LOTE_VOLCADO = int(os.getenv("CHATBOT_HISTORIAL_LOTE", "200"))
+
+# Mensajes recientes que se conservan en memoria por usuario
+MENSAJES_POR_USUARIO = int(os.getenv("CHATBOT_HISTORIAL_MENSAJES", "20"))
+
+# Usuarios con historial en memoria (expulsion LRU)
+MAX_USUARIOS_EN_MEMORIA = int(
+    os.getenv("CHATBOT_HISTORIAL_USUARIOS", "5000")
+)
+
+# Mensajes pendientes que se conservan como maximo si la BD no responde;
+# al superarlo se descartan los mas antiguos
+MAX_PENDIENTES = int(os.getenv("CHATBOT_HISTORIAL_MAX_PENDIENTES", "20000"))
+
+# Volcados fallidos (BD caida, etc.) tras los cuales un mensaje se descarta
+MAX_INTENTOS_VOLCADO = int(os.getenv("CHATBOT_HISTORIAL_INTENTOS", "10"))
+
+# Cada cuanto revisa la tarea de fondo si hay que guardar
+REVISION_SEGUNDOS = 0.2
+
+
+class BufferHistorial:
+    """
+    Historial del Chatbot con escritura diferida (write-behind).
+
+    guardar_interaccion ya no hace dos INSERT y un commit por respuesta:
+    los mensajes se encolan en memoria y una tarea de fondo los guarda
+    en bloque cada pocos segundos (o antes, si se acumulan muchos).
+
+    Ademas se conservan los ultimos mensajes de cada usuario en un buffer
+    circular, de modo que recuperar_historial no consulta la base de
+    datos en cada pregunta. Si el usuario no esta en memoria (primer
+    mensaje tras un reinicio, o fue expulsado) se lee de la BD una vez.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Serializa los volcados con las lecturas de la BD (usuario que
+        # no esta en memoria), para que un mensaje no se lea dos veces
+        self._lock_volcado = threading.Lock()
+        self._pendientes: List[Dict[str, Any]] = []
+        # user_id -> deque de mensajes; 'completos' indica que el deque
+        # ya incluye lo guardado en la BD
+        self._recientes: "OrderedDict[int, deque]" = OrderedDict()
+        self._completos: set = set()
+        self._ultimo_volcado = time.monotonic()
+        self.estadisticas = {
+            "volcados": 0,
+            "filas_guardadas": 0,
+            "errores_volcado": 0,
+            "filas_descartadas": 0,
+            "lecturas_memoria": 0,
+            "lecturas_bd": 0,
+        }
+
+    def _tocar_usuario(self, user_id: int) -> deque:
+        """Devuelve (o crea) el buffer del usuario y lo marca reciente."""
+        mensajes = self._recientes.get(user_id)
+        if mensajes is None:
+            mensajes = deque(maxlen=MENSAJES_POR_USUARIO)
+            self._recientes[user_id] = mensajes
+        self._recientes.move_to_end(user_id)
+        while len(self._recientes) > MAX_USUARIOS_EN_MEMORIA:
+            expulsado, _ = self._recientes.popitem(last=False)
+            self._completos.discard(expulsado)
+        return mensajes
+
+    def agregar(self, user_id: int, pregunta: str, respuesta: str):
+        """
+        Encola la pregunta y la respuesta para guardarlas despues.
+
+        Args:
+            user_id (int): ID del usuario.
+            pregunta (str): Mensaje del usuario.
+            respuesta (str): Respuesta del asistente.
+        """
+        # La fecha se fija ahora y no al guardar, para que el limite de
+        # preguntas por ventana de tiempo cuente la hora real
+        ahora = datetime.utcnow()
+        nuevos = [
+            {"user_id": user_id, "role": "user", "content": pregunta,
+             "timestamp": ahora, "guardado": False},
+            {"user_id": user_id, "role": "model", "content": respuesta,
+             "timestamp": ahora, "guardado": False},
+        ]
+        with self._lock:
+            self._pendientes.extend(nuevos)
+            self._recortar_pendientes()
+            self._tocar_usuario(user_id).extend(nuevos)
+
+    def _descartar(self, mensajes: List[Dict[str, Any]], motivo: str):
+        """
+        Da por perdidos mensajes que no se guardaran (con el lock).
+
+        Se marcan como guardados para que recientes() no los conserve
+        como pendientes al recargar el usuario desde la BD.
+        """
+        if not mensajes:
+            return
+        for mensaje in mensajes:
+            mensaje["guardado"] = True
+        self.estadisticas["filas_descartadas"] += len(mensajes)
+        print(f"Historial: {len(mensajes)} mensajes descartados ({motivo})")
+
+    def _recortar_pendientes(self):
+        """Descarta los pendientes mas antiguos sobre MAX_PENDIENTES."""
+        exceso = len(self._pendientes) - MAX_PENDIENTES
+        if exceso > 0:
+            self._descartar(
+                self._pendientes[:exceso], "demasiados pendientes"
+            )
+            self._pendientes = self._pendientes[exceso:]
+
+    def _reencolar(self, lote: List[Dict[str, Any]]):
+        """
+        Devuelve a la cola un lote que no se pudo guardar.
+
+        Los mensajes que ya fallaron MAX_INTENTOS_VOLCADO veces se
+        descartan.
+        """
+        with self._lock:
+            self.estadisticas["errores_volcado"] += 1
+            reintentar = []
+            agotados = []
+            for mensaje in lote:
+                mensaje["intentos"] = mensaje.get("intentos", 0) + 1
+                if mensaje["intentos"] >= MAX_INTENTOS_VOLCADO:
+                    agotados.append(mensaje)
+                else:
+                    reintentar.append(mensaje)
+            self._descartar(agotados, "reintentos agotados")
+            self._pendientes = reintentar + self._pendientes
+            self._recortar_pendientes()
+
+    def recientes(
+        self, user_id: int, limite: int, db: Session
+    ) -> List[Dict[str, Any]]:
+        """
+        Devuelve los ultimos mensajes del usuario, del mas antiguo al
+        mas reciente.
+
+        Args:
+            user_id (int): ID del usuario.
+            limite (int): Numero maximo de mensajes.
+            db (Session): Sesión usada solo si el usuario no esta en
+                memoria.
+
+        Returns:
+            List[Dict]: Mensajes con 'role' y 'content'.
+        """
+        with self._lock:
+            mensajes = self._recientes.get(user_id)
+            if mensajes is not None and (
+                user_id in self._completos or len(mensajes) >= limite
+            ):
+                self._recientes.move_to_end(user_id)
+                self.estadisticas["lecturas_memoria"] += 1
+                return list(mensajes)[-limite:]
+
+        # Sin volcados en curso, lo guardado en la BD y lo pendiente en
+        # memoria no se traslapan
+        with self._lock_volcado:
+            guardados = db.query(
+                HistorialChat.role, HistorialChat.content
+            ).filter(
+                HistorialChat.user_id == user_id
+            ).order_by(
+                # La pregunta y su respuesta tienen la misma fecha; el id
+                # conserva el orden en que se encolaron
+                desc(HistorialChat.timestamp), desc(HistorialChat.id)
+            ).limit(MENSAJES_POR_USUARIO).all()
+
+            with self._lock:
+                self.estadisticas["lecturas_bd"] += 1
+                actuales = self._tocar_usuario(user_id)
+                sin_guardar = [
+                    m for m in actuales if not m.get("guardado", True)
+                ]
+                actuales.clear()
+                actuales.extend(
+                    {"role": role, "content": content}
+                    for role, content in reversed(guardados)
+                )
+                actuales.extend(sin_guardar)
+                self._completos.add(user_id)
+                return list(actuales)[-limite:]
+
+    def volcar(self) -> int:
+        """
+        Guarda en la base de datos todos los mensajes pendientes con un
+        solo INSERT de varias filas.
+
+        Si el INSERT falla por datos invalidos (p. ej. un user_id que ya
+        no existe) se reintenta fila por fila con savepoints y solo se
+        descartan las filas que vuelven a fallar. Si falla por otra causa
+        (BD caida) el lote se reencola, hasta MAX_INTENTOS_VOLCADO veces.
+
+        Returns:
+            int: Numero de filas guardadas.
+        """
+        with self._lock_volcado:
+            with self._lock:
+                lote, self._pendientes = self._pendientes, []
+                self._ultimo_volcado = time.monotonic()
+            if not lote:
+                return 0
+
+            db = SessionLocal()
+            try:
+                try:
+                    db.execute(
+                        insert(HistorialChat), [_fila(m) for m in lote]
+                    )
+                    guardados, invalidos = lote, []
+                except (IntegrityError, DataError) as e:
+                    db.rollback()
+                    print(
+                        f"Fallo el guardado del historial ({e.orig}). "
+                        "Reintentando fila por fila..."
+                    )
+                    guardados, invalidos = _insertar_por_fila(db, lote)
+                db.commit()
+            except Exception as e:
+                db.rollback()
+                print(f"Error guardando historial: {e}")
+                self._reencolar(lote)
+                return 0
+            finally:
+                db.close()
+
+            with self._lock:
+                for mensaje in guardados:
+                    mensaje["guardado"] = True
+                self._descartar(invalidos, "datos invalidos")
+                self.estadisticas["volcados"] += 1
+                self.estadisticas["filas_guardadas"] += len(guardados)
+            return len(guardados)
+
+    def debe_volcar(self) -> bool:
+        """Indica si ya toca guardar los mensajes pendientes."""
+        with self._lock:
+            if not self._pendientes:
+                return False
+            return (
+                len(self._pendientes) >= LOTE_VOLCADO
+                or time.monotonic() - self._ultimo_volcado
+                >= INTERVALO_VOLCADO_SEGUNDOS
+            )
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """Devuelve los contadores de volcados y lecturas del historial."""
+        with self._lock:
+            datos = dict(self.estadisticas)
+            datos["pendientes"] = len(self._pendientes)
+            datos["usuarios_en_memoria"] = len(self._recientes)
+        return datos
+
+
+def _fila(mensaje: Dict[str, Any]) -> Dict[str, Any]:
+    """Columnas de HistorialChat de un mensaje pendiente."""
+    return {k: mensaje[k] for k in ("user_id", "role", "content", "timestamp")}
+
+
+def _insertar_por_fila(db: Session, lote: List[Dict[str, Any]]) -> tuple:
+    """
+    Inserta un lote fila por fila, cada una en su propio savepoint.
+
+    Args:
+        db (Session): Sesión de la base de datos (sin commit).
+        lote (List[Dict]): Mensajes pendientes.
+
+    Returns:
+        tuple: (mensajes_insertados, mensajes_invalidos)
+    """
+    guardados = []
+    invalidos = []
+    for mensaje in lote:
+        try:
+            with db.begin_nested():
+                db.execute(insert(HistorialChat), [_fila(mensaje)])
+            guardados.append(mensaje)
+        except (IntegrityError, DataError) as e:
+            print(
+                f"Mensaje de historial invalido "
+                f"(usuario {mensaje['user_id']}): {e.orig}"
+            )
+            invalidos.append(mensaje)
+    return guardados, invalidos
+
+
+# Instancia global usada por el endpoint del Chatbot
+buffer = BufferHistorial()
+
+_tarea: Optional[asyncio.Task] = None
+
+
+async def _volcado_periodico():
+    """Guarda los mensajes pendientes en segundo plano."""
+    while True:
+        await asyncio.sleep(REVISION_SEGUNDOS)
+        if buffer.debe_volcar():
+            await run_in_threadpool(buffer.volcar)
+
+
+def iniciar_volcado():
+    """
+    Inicia la tarea de fondo que guarda el historial.
+
+    Debe llamarse en el evento 'startup' de la aplicacion.
+    """
+    global _tarea
+    _tarea = asyncio.create_task(_volcado_periodico())
+
+
+async def detener_volcado():
+    """
+    Detiene la tarea de fondo y guarda lo que quede pendiente.
+
+    Debe llamarse en el evento 'shutdown' de la aplicacion.
+    """
+    global _tarea
+    if _tarea is not None:
+        _tarea.cancel()
+        _tarea = None
+    guardadas = await run_in_threadpool(buffer.volcar)
+    if guardadas:
+        print(f"--- Historial del Chatbot: {guardadas} mensajes guardados ---")
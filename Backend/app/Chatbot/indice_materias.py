@@ -0,0 +1,200 @@
+import os
+import re
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.Chatbot.automata import AhoCorasick
+from app.Creacion_mats_prof import modelos as main_models
+from app.database import SessionLocal
+
+# Segundos tras los cuales el indice se recarga desde la BD. Cubre las
+# materias creadas por otros procesos (varios workers de uvicorn).
+INDICE_TTL_SEGUNDOS = float(os.getenv("INDICE_MATERIAS_TTL", "300"))
+
+TOKEN_PATTERN = re.compile(r'\w+')
+
+
+def _tokens_importantes(nombre: str) -> set:
+    """Palabras del nombre, sin las irrelevantes cortas (de, la, i, ii)."""
+    return {t for t in TOKEN_PATTERN.findall(nombre) if len(t) > 2}
+
+
+class IndiceMaterias:
+    """
+    Indice en memoria de los nombres de materias para el Chatbot.
+
+    Evita consultar y tokenizar todas las materias en cada pregunta:
+    - Un automata de Aho-Corasick para coincidencias del nombre completo.
+    - Un indice invertido palabra -> IDs de materia para la coincidencia
+      por palabras.
+
+    Se carga al iniciar la aplicacion y se actualiza cuando se crea una
+    materia (crud.create_materia, usado tambien por el importador de IA).
+    Las estructuras nunca se modifican en su lugar: se reemplazan, y las
+    busquedas trabajan sobre una instantanea tomada bajo el lock.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Solo un hilo recarga desde la BD cuando vence el TTL
+        self._lock_carga = threading.Lock()
+        self._nombres: Dict[int, str] = {}
+        self._por_token: Dict[str, List[int]] = {}
+        self._automata: Optional[AhoCorasick] = None
+        self._cargado_en: Optional[float] = None
+
+    def cargar(self, db: Session):
+        """
+        Reconstruye el indice completo desde la base de datos.
+
+        Args:
+            db (Session): Sesión de la base de datos.
+        """
+        materias = db.query(
+            main_models.Materia.id, main_models.Materia.nombre
+        ).all()
+
+        nombres = {}
+        por_token: Dict[str, List[int]] = {}
+        for mat_id, mat_nombre in sorted(materias):
+            nombres[mat_id] = mat_nombre
+            for token in _tokens_importantes(mat_nombre.lower()):
+                por_token.setdefault(token, []).append(mat_id)
+
+        with self._lock:
+            self._nombres = nombres
+            self._por_token = por_token
+            self._automata = None
+            self._cargado_en = time.monotonic()
+
+    def agregar(self, mat_id: int, nombre: str):
+        """
+        Agrega una materia recien creada al indice.
+
+        Args:
+            mat_id (int): ID de la materia.
+            nombre (str): Nombre de la materia.
+        """
+        with self._lock:
+            if self._cargado_en is None:
+                # Aun no se ha cargado; la primera busqueda la incluira
+                return
+            # Se reemplazan los diccionarios (no se modifican) porque
+            # puede haber busquedas leyendo una instantanea anterior
+            nombres = dict(self._nombres)
+            nombres[mat_id] = nombre
+            por_token = dict(self._por_token)
+            for token in _tokens_importantes(nombre.lower()):
+                ids = por_token.get(token, [])
+                if mat_id not in ids:
+                    por_token[token] = sorted(ids + [mat_id])
+            self._nombres = nombres
+            self._por_token = por_token
+            # El automata se reconstruye en la siguiente busqueda
+            self._automata = None
+
+    def _vigente(self) -> bool:
+        """Indica si el indice esta cargado y dentro de su TTL."""
+        return (
+            self._cargado_en is not None
+            and time.monotonic() - self._cargado_en < INDICE_TTL_SEGUNDOS
+        )
+
+    def _asegurar_cargado(self, db: Session):
+        """
+        Carga el indice si no esta cargado o si vencio su TTL.
+
+        La primera carga bloquea a todos los hilos hasta que termina. Al
+        vencer el TTL solo un hilo recarga; los demas siguen respondiendo
+        con el indice anterior en lugar de consultar la BD a la vez.
+        """
+        if self._vigente():
+            return
+
+        if self._cargado_en is None:
+            with self._lock_carga:
+                if self._cargado_en is None:
+                    self.cargar(db)
+            return
+
+        if self._lock_carga.acquire(blocking=False):
+            try:
+                if not self._vigente():
+                    self.cargar(db)
+            finally:
+                self._lock_carga.release()
+
+    def _instantanea(
+        self
+    ) -> Tuple[AhoCorasick, Dict[int, str], Dict[str, List[int]]]:
+        """
+        Devuelve (automata, nombres, por_token) coherentes entre si,
+        construyendo el automata si hubo cambios.
+        """
+        with self._lock:
+            if self._automata is None:
+                self._automata = AhoCorasick([
+                    (mat_id, nombre.lower())
+                    for mat_id, nombre in self._nombres.items()
+                ])
+            return self._automata, self._nombres, self._por_token
+
+    def buscar(
+        self, texto: str, db: Session
+    ) -> Tuple[Optional[int], Optional[str]]:
+        """
+        Detecta la materia mencionada en un texto.
+
+        Da prioridad a la coincidencia exacta del nombre completo; si no
+        la hay, elige la materia con mas palabras relevantes en comun.
+        Los empates se resuelven por el ID menor.
+
+        Args:
+            texto (str): Texto del usuario.
+            db (Session): Sesión usada solo si hay que (re)cargar el indice.
+
+        Returns:
+            Tuple: (id, nombre) de la materia, o (None, None).
+        """
+        self._asegurar_cargado(db)
+        automata, nombres, por_token = self._instantanea()
+
+        texto = texto.lower()
+
+        # 1. Coincidencia Exacta (Prioridad Maxima)
+        mat_id = automata.buscar(texto)
+        if mat_id is not None:
+            return mat_id, nombres[mat_id]
+
+        # 2. Coincidencia por palabras (indice invertido)
+        coincidencias: Dict[int, int] = {}
+        for token in set(TOKEN_PATTERN.findall(texto)):
+            for mat_id in por_token.get(token, ()):
+                coincidencias[mat_id] = coincidencias.get(mat_id, 0) + 1
+
+        if not coincidencias:
+            return None, None
+
+        mat_id = min(coincidencias, key=lambda m: (-coincidencias[m], m))
+        return mat_id, nombres[mat_id]
+
+
+# Instancia global compartida por el Chatbot y el catalogo de materias
+indice = IndiceMaterias()
+
+
+def cargar_indice():
+    """
+    Carga el indice con su propia sesion.
+
+    Debe llamarse en el evento 'startup' de la aplicacion.
+    """
+    db = SessionLocal()
+    try:
+        indice.cargar(db)
+        print(f"--- Indice de materias: {len(indice._nombres)} materias ---")
+    finally:
+        db.close()
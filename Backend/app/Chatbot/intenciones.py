@@ -0,0 +1,205 @@
+import json
+import os
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.Chatbot.automata import AhoCorasick
+from app.Estadistica.contadores import MODELOS_CONTADOS, contadores
+
+# Archivo con las intenciones y sus respuestas. Se puede editar con el
+# servidor en marcha: los cambios se aplican sin reiniciar.
+RUTA_INTENCIONES = os.getenv(
+    "CHATBOT_INTENCIONES",
+    os.path.join(os.path.dirname(__file__), "intenciones.json")
+)
+
+# Cada cuantos segundos se revisa si el archivo cambio
+REVISION_SEGUNDOS = 5
+
+# Totales que se pueden pedir desde una intencion ("conteo"). Son los
+# mismos que mantiene Estadistica.contadores para el dashboard.
+MODELOS_CONTEO = set(MODELOS_CONTADOS)
+
+
+def _validar_intencion(intencion: Any) -> Optional[str]:
+    """
+    Revisa la estructura de una intencion del archivo JSON.
+
+    Args:
+        intencion (Any): Elemento leido del archivo.
+
+    Returns:
+        str | None: Descripcion del problema, o None si es valida.
+    """
+    if not isinstance(intencion, dict):
+        return "no es un objeto"
+    nombre = intencion.get("nombre")
+    if not isinstance(nombre, str) or not nombre.strip():
+        return "falta 'nombre'"
+    frases = intencion.get("frases")
+    if (
+        not isinstance(frases, list) or not frases
+        or not all(isinstance(f, str) and f.strip() for f in frases)
+    ):
+        return f"'{nombre}': 'frases' debe ser una lista de textos"
+    respuesta = intencion.get("respuesta")
+    if not isinstance(respuesta, str):
+        return f"'{nombre}': falta 'respuesta'"
+
+    conteo = intencion.get("conteo")
+    if conteo is not None:
+        if conteo not in MODELOS_CONTEO:
+            return (
+                f"'{nombre}': conteo '{conteo}' desconocido "
+                f"(validos: {', '.join(sorted(MODELOS_CONTEO))})"
+            )
+        try:
+            respuesta.format(total=0)
+        except (KeyError, IndexError, ValueError) as e:
+            return f"'{nombre}': la respuesta no se puede formatear ({e})"
+    return None
+
+
+class MotorIntenciones:
+    """
+    Respuestas rapidas del Chatbot sin consultar a la IA.
+
+    Las intenciones se definen en un archivo JSON (frases clave y
+    respuesta) y se compilan en un solo automata de Aho-Corasick, de modo
+    que el texto se recorre una sola vez sin importar cuantas frases haya.
+    Si varias intenciones coinciden gana la que aparece primero en el
+    archivo.
+
+    Cada intencion puede pedir un total del catalogo ("conteo"), que se
+    sirve desde los contadores del dashboard (Estadistica.contadores) en
+    lugar de un COUNT(*) por pregunta.
+    """
+
+    def __init__(self, ruta: str):
+        """
+        Args:
+            ruta (str): Ruta del archivo JSON de intenciones.
+        """
+        self.ruta = ruta
+        self._lock = threading.Lock()
+        self._intenciones: List[Dict[str, Any]] = []
+        self._automata = AhoCorasick([])
+        self._mtime: Optional[float] = None
+        self._revisado_en = 0.0
+        self._aciertos: Dict[str, int] = {}
+        self.recargar()
+
+    def recargar(self):
+        """
+        Lee y compila el archivo de intenciones.
+
+        Si el archivo no se puede leer se conserva la version anterior.
+        Las intenciones mal formadas (sin frases, con un "conteo"
+        desconocido, etc.) se omiten y se reporta el motivo.
+        """
+        try:
+            mtime = os.path.getmtime(self.ruta)
+        except OSError as e:
+            print(f"Error cargando intenciones del Chatbot: {e}")
+            return
+
+        # Se registra aunque falle, para no reintentar hasta otra edicion
+        self._mtime = mtime
+        try:
+            with open(self.ruta, encoding="utf-8") as archivo:
+                leidas = json.load(archivo)
+            if not isinstance(leidas, list):
+                raise ValueError("el archivo debe contener una lista")
+
+            intenciones = []
+            for posicion, intencion in enumerate(leidas):
+                error = _validar_intencion(intencion)
+                if error:
+                    print(
+                        f"Intencion {posicion} omitida del Chatbot: {error}"
+                    )
+                    continue
+                intenciones.append(intencion)
+
+            frases = [
+                (indice, frase.lower())
+                for indice, intencion in enumerate(intenciones)
+                for frase in intencion["frases"]
+            ]
+            automata = AhoCorasick(frases)
+        except (OSError, ValueError, KeyError, TypeError) as e:
+            print(f"Error cargando intenciones del Chatbot: {e}")
+            return
+
+        with self._lock:
+            self._intenciones = intenciones
+            self._automata = automata
+        print(f"--- Intenciones del Chatbot: {len(intenciones)} cargadas ---")
+
+    def _revisar_cambios(self):
+        """Recarga el archivo si fue modificado (como maximo cada pocos s)."""
+        ahora = time.monotonic()
+        if ahora - self._revisado_en < REVISION_SEGUNDOS:
+            return
+        self._revisado_en = ahora
+        try:
+            if os.path.getmtime(self.ruta) != self._mtime:
+                self.recargar()
+        except OSError:
+            pass
+
+    def responder(self, texto: str, db: Session) -> Optional[str]:
+        """
+        Busca una intencion en el texto y devuelve su respuesta.
+
+        Args:
+            texto (str): Texto del usuario.
+            db (Session): Sesión usada solo para refrescar los totales.
+
+        Returns:
+            str | None: Respuesta local, o None si no hubo coincidencia.
+        """
+        self._revisar_cambios()
+
+        with self._lock:
+            intenciones = self._intenciones
+            automata = self._automata
+
+        indice = automata.buscar(texto.lower().strip())
+        if indice is None:
+            return None
+
+        intencion = intenciones[indice]
+        respuesta = intencion["respuesta"]
+        if intencion.get("conteo"):
+            respuesta = respuesta.format(
+                total=contadores.obtener(db)[0][intencion["conteo"]]
+            )
+
+        with self._lock:
+            nombre = intencion["nombre"]
+            self._aciertos[nombre] = self._aciertos.get(nombre, 0) + 1
+        return respuesta
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """
+        Devuelve los aciertos por intencion.
+
+        Cada acierto es una llamada al modelo que se evito.
+        """
+        with self._lock:
+            aciertos = dict(self._aciertos)
+            total_intenciones = len(self._intenciones)
+
+        return {
+            "intenciones": total_intenciones,
+            "aciertos": aciertos,
+            "llamadas_ia_evitadas": sum(aciertos.values()),
+        }
+
+
+# Instancia global usada por el endpoint del Chatbot
+motor = MotorIntenciones(RUTA_INTENCIONES)
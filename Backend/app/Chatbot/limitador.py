@@ -0,0 +1,291 @@
+import json
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+
+from fastapi import Request
+from sqlalchemy.orm import Session
+
+from app.Usuarios import modelos as user_models
+
+# Ventana de tiempo del limite (en horas)
+VENTANA_TIEMPO_HORAS = float(os.getenv("CHATBOT_VENTANA_HORAS", "2"))
+
+# Preguntas permitidas por ventana segun el rol del usuario
+LIMITES_POR_ROL = {
+    "student": int(os.getenv("CHATBOT_LIMITE_ESTUDIANTE", "150")),
+    "admin": int(os.getenv("CHATBOT_LIMITE_ADMIN", "1000")),
+}
+
+# Limite para invitados (sin user_id), contado por direccion IP
+LIMITE_INVITADO = int(os.getenv("CHATBOT_LIMITE_INVITADO", "30"))
+
+# Archivo opcional donde se guardan los contadores al apagar el servidor
+# para no reiniciar las cuotas en cada despliegue. Vacio = solo memoria.
+RUTA_CONTADORES = os.getenv("CHATBOT_LIMITES_ARCHIVO", "")
+
+# Vigencia del rol de un usuario en cache
+ROL_TTL_SEGUNDOS = 300
+
+# Usuarios cuyo rol se guarda en cache (expulsion LRU)
+MAX_ROLES_EN_CACHE = int(os.getenv("CHATBOT_ROLES_CACHE", "10000"))
+
+# Proxies de confianza delante del servidor (p. ej. 1 en Koyeb). Con 0 se
+# ignora X-Forwarded-For, que el cliente puede falsificar.
+PROXIES_CONFIABLES = int(os.getenv("CHATBOT_PROXIES_CONFIABLES", "0"))
+
+# Cada cuantas consultas se eliminan los contadores vencidos
+CONSULTAS_ENTRE_LIMPIEZAS = 1000
+
+
+@dataclass
+class Cuota:
+    """
+    Resultado de consultar el limite de una clave.
+
+    Atributos:
+        permitido (bool): Si la pregunta se puede atender.
+        limite (int): Preguntas permitidas por ventana.
+        restantes (int): Preguntas que quedan en la ventana.
+        reinicio (int): Segundos hasta que termina la ventana actual.
+    """
+    permitido: bool
+    limite: int
+    restantes: int
+    reinicio: int
+
+    def encabezados(self) -> Dict[str, str]:
+        """Encabezados HTTP con la cuota restante."""
+        return {
+            "X-RateLimit-Limit": str(self.limite),
+            "X-RateLimit-Remaining": str(self.restantes),
+            "X-RateLimit-Reset": str(self.reinicio),
+        }
+
+
+class LimitadorVentana:
+    """
+    Limitador de tasa con ventana deslizante aproximada.
+
+    Por cada clave (usuario o IP) se guardan solo dos contadores: el de
+    la ventana fija actual y el de la anterior. El uso estimado es el
+    contador actual mas la parte de la ventana anterior que aun cae
+    dentro de la ventana deslizante, de modo que cada consulta es O(1)
+    y no requiere contar filas del historial.
+    """
+
+    def __init__(self, ventana_segundos: float):
+        """
+        Args:
+            ventana_segundos (float): Duracion de la ventana.
+        """
+        self.ventana = ventana_segundos
+        self._lock = threading.Lock()
+        # clave -> [numero de ventana, contador actual, contador anterior]
+        self._contadores: Dict[str, list] = {}
+        self._consultas = 0
+
+    def _estado(self, clave: str, ahora: float) -> Tuple[list, float]:
+        """Avanza los contadores de la clave a la ventana actual."""
+        numero = int(ahora // self.ventana)
+        estado = self._contadores.get(clave)
+        if estado is None:
+            estado = [numero, 0, 0]
+            self._contadores[clave] = estado
+        elif estado[0] != numero:
+            anterior = estado[1] if estado[0] == numero - 1 else 0
+            estado[:] = [numero, 0, anterior]
+
+        transcurrido = (ahora - numero * self.ventana) / self.ventana
+        usados = estado[1] + estado[2] * (1 - transcurrido)
+        return estado, usados
+
+    def consumir(self, clave: str, limite: int) -> Cuota:
+        """
+        Registra una pregunta si la clave no ha alcanzado su limite.
+
+        Args:
+            clave (str): Identificador del usuario o invitado.
+            limite (int): Preguntas permitidas por ventana.
+
+        Returns:
+            Cuota: Si se permitio y cuantas preguntas quedan.
+        """
+        ahora = time.time()
+        with self._lock:
+            self._consultas += 1
+            if self._consultas % CONSULTAS_ENTRE_LIMPIEZAS == 0:
+                self._limpiar(ahora)
+
+            estado, usados = self._estado(clave, ahora)
+            permitido = usados + 1 <= limite
+            if permitido:
+                estado[1] += 1
+                usados += 1
+
+        reinicio = math.ceil(self.ventana - ahora % self.ventana)
+        return Cuota(
+            permitido=permitido,
+            limite=limite,
+            restantes=max(0, math.floor(limite - usados)),
+            reinicio=reinicio
+        )
+
+    def _limpiar(self, ahora: float):
+        """Elimina las claves sin actividad en las dos ultimas ventanas."""
+        numero = int(ahora // self.ventana)
+        vencidas = [
+            clave for clave, estado in self._contadores.items()
+            if estado[0] < numero - 1
+        ]
+        for clave in vencidas:
+            del self._contadores[clave]
+
+    def guardar(self, ruta: str):
+        """Escribe los contadores en un archivo JSON."""
+        with self._lock:
+            datos = dict(self._contadores)
+        try:
+            temporal = f"{ruta}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump(datos, archivo)
+            os.replace(temporal, ruta)
+        except OSError as e:
+            print(f"Error guardando contadores del limitador: {e}")
+
+    def cargar(self, ruta: str):
+        """Lee los contadores guardados con guardar(), si existen."""
+        try:
+            with open(ruta, encoding="utf-8") as archivo:
+                datos = json.load(archivo)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Error cargando contadores del limitador: {e}")
+            return
+        with self._lock:
+            self._contadores.update(datos)
+            self._limpiar(time.time())
+
+
+def ip_cliente(request: Request) -> Optional[str]:
+    """
+    Direccion IP del cliente para limitar a los invitados.
+
+    Detras de PROXIES_CONFIABLES proxies se toma de X-Forwarded-For: cada
+    proxy agrega a la derecha la IP de quien le envio la peticion, asi
+    que el cliente es la entrada numero PROXIES_CONFIABLES desde la
+    derecha. Las entradas mas a la izquierda las puede inventar el
+    cliente y se ignoran.
+
+    Args:
+        request (Request): Peticion HTTP.
+
+    Returns:
+        str | None: IP del cliente, o None si no se conoce.
+    """
+    if PROXIES_CONFIABLES > 0:
+        reenviadas = [
+            ip.strip()
+            for ip in request.headers.get("x-forwarded-for", "").split(",")
+            if ip.strip()
+        ]
+        if len(reenviadas) >= PROXIES_CONFIABLES:
+            return reenviadas[-PROXIES_CONFIABLES]
+    return request.client.host if request.client else None
+
+
+class LimitadorChatbot:
+    """
+    Limites de preguntas del Chatbot por rol y para invitados.
+
+    El rol de cada usuario se guarda en un cache LRU con TTL para no
+    consultarlo en cada pregunta. Un user_id que no existe se limita
+    como invitado (por IP), para que inventar IDs no de cuotas nuevas.
+
+    Los contadores viven en la memoria de cada proceso: con varios
+    workers de uvicorn cada uno lleva su propia cuenta, y el limite
+    efectivo se multiplica por el numero de workers.
+    """
+
+    def __init__(self):
+        self.limitador = LimitadorVentana(VENTANA_TIEMPO_HORAS * 3600)
+        self._lock = threading.Lock()
+        # user_id -> (rol o None si no existe, momento de lectura)
+        self._roles: "OrderedDict[int, Tuple[Optional[str], float]]" = (
+            OrderedDict()
+        )
+
+    def _rol(self, user_id: int, db: Session) -> Optional[str]:
+        """Devuelve el rol del usuario, o None si no existe (cache)."""
+        ahora = time.monotonic()
+        with self._lock:
+            guardado = self._roles.get(user_id)
+            if guardado is not None and (
+                ahora - guardado[1] < ROL_TTL_SEGUNDOS
+            ):
+                self._roles.move_to_end(user_id)
+                return guardado[0]
+
+        fila = db.query(user_models.User.role).filter(
+            user_models.User.id == user_id
+        ).first()
+        rol = fila.role if fila else None
+        with self._lock:
+            self._roles[user_id] = (rol, ahora)
+            self._roles.move_to_end(user_id)
+            while len(self._roles) > MAX_ROLES_EN_CACHE:
+                self._roles.popitem(last=False)
+        return rol
+
+    def verificar(
+        self, user_id: Optional[int], ip: Optional[str], db: Session
+    ) -> Cuota:
+        """
+        Consume una pregunta de la cuota del usuario o del invitado.
+
+        Args:
+            user_id (int | None): ID del usuario; None o 0 si es invitado.
+                Si no existe en la BD tambien se trata como invitado.
+            ip (str | None): Direccion del cliente (para invitados).
+            db (Session): Sesión usada solo si el rol no esta en cache.
+
+        Returns:
+            Cuota: Si se permite la pregunta y la cuota restante.
+        """
+        rol = self._rol(user_id, db) if user_id else None
+        if rol is None:
+            return self.limitador.consumir(
+                f"ip:{ip or 'desconocida'}", LIMITE_INVITADO
+            )
+
+        limite = LIMITES_POR_ROL.get(rol, LIMITES_POR_ROL["student"])
+        return self.limitador.consumir(f"user:{user_id}", limite)
+
+
+# Instancia global usada por el endpoint del Chatbot
+limitador = LimitadorChatbot()
+
+
+def cargar_contadores():
+    """
+    Restaura los contadores guardados (si hay archivo configurado).
+
+    Debe llamarse en el evento 'startup' de la aplicacion.
+    """
+    if RUTA_CONTADORES:
+        limitador.limitador.cargar(RUTA_CONTADORES)
+
+
+def guardar_contadores():
+    """
+    Guarda los contadores (si hay archivo configurado).
+
+    Debe llamarse en el evento 'shutdown' de la aplicacion.
+    """
+    if RUTA_CONTADORES:
+        limitador.limitador.guardar(RUTA_CONTADORES)
@@ -1,5 +1,8 @@
 from datetime import datetime
-from sqlalchemy import Column, DateTime, ForeignKey, Integer, String, Text
+from sqlalchemy import (
+    Column, Date, DateTime, ForeignKey, Index, Integer, String, Text
+)
+from sqlalchemy.dialects.mysql import LONGTEXT
 from sqlalchemy.orm import relationship
 from app.database import Base
 
@@ -19,6 +22,11 @@ class HistorialChat(Base):
         timestamp (datetime): Fecha y hora de creacion (UTC).
     """
     __tablename__ = "historial_chat"
+    # Indice compuesto para leer los mensajes de un usuario por fecha
+    # (historial y retencion). Ver app.Chatbot.retencion.
+    __table_args__ = (
+        Index("ix_historial_chat_user_timestamp", "user_id", "timestamp"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     # Relacion con la tabla de usuarios (users.id)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -31,3 +39,29 @@ class HistorialChat(Base):
     # Relacion ORM para acceder al objeto User desde el historial.
     # Se usa string para evitar importaciones circulares.
     usuario = relationship("app.Usuarios.modelos.User")
+
+
+class HistorialChatArchivo(Base):
+    """
+    Modelo de Base de Datos para el historial de chat archivado.
+
+    Los mensajes antiguos de 'historial_chat' se compactan aqui: una fila
+    por usuario y dia con los mensajes en JSON, en lugar de una fila por
+    mensaje. El Chatbot no lee esta tabla.
+
+    Atributos:
+        id (int): Identificador unico del registro.
+        user_id (int): Usuario propietario de los mensajes.
+        fecha (date): Dia en que se enviaron los mensajes.
+        total_mensajes (int): Numero de mensajes archivados.
+        mensajes_json (str): Mensajes (rol, contenido y fecha) en JSON.
+        archivado (datetime): Fecha en que se archivaron (UTC).
+    """
+    __tablename__ = "historial_chat_archivo"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), index=True)
+    fecha = Column(Date, nullable=False, index=True)
+    total_mensajes = Column(Integer, default=0, nullable=False)
+    # Se usa LONGTEXT porque un dia de conversacion puede superar 64 KB
+    mensajes_json = Column(LONGTEXT, nullable=False)
+    archivado = Column(DateTime, default=datetime.utcnow)
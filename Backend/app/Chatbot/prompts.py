@@ -0,0 +1,225 @@
+import os
+import threading
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Sequence
+
+from app.cliente_ia import estimar_tokens
+
+# Tokens maximos (estimados) del prompt completo. Acota el costo y la
+# latencia de cada pregunta, muy por debajo del contexto del modelo.
+PRESUPUESTO_PROMPT_TOKENS = int(os.getenv("CHATBOT_PROMPT_TOKENS", "4000"))
+
+# Parte del presupuesto libre que puede usar el historial cuando tambien
+# hay fragmentos de referencia (el resto es para los fragmentos)
+FRACCION_HISTORIAL = 0.25
+
+# Tokens maximos de la pregunta del usuario (textos pegados muy largos)
+MAX_PREGUNTA_TOKENS = int(os.getenv("CHATBOT_PREGUNTA_TOKENS", "500"))
+
+# Prompts recientes usados para los percentiles de tokens
+MUESTRAS_PROMPTS = 500
+
+ENCABEZADO_HISTORIAL = "\n--- HISTORIAL DE CONVERSACION RECIENTE ---\n"
+FIN_HISTORIAL = "--- FIN DEL HISTORIAL ---\n"
+ENCABEZADO_REFERENCIAS = "INFORMACIÓN DE REFERENCIA:\n"
+
+
+@dataclass
+class PromptArmado:
+    """
+    Prompt listo para enviarse al modelo.
+
+    Atributos:
+        texto (str): Prompt completo.
+        tokens (int): Tokens estimados del prompt.
+        tokens_por_seccion (Dict): Tokens de sistema, historial,
+            referencias y pregunta.
+        descartados (Dict): Mensajes de historial y fragmentos que no
+            cupieron en el presupuesto.
+    """
+    texto: str
+    tokens: int
+    tokens_por_seccion: Dict[str, int] = field(default_factory=dict)
+    descartados: Dict[str, int] = field(default_factory=dict)
+
+
+def recortar(texto: str, max_tokens: int) -> str:
+    """Recorta un texto a max_tokens (estimados)."""
+    max_caracteres = max_tokens * 4
+    if len(texto) <= max_caracteres:
+        return texto
+    return texto[:max_caracteres].rstrip() + "..."
+
+
+def _linea_historial(mensaje: Dict[str, Any]) -> str:
+    rol = "Usuario" if mensaje["role"] == "user" else "Asistente"
+    return f"{rol}: {mensaje['content']}\n"
+
+
+def _linea_fragmento(fragmento: Dict[str, Any]) -> str:
+    return f"--- {fragmento['titulo']} ---\n{fragmento['texto']}\n"
+
+
+def armar_prompt(
+    sistema: str,
+    pregunta: str,
+    historial: Sequence[Dict[str, Any]] = (),
+    fragmentos: Optional[Sequence[Dict[str, Any]]] = None,
+    presupuesto: int = PRESUPUESTO_PROMPT_TOKENS
+) -> PromptArmado:
+    """
+    Arma el prompt del Chatbot respetando un presupuesto de tokens.
+
+    El texto de sistema y la pregunta siempre se incluyen. El resto del
+    presupuesto se reparte entre el historial (hasta FRACCION_HISTORIAL
+    si hay fragmentos) y los fragmentos de referencia. Lo que no cabe se
+    descarta empezando por lo de menor valor: los mensajes mas antiguos
+    del historial y los fragmentos peor clasificados. Si ni el mensaje
+    mas reciente cabe, se incluye recortado.
+
+    Args:
+        sistema (str): Instrucciones iniciales del prompt.
+        pregunta (str): Pregunta del usuario e instruccion final.
+        historial (List[Dict]): Mensajes recientes, del mas antiguo al
+            mas reciente.
+        fragmentos (List[Dict] | None): Fragmentos ordenados por
+            relevancia. None si el prompt no lleva referencias.
+        presupuesto (int): Tokens maximos (estimados) del prompt.
+
+    Returns:
+        PromptArmado: Texto del prompt y su desglose de tokens.
+    """
+    tokens_sistema = estimar_tokens(sistema)
+    tokens_pregunta = estimar_tokens(pregunta)
+    libre = presupuesto - tokens_sistema - tokens_pregunta
+    if fragmentos is not None:
+        libre -= estimar_tokens(ENCABEZADO_REFERENCIAS)
+
+    # Historial: del mensaje mas reciente al mas antiguo
+    limite_historial = libre
+    if fragmentos:
+        limite_historial = int(libre * FRACCION_HISTORIAL)
+    lineas_historial: List[str] = []
+    usados_historial = estimar_tokens(ENCABEZADO_HISTORIAL + FIN_HISTORIAL)
+    for mensaje in reversed(historial):
+        linea = _linea_historial(mensaje)
+        costo = estimar_tokens(linea)
+        if usados_historial + costo > limite_historial:
+            if not lineas_historial:
+                # Ni el mensaje mas reciente cabe (p. ej. una respuesta
+                # muy larga): se recorta en lugar de perder todo el
+                # contexto de la conversacion
+                restante = (
+                    limite_historial - usados_historial
+                    - estimar_tokens(_linea_historial(
+                        dict(mensaje, content="")
+                    )) - 1
+                )
+                if restante > 0:
+                    linea = _linea_historial(dict(
+                        mensaje, content=recortar(
+                            mensaje["content"], restante
+                        )
+                    ))
+                    lineas_historial.append(linea)
+                    usados_historial += estimar_tokens(linea)
+            break
+        lineas_historial.append(linea)
+        usados_historial += costo
+    lineas_historial.reverse()
+
+    texto_historial = ""
+    tokens_historial = 0
+    if lineas_historial:
+        texto_historial = (
+            ENCABEZADO_HISTORIAL + "".join(lineas_historial) + FIN_HISTORIAL
+        )
+        tokens_historial = estimar_tokens(texto_historial)
+
+    # Referencias: en orden de relevancia; se saltan las que no caben
+    partes = [sistema, texto_historial, "\n"]
+    tokens_referencias = 0
+    fragmentos_incluidos = 0
+    if fragmentos is not None:
+        disponible = libre - tokens_historial
+        contexto = []
+        for fragmento in fragmentos:
+            linea = _linea_fragmento(fragmento)
+            costo = estimar_tokens(linea)
+            if tokens_referencias + costo > disponible:
+                continue
+            contexto.append(linea)
+            tokens_referencias += costo
+        fragmentos_incluidos = len(contexto)
+        partes += [ENCABEZADO_REFERENCIAS, "".join(contexto), "\n"]
+    partes.append(pregunta)
+
+    texto = "".join(partes)
+    return PromptArmado(
+        texto=texto,
+        tokens=estimar_tokens(texto),
+        tokens_por_seccion={
+            "sistema": tokens_sistema,
+            "historial": tokens_historial,
+            "referencias": tokens_referencias,
+            "pregunta": tokens_pregunta,
+        },
+        descartados={
+            "historial": len(historial) - len(lineas_historial),
+            "fragmentos": len(fragmentos or ()) - fragmentos_incluidos,
+        }
+    )
+
+
+class EstadisticasPrompts:
+    """Tokens de los prompts enviados por el Chatbot."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = deque(maxlen=MUESTRAS_PROMPTS)
+        self.estadisticas = {
+            "prompts": 0,
+            "tokens_total": 0,
+            "tokens_max": 0,
+            "mensajes_historial_descartados": 0,
+            "fragmentos_descartados": 0,
+        }
+
+    def registrar(self, prompt: PromptArmado):
+        """Registra los tokens de un prompt enviado al modelo."""
+        with self._lock:
+            self._tokens.append(prompt.tokens)
+            self.estadisticas["prompts"] += 1
+            self.estadisticas["tokens_total"] += prompt.tokens
+            self.estadisticas["tokens_max"] = max(
+                self.estadisticas["tokens_max"], prompt.tokens
+            )
+            self.estadisticas["mensajes_historial_descartados"] += (
+                prompt.descartados.get("historial", 0)
+            )
+            self.estadisticas["fragmentos_descartados"] += (
+                prompt.descartados.get("fragmentos", 0)
+            )
+
+    def obtener_estadisticas(self) -> Dict[str, Any]:
+        """Devuelve totales y percentiles de tokens por prompt."""
+        with self._lock:
+            datos = dict(self.estadisticas)
+            muestras = sorted(self._tokens)
+
+        datos["tokens_promedio"] = (
+            round(datos["tokens_total"] / datos["prompts"])
+            if datos["prompts"] else 0
+        )
+        for nombre, p in (("p50", 0.5), ("p95", 0.95)):
+            datos[f"tokens_{nombre}"] = (
+                muestras[min(len(muestras) - 1, int(p * len(muestras)))]
+                if muestras else 0
+            )
+        datos["presupuesto"] = PRESUPUESTO_PROMPT_TOKENS
+        return datos
+
+
+# Instancia global usada por el endpoint del Chatbot
+estadisticas = EstadisticasPrompts()
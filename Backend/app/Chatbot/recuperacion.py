@@ -0,0 +1,344 @@
+import json
+import math
+import os
+import shutil
+import threading
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session, undefer
+
+from app.Chatbot.cache_respuestas import normalizar_pregunta
+from app.database import SessionLocal
+from app.Porta_Estudio import modelos as study_models
+
+# Carpeta donde se guarda un indice por materia (JSON). En produccion
+# debe apuntar al volumen persistente (p. ej. /workspace/indices); por
+# defecto se usa Backend/indices.
+INDICE_DIR = os.getenv(
+    "INDICE_RECURSOS_DIR",
+    os.path.join(
+        os.path.dirname(os.path.dirname(os.path.dirname(__file__))),
+        "indices"
+    )
+)
+
+# Tamaño aproximado de cada fragmento y traslape entre fragmentos
+TAMANO_FRAGMENTO = 800
+TRASLAPE_FRAGMENTO = 100
+
+# Fragmentos que se envian al modelo por pregunta
+FRAGMENTOS_POR_PREGUNTA = int(os.getenv("CHATBOT_FRAGMENTOS", "5"))
+
+# Parametros de BM25
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+try:
+    os.makedirs(INDICE_DIR, exist_ok=True)
+except Exception as e:
+    print(f"Error creando INDICE_DIR: {e}")
+
+
+def _terminos(texto: str) -> List[str]:
+    """Palabras relevantes de un texto, normalizadas."""
+    return [t for t in normalizar_pregunta(texto).split() if len(t) > 2]
+
+
+def fragmentar(texto: str) -> List[str]:
+    """
+    Divide un texto en fragmentos de ~TAMANO_FRAGMENTO caracteres.
+
+    Los cortes se hacen en espacios y cada fragmento repite el final del
+    anterior (TRASLAPE_FRAGMENTO) para no partir ideas a la mitad.
+
+    Args:
+        texto (str): Contenido extraido de un recurso.
+
+    Returns:
+        List[str]: Fragmentos no vacios, en orden.
+    """
+    texto = " ".join(texto.split())
+    fragmentos = []
+    inicio = 0
+    while inicio < len(texto):
+        fin = min(len(texto), inicio + TAMANO_FRAGMENTO)
+        if fin < len(texto):
+            espacio = texto.rfind(" ", inicio + TAMANO_FRAGMENTO // 2, fin)
+            if espacio != -1:
+                fin = espacio
+        fragmentos.append(texto[inicio:fin].strip())
+        if fin >= len(texto):
+            break
+        inicio = max(inicio + 1, fin - TRASLAPE_FRAGMENTO)
+    return [f for f in fragmentos if f]
+
+
+class _IndiceMateria:
+    """
+    Indice BM25 de los fragmentos de los recursos de una materia.
+
+    No se modifica despues de construirse: para agregar fragmentos se
+    crea uno nuevo, asi las busquedas en curso no ven uno a medias.
+    """
+
+    def __init__(self, fragmentos: List[Dict[str, Any]], mtime: float = 0.0):
+        """
+        Args:
+            fragmentos (List[Dict]): recurso_id, titulo, texto y
+                frecuencias ('tf') de cada fragmento.
+            mtime (float): Fecha de modificacion del archivo cargado.
+        """
+        self.fragmentos = fragmentos
+        self.mtime = mtime
+        self._construir()
+
+    def _construir(self):
+        """Calcula la lista invertida y las longitudes de los fragmentos."""
+        self.postings: Dict[str, List[tuple]] = {}
+        self.largos = []
+        for i, fragmento in enumerate(self.fragmentos):
+            self.largos.append(sum(fragmento["tf"].values()))
+            for termino, frecuencia in fragmento["tf"].items():
+                self.postings.setdefault(termino, []).append((i, frecuencia))
+        self.largo_promedio = (
+            sum(self.largos) / len(self.largos) if self.largos else 0.0
+        )
+
+    def buscar(self, pregunta: str, k: int) -> List[Dict[str, Any]]:
+        """
+        Devuelve los k fragmentos con mayor puntaje BM25.
+
+        Args:
+            pregunta (str): Pregunta del usuario.
+            k (int): Numero de fragmentos a devolver.
+        """
+        total = len(self.fragmentos)
+        puntajes: Dict[int, float] = {}
+        for termino in set(_terminos(pregunta)):
+            postings = self.postings.get(termino)
+            if not postings:
+                continue
+            idf = math.log(
+                1 + (total - len(postings) + 0.5) / (len(postings) + 0.5)
+            )
+            for i, frecuencia in postings:
+                norma = BM25_K1 * (
+                    1 - BM25_B
+                    + BM25_B * self.largos[i] / (self.largo_promedio or 1)
+                )
+                puntajes[i] = puntajes.get(i, 0.0) + idf * (
+                    frecuencia * (BM25_K1 + 1) / (frecuencia + norma)
+                )
+
+        mejores = sorted(puntajes, key=lambda i: (-puntajes[i], i))[:k]
+        return [self.fragmentos[i] for i in mejores]
+
+    def primeros(self, k: int) -> List[Dict[str, Any]]:
+        """
+        Primer fragmento de hasta k recursos distintos.
+
+        Se usa cuando la pregunta no comparte palabras con ningun
+        fragmento (p. ej. "explicame el tema").
+        """
+        vistos = set()
+        elegidos = []
+        for fragmento in self.fragmentos:
+            if fragmento["recurso_id"] in vistos:
+                continue
+            vistos.add(fragmento["recurso_id"])
+            elegidos.append(fragmento)
+            if len(elegidos) >= k:
+                break
+        return elegidos
+
+
+def _fragmentos_de_recurso(recurso) -> List[Dict[str, Any]]:
+    """Fragmenta el contenido de un recurso para el indice."""
+    fragmentos = []
+    for texto in fragmentar(recurso.content_text or ""):
+        tf: Dict[str, int] = {}
+        for termino in _terminos(texto):
+            tf[termino] = tf.get(termino, 0) + 1
+        fragmentos.append({
+            "recurso_id": recurso.id,
+            "titulo": recurso.title,
+            "texto": texto,
+            "tf": tf,
+        })
+    return fragmentos
+
+
+class IndiceRecursos:
+    """
+    Recuperacion de fragmentos relevantes de los recursos de estudio.
+
+    El contenido de cada recurso se fragmenta al subirlo y se agrega al
+    indice BM25 de su materia, que se guarda en disco (un JSON por
+    materia). El Chatbot pide solo los fragmentos relevantes para la
+    pregunta en lugar de leer el texto completo de todos los recursos.
+
+    Si el archivo de una materia no existe (p. ej. recursos anteriores a
+    este indice) se construye desde la base de datos al primer uso. Si
+    otro proceso lo actualiza, se recarga al detectar el cambio.
+
+    Cada materia tiene su propio lock para cargar, construir y escribir
+    su indice, de modo que construir una materia grande no detiene las
+    preguntas de las demas.
+    """
+
+    def __init__(self, carpeta: str):
+        """
+        Args:
+            carpeta (str): Carpeta donde se guardan los indices.
+        """
+        self.carpeta = carpeta
+        # Protege solo los diccionarios; nunca se retiene al construir
+        self._lock = threading.Lock()
+        self._indices: Dict[int, _IndiceMateria] = {}
+        self._locks: Dict[int, threading.Lock] = {}
+
+    def _ruta(self, materia_id: int) -> str:
+        return os.path.join(self.carpeta, f"materia_{materia_id}.json")
+
+    def _lock_materia(self, materia_id: int) -> threading.Lock:
+        """Devuelve el lock de una materia, creandolo si no existe."""
+        with self._lock:
+            return self._locks.setdefault(materia_id, threading.Lock())
+
+    def _mtime(self, materia_id: int) -> Optional[float]:
+        """Fecha de modificacion del archivo de la materia (o None)."""
+        try:
+            return os.path.getmtime(self._ruta(materia_id))
+        except OSError:
+            return None
+
+    def _guardar(self, materia_id: int, indice: _IndiceMateria):
+        """Escribe el indice en disco de forma atomica."""
+        ruta = self._ruta(materia_id)
+        try:
+            # Temporal por proceso: otro worker puede escribir a la vez
+            temporal = f"{ruta}.{os.getpid()}.tmp"
+            with open(temporal, "w", encoding="utf-8") as archivo:
+                json.dump(
+                    {"fragmentos": indice.fragmentos},
+                    archivo,
+                    ensure_ascii=False
+                )
+            os.replace(temporal, ruta)
+            indice.mtime = os.path.getmtime(ruta)
+        except OSError as e:
+            print(f"Error guardando indice de la materia {materia_id}: {e}")
+
+    def _cargar_de_disco(self, materia_id: int) -> Optional[_IndiceMateria]:
+        """Lee el indice de una materia si existe en disco."""
+        ruta = self._ruta(materia_id)
+        try:
+            mtime = os.path.getmtime(ruta)
+            with open(ruta, encoding="utf-8") as archivo:
+                datos = json.load(archivo)
+            return _IndiceMateria(datos["fragmentos"], mtime)
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def _construir_de_bd(self, materia_id: int, db: Session) -> _IndiceMateria:
+        """Fragmenta todos los recursos de una materia desde la BD."""
+        recursos = db.query(study_models.Resource).options(
+            undefer(study_models.Resource.content_text)
+        ).filter(
+            study_models.Resource.materia_id == materia_id
+        ).order_by(study_models.Resource.id).all()
+
+        fragmentos = []
+        for recurso in recursos:
+            fragmentos.extend(_fragmentos_de_recurso(recurso))
+        indice = _IndiceMateria(fragmentos)
+        self._guardar(materia_id, indice)
+        return indice
+
+    def _obtener(self, materia_id: int, db: Session) -> _IndiceMateria:
+        """Devuelve el indice de la materia, cargandolo si hace falta."""
+        with self._lock_materia(materia_id):
+            indice = self._indices.get(materia_id)
+            mtime = self._mtime(materia_id)
+            if indice is not None and (mtime is None or mtime == indice.mtime):
+                return indice
+
+            indice = self._cargar_de_disco(materia_id)
+            if indice is None:
+                indice = self._construir_de_bd(materia_id, db)
+            with self._lock:
+                self._indices[materia_id] = indice
+            return indice
+
+    def agregar_recursos(self, materia_id: int, recursos: List[Any]):
+        """
+        Agrega recursos recien creados al indice de su materia.
+
+        Antes de escribir se vuelve a leer el archivo si otro proceso lo
+        modifico, para conservar los recursos que ese proceso agrego.
+
+        Args:
+            materia_id (int): Materia de los recursos.
+            recursos (List[Resource]): Recursos ya guardados (con ID).
+        """
+        fragmentos = []
+        for recurso in recursos:
+            fragmentos.extend(_fragmentos_de_recurso(recurso))
+
+        db = SessionLocal()
+        try:
+            # Se asegura que el indice incluya tambien los recursos previos
+            indice = self._obtener(materia_id, db)
+        finally:
+            db.close()
+
+        with self._lock_materia(materia_id):
+            indice = self._indices.get(materia_id, indice)
+            if self._mtime(materia_id) != indice.mtime:
+                indice = self._cargar_de_disco(materia_id) or indice
+
+            ids_indexados = {f["recurso_id"] for f in indice.fragmentos}
+            nuevos = [
+                f for f in fragmentos if f["recurso_id"] not in ids_indexados
+            ]
+            if nuevos:
+                indice = _IndiceMateria(indice.fragmentos + nuevos)
+                self._guardar(materia_id, indice)
+            with self._lock:
+                self._indices[materia_id] = indice
+
+    def buscar(
+        self,
+        materia_id: int,
+        pregunta: str,
+        db: Session,
+        k: int = FRAGMENTOS_POR_PREGUNTA
+    ) -> List[Dict[str, Any]]:
+        """
+        Devuelve los fragmentos mas relevantes para la pregunta.
+
+        Args:
+            materia_id (int): Materia de la conversacion.
+            pregunta (str): Pregunta del usuario.
+            db (Session): Sesión usada solo si hay que construir el indice.
+            k (int): Numero maximo de fragmentos.
+
+        Returns:
+            List[Dict]: Fragmentos con 'titulo' y 'texto'.
+        """
+        indice = self._obtener(materia_id, db)
+        return indice.buscar(pregunta, k) or indice.primeros(k)
+
+    def limpiar(self):
+        """Elimina todos los indices (al borrar todos los recursos)."""
+        with self._lock:
+            self._indices.clear()
+            try:
+                shutil.rmtree(self.carpeta)
+                os.makedirs(self.carpeta, exist_ok=True)
+            except OSError as e:
+                print(f"Error limpiando indices de recursos: {e}")
+
+
+# Instancia global compartida por el Chatbot y el Portal de Estudio
+indice = IndiceRecursos(INDICE_DIR)
@@ -0,0 +1,214 @@
+import asyncio
+import json
+import os
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import delete, insert, inspect, select
+from sqlalchemy.orm import Session
+
+from app.Chatbot.modelos import HistorialChat, HistorialChatArchivo
+from app.database import SessionLocal, engine
+from app.Usuarios import modelos as user_models
+
+# Dias que los mensajes permanecen en 'historial_chat'. Despues se
+# compactan en 'historial_chat_archivo'.
+DIAS_HISTORIAL_ACTIVO = int(os.getenv("CHATBOT_HISTORIAL_DIAS", "30"))
+
+# Dias que se conserva el archivo segun el rol del usuario (0 = siempre).
+# Los roles que no aparecen usan la politica de 'student'.
+DIAS_ARCHIVO_POR_ROL = {
+    "student": int(os.getenv("CHATBOT_ARCHIVO_DIAS_ESTUDIANTE", "365")),
+    "admin": int(os.getenv("CHATBOT_ARCHIVO_DIAS_ADMIN", "0")),
+}
+
+# Mensajes que se compactan por transaccion (evita bloqueos largos)
+LOTE_COMPACTACION = int(os.getenv("CHATBOT_RETENCION_LOTE", "5000"))
+
+# Cada cuantas horas se ejecuta la retencion en segundo plano
+INTERVALO_RETENCION_HORAS = float(
+    os.getenv("CHATBOT_RETENCION_HORAS", "24")
+)
+
+_tarea: Optional[asyncio.Task] = None
+
+
+def asegurar_indices():
+    """
+    Crea los indices de 'historial_chat' que falten.
+
+    create_all() solo crea tablas nuevas, por lo que en una base de
+    datos existente el indice compuesto (user_id, timestamp) se agrega
+    aqui. Debe llamarse al iniciar la aplicacion.
+    """
+    try:
+        existentes = {
+            indice["name"]
+            for indice in inspect(engine).get_indexes(
+                HistorialChat.__tablename__
+            )
+        }
+        for indice in HistorialChat.__table__.indexes:
+            if indice.name not in existentes:
+                print(f"--- Creando indice {indice.name} ---")
+                indice.create(bind=engine)
+    except Exception as e:
+        print(f"Error creando indices del historial: {e}")
+
+
+def compactar(db: Session, dias: int = DIAS_HISTORIAL_ACTIVO) -> int:
+    """
+    Mueve los mensajes antiguos al archivo, agrupados por usuario y dia.
+
+    Se procesa por lotes (cada uno en su propia transaccion) en orden de
+    ID, de modo que los mensajes mas viejos se leen primero del inicio
+    de la tabla.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        dias (int): Antiguedad minima de los mensajes a compactar.
+
+    Returns:
+        int: Numero de mensajes archivados.
+    """
+    corte = datetime.utcnow() - timedelta(days=dias)
+    total = 0
+
+    while True:
+        filas = db.execute(
+            select(
+                HistorialChat.id,
+                HistorialChat.user_id,
+                HistorialChat.role,
+                HistorialChat.content,
+                HistorialChat.timestamp
+            ).where(
+                HistorialChat.timestamp < corte
+            ).order_by(HistorialChat.id).limit(LOTE_COMPACTACION)
+        ).all()
+        if not filas:
+            break
+
+        grupos: Dict[tuple, List[dict]] = {}
+        for fila in filas:
+            clave = (fila.user_id, fila.timestamp.date())
+            grupos.setdefault(clave, []).append({
+                "role": fila.role,
+                "content": fila.content,
+                "timestamp": fila.timestamp.isoformat(),
+            })
+
+        try:
+            db.execute(insert(HistorialChatArchivo), [
+                {
+                    "user_id": user_id,
+                    "fecha": fecha,
+                    "total_mensajes": len(mensajes),
+                    "mensajes_json": json.dumps(
+                        mensajes, ensure_ascii=False
+                    ),
+                    "archivado": datetime.utcnow(),
+                }
+                for (user_id, fecha), mensajes in grupos.items()
+            ])
+            db.execute(delete(HistorialChat).where(
+                HistorialChat.id.in_([fila.id for fila in filas])
+            ))
+            db.commit()
+        except Exception:
+            db.rollback()
+            raise
+
+        total += len(filas)
+        if len(filas) < LOTE_COMPACTACION:
+            break
+
+    return total
+
+
+def purgar_archivo(db: Session) -> int:
+    """
+    Elimina del archivo los dias que superan la retencion de su rol.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+
+    Returns:
+        int: Numero de registros del archivo eliminados.
+    """
+    hoy = datetime.utcnow().date()
+    roles_con_politica = [r for r in DIAS_ARCHIVO_POR_ROL if r != "student"]
+    total = 0
+
+    for rol, dias in DIAS_ARCHIVO_POR_ROL.items():
+        if dias <= 0:
+            continue
+
+        usuarios = select(user_models.User.id)
+        if rol == "student":
+            usuarios = usuarios.where(
+                user_models.User.role.notin_(roles_con_politica)
+            )
+        else:
+            usuarios = usuarios.where(user_models.User.role == rol)
+
+        resultado = db.execute(delete(HistorialChatArchivo).where(
+            HistorialChatArchivo.fecha < hoy - timedelta(days=dias),
+            HistorialChatArchivo.user_id.in_(usuarios)
+        ))
+        total += resultado.rowcount or 0
+
+    db.commit()
+    return total
+
+
+def ejecutar_retencion() -> Dict[str, int]:
+    """
+    Compacta el historial y purga el archivo con su propia sesion.
+
+    Returns:
+        dict: Mensajes archivados y registros de archivo purgados.
+    """
+    db = SessionLocal()
+    try:
+        archivados = compactar(db)
+        purgados = purgar_archivo(db)
+    finally:
+        db.close()
+
+    if archivados or purgados:
+        print(
+            f"--- Retencion del historial: {archivados} mensajes "
+            f"archivados, {purgados} dias purgados ---"
+        )
+    return {"mensajes_archivados": archivados, "dias_purgados": purgados}
+
+
+async def _retencion_periodica():
+    """Ejecuta la retencion cada INTERVALO_RETENCION_HORAS."""
+    while True:
+        try:
+            await run_in_threadpool(ejecutar_retencion)
+        except Exception as e:
+            print(f"Error en la retencion del historial: {e}")
+        await asyncio.sleep(INTERVALO_RETENCION_HORAS * 3600)
+
+
+def iniciar_retencion():
+    """
+    Crea los indices faltantes e inicia la retencion en segundo plano.
+
+    Debe llamarse en el evento 'startup' de la aplicacion.
+    """
+    global _tarea
+    asegurar_indices()
+    _tarea = asyncio.create_task(_retencion_periodica())
+
+
+def detener_retencion():
+    """Cancela la tarea de retencion al apagar la aplicacion."""
+    global _tarea
+    if _tarea is not None:
+        _tarea.cancel()
+        _tarea = None
@@ -1,21 +1,35 @@
+import asyncio
 import json
 import os
 import re
 import time
-from datetime import datetime, timedelta
+from typing import Dict
 
-import google.generativeai as genai
 from dotenv import load_dotenv
-from fastapi import APIRouter, Depends
-from google.api_core import exceptions
-from sqlalchemy import desc
+from fastapi import APIRouter, Depends, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
 
-from app.Chatbot import esquemas
-from app.Chatbot.modelos import HistorialChat
+from app import dependencias
+from app.Chatbot import (
+    cache_respuestas,
+    esquemas,
+    historial,
+    indice_materias,
+    intenciones,
+    limitador,
+    prompts,
+    recuperacion,
+    retencion,
+)
+from app.cliente_ia import ClienteIA, ErrorIA, crear_backend
 from app.Creacion_mats_prof import modelos as main_models
-from app.database import get_db
+from app.database import SessionLocal, get_db
+from app.Estadistica.contadores import contadores
+from app.llaves_ia import PoolLlaves
 from app.Porta_Estudio import modelos as study_models
+from app.Usuarios import esquemas as user_schemas
 
 load_dotenv()
 
@@ -24,182 +38,96 @@ load_dotenv()
 # CONFIGURACION Y GESTOR DE LLAVES
 # ==========================================
 
-class KeyManager:
-    """
-    Gestor de claves de API para Google Gemini.
-    Administra la rotacion de multiples claves para evitar limites de cuota.
-    """
-
-    def __init__(self):
-        """Inicializa el gestor cargando las llaves desde el entorno."""
-        self.keys = [
-            os.getenv("GEMINI_API_KEY_4"),
-            os.getenv("GEMINI_API_KEY_5"),
-            os.getenv("GEMINI_API_KEY_6")
-        ]
-        # Filtrar claves nulas o vacias
-        self.keys = [k for k in self.keys if k]
-
-        if not self.keys:
-            single = os.getenv("GEMINI_API_KEY")
-            if single:
-                self.keys = [single]
-            else:
-                raise ValueError(
-                    "Error Critico: No hay API Keys configuradas en .env"
-                )
-        self.current_index = 0
-
-    def get_current_key(self):
-        """Devuelve la llave de API activa actualmente."""
-        return self.keys[self.current_index]
-
-    def switch_key(self):
-        """Cambia a la siguiente llave disponible en la lista (rotación)."""
-        prev = self.current_index
-        self.current_index = (self.current_index + 1) % len(self.keys)
-        print(
-            f"Chatbot: Rotando Key "
-            f"({prev + 1} -> {self.current_index + 1})..."
-        )
-        return self.get_current_key()
-
-
-key_manager = KeyManager()
-genai.configure(api_key=key_manager.get_current_key())
+# Llaves del Chatbot (GEMINI_API_KEY_4..6), separadas de las del
+# Analisis de WhatsApp para no competir por la misma cuota
+llaves = PoolLlaves(
+    "Chatbot",
+    ["GEMINI_API_KEY_4", "GEMINI_API_KEY_5", "GEMINI_API_KEY_6"]
+)
 
 AVAILABLE_MODELS = [
     'gemini-2.5-flash-lite',
     'gemini-2.5-flash'
 ]
 
+# Cliente asincrono compartido con el Analisis de WhatsApp
+cliente_ia = ClienteIA(crear_backend(), AVAILABLE_MODELS, llaves)
+
+# Respuestas de error de generate_smart (nunca se guardan en cache)
+RESPUESTA_SATURADO = "El sistema esta saturado en este momento."
+RESPUESTA_ERROR = (
+    "Lo siento, tuve un error interno al "
+    "procesar tu solicitud."
+)
+
 
 # ==========================================
 # GENERADOR INTELIGENTE (WRAPPER IA)
 # ==========================================
 
-def generate_smart(prompt: str, max_retries: int = 2) -> str:
+async def generate_smart(prompt: str, max_retries: int = 2) -> str:
     """
     Genera contenido usando Google Gemini con manejo de errores y rotacion
-    de modelos y llaves de API.
+    de modelos y llaves de API (delegados en app.cliente_ia).
     """
-    model_index = 0
-    total_attempts = max_retries * len(AVAILABLE_MODELS)
+    try:
+        respuesta = await cliente_ia.generar(prompt, max_retries=max_retries)
+        return respuesta.text
 
-    for _ in range(total_attempts):
-        try:
-            current_model_name = AVAILABLE_MODELS[model_index]
-            model = genai.GenerativeModel(current_model_name)
-            response = model.generate_content(prompt)
-            return response.text
-
-        except (exceptions.ResourceExhausted,
-                exceptions.ServiceUnavailable,
-                exceptions.InternalServerError) as e:
-            print(f"Fallo en {AVAILABLE_MODELS[model_index]}: {e}")
-
-            # Intenta cambiar de modelo primero
-            if model_index < len(AVAILABLE_MODELS) - 1:
-                model_index += 1
-                time.sleep(1)
-                continue
-            else:
-                # Si fallan los modelos, rota la API Key
-                new_key = key_manager.switch_key()
-                genai.configure(api_key=new_key)
-                model_index = 0
-                time.sleep(2)
-                continue
-
-        except Exception:
-            return (
-                "Lo siento, tuve un error interno al "
-                "procesar tu solicitud."
-            )
+    except ErrorIA:
+        return RESPUESTA_SATURADO
 
-    return "El sistema esta saturado en este momento."
+    except Exception:
+        return RESPUESTA_ERROR
 
 
 # ==========================================
 # LIMITADOR DE TASA (RATE LIMITING)
 # ==========================================
 
-LIMITE_PREGUNTAS = 150   # Maximo de preguntas permitidas
-VENTANA_TIEMPO_HORAS = 2  # Ventana de tiempo en horas
-
-
-def verificar_limite_usuario(user_id: int, db: Session) -> bool:
+def verificar_limite_usuario(
+    user_id: int, db: Session, ip: str = None
+) -> limitador.Cuota:
     """
     Verifica si el usuario ha excedido el límite de preguntas permitidas
     en una ventana de tiempo específica.
-    """
-    if not user_id:
-        return True  # Invitados no tienen limite
-
-    tiempo_limite = datetime.utcnow() - timedelta(hours=VENTANA_TIEMPO_HORAS)
-
-    cantidad = db.query(HistorialChat).filter(
-        HistorialChat.user_id == user_id,
-        HistorialChat.role == "user",
-        HistorialChat.timestamp >= tiempo_limite
-    ).count()
 
-    if cantidad >= LIMITE_PREGUNTAS:
-        return False
-
-    return True
+    Usa contadores en memoria (app.Chatbot.limitador) en lugar de contar
+    las filas del historial. Los invitados se limitan por IP.
+    """
+    return limitador.limitador.verificar(user_id, ip, db)
 
 
 # ==========================================
 # FUNCIONES DE MEMORIA
 # ==========================================
 
-def recuperar_historial(user_id: int, db: Session, limite: int = 6) -> str:
+def recuperar_historial(user_id: int, db: Session, limite: int = 6):
     """
     Recupera los últimos mensajes de la conversación del usuario
-    para mantener el contexto del chat.
+    para mantener el contexto del chat (del mas antiguo al mas
+    reciente). Se recortan al armar el prompt (app.Chatbot.prompts).
+
+    Se leen del buffer en memoria (app.Chatbot.historial); la base de
+    datos solo se consulta si el usuario no esta en memoria.
     """
     if not user_id:
-        return ""
-
-    mensajes = db.query(HistorialChat).filter(
-        HistorialChat.user_id == user_id
-    ).order_by(desc(HistorialChat.timestamp)).limit(limite).all()
-
-    mensajes = mensajes[::-1]
+        return []
 
-    texto_historial = ""
-    if mensajes:
-        texto_historial = "\n--- HISTORIAL DE CONVERSACION RECIENTE ---\n"
-        for msg in mensajes:
-            rol = "Usuario" if msg.role == "user" else "Asistente"
-            texto_historial += f"{rol}: {msg.content}\n"
-        texto_historial += "--- FIN DEL HISTORIAL ---\n"
+    return historial.buffer.recientes(user_id, limite, db)
 
-    return texto_historial
 
+def guardar_interaccion(user_id: int, pregunta: str, respuesta: str):
+    """
+    Guarda la pregunta del usuario y la respuesta de la IA.
 
-def guardar_interaccion(user_id: int, pregunta: str, respuesta: str, db: Session):
-    """Guarda la pregunta del usuario y la respuesta de la IA en la base de datos."""
+    No escribe en la base de datos en la peticion: los mensajes se
+    encolan y se guardan en bloque en segundo plano.
+    """
     if not user_id:
         return
 
-    try:
-        msg_user = HistorialChat(
-            user_id=user_id,
-            role="user",
-            content=pregunta
-        )
-        db.add(msg_user)
-        msg_bot = HistorialChat(
-            user_id=user_id,
-            role="model",
-            content=respuesta
-        )
-        db.add(msg_bot)
-        db.commit()
-    except Exception as e:
-        print(f"Error guardando historial: {e}")
+    historial.buffer.agregar(user_id, pregunta, respuesta)
 
 
 # ==========================================
@@ -210,168 +138,36 @@ def check_local_intent(text: str, db: Session):
     """
     Verifica intenciones básicas y palabras clave para proporcionar
     respuestas instantáneas sin consultar a la IA.
-    """
-    text = text.lower().strip()
-
-    # --- SALUDOS ---
-    saludos = ["hola", "buenos dias", "buenas", "que tal"]
-    if any(x in text for x in saludos):
-        return (
-            "Hola! Soy el asistente de ESCOM Review Hub. "
-            "¿En qué materia te puedo ayudar hoy?"
-        )
-
-    # --- IDENTIDAD ---
-    if "quien te creo" in text or "que es esto" in text:
-        return "Soy el asistente virtual de ESCOM Review Hub."
-
-    if "genero te identificas" in text or "cual es tu genero" in text:
-        return "Amigo, soy una IA, no tengo género ni sentimientos."
-
-    # --- ESTADISTICAS ---
-    if "cuantas materias" in text:
-        count = db.query(main_models.Materia).count()
-        return f"Tenemos {count} materias registradas."
-
-    if "cuantos profesores" in text:
-        count = db.query(main_models.Profesor).count()
-        return f"Hay {count} profesores registrados."
-
-    # --- FUNCIONALIDADES PLATAFORMA ---
-    if "subo un archivo" in text or "puedo subir un archivo" in text:
-        return (
-            "Para subir un recurso, ve a la sección del Portal "
-            "Estudiantil y selecciona la materia."
-        )
-
-    pass_keys = [
-        "cambiar contraseña", "olvidé mi contraseña", "recuperar contraseña"
-    ]
-    if any(k in text for k in pass_keys):
-        return (
-            "Puedes restablecer tu contraseña haciendo click aquí: "
-            "[LINK_RECUPERAR_PASS]"
-        )
-
-    # --- ESCOM INFO ---
-    if "justificantes" in text or "subir justificante" in text:
-        return (
-            "Puedes gestionar tu justificante en este enlace: "
-            "[LINK_JUSTIFICANTES_ESCOM]"
-        )
-
-    loc_keys = ["donde esta escom", "ubicacion de escom", "direccion"]
-    if any(k in text for k in loc_keys):
-        return (
-            "ESCOM se encuentra en Av. IPN 2580, Nueva Industrial Vallejo, "
-            "GAM, CDMX, C.P. 07738."
-        )
-
-    calif_keys = [
-        "dia calificaciones", "cuando salen las calificaciones",
-        "fecha limite calificaciones"
-    ]
-    if any(k in text for k in calif_keys):
-        return (
-            "Según el calendario, el último día del semestre 2025-2 "
-            "es el 16/01/25."
-        )
-
-    ets_keys = ["cuando son los ets", "fecha de los ets", "dia de los ets"]
-    if any(k in text for k in ets_keys):
-        return (
-            "Las fechas de ETS están en el calendario oficial. "
-            "Recuerda generar tu línea de captura en el SAES."
-        )
-
-    english_keys = ["cursos de inglés", "celex", "ingles"]
-    if any(k in text for k in english_keys):
-        return (
-            "El CELEX ESCOM ofrece cursos. Revisa su Facebook o la web "
-            "oficial para las convocatorias."
-        )
-
-    health_keys = ["me siento mal", "servicio medico", "enfermeria"]
-    if any(k in text for k in health_keys):
-        return (
-            "Puedes acudir al consultorio médico de ESCOM en el "
-            "edificio de servicios escolares."
-        )
-
-    # --- EASTER EGGS ---
-    jokes_keys = ["sentido de la vida", "chiste", "hazme reir"]
-    if any(k in text for k in jokes_keys):
-        return (
-            "El sentido de la vida es que tu código compile sin warnings. "
-            "¡Sigue estudiando!"
-        )
 
-    return None
+    Las intenciones viven en Chatbot/intenciones.json (ver
+    app.Chatbot.intenciones).
+    """
+    return intenciones.motor.responder(text, db)
 
 
 def detectar_materia_automatica(texto: str, db: Session):
     """
-    Intenta detectar el nombre de una materia dentro de un texto dado
-    usando intersección de palabras clave.
-    """
-    texto = texto.lower()
-    # Tokenizamos el texto del usuario (palabras sueltas)
-    tokens_usuario = set(re.findall(r'\w+', texto))
-
-    materias = db.query(
-        main_models.Materia.id, main_models.Materia.nombre
-    ).all()
-
-    candidato = None
-    max_matches = 0
-
-    for mat_id, mat_nombre in materias:
-        nombre_clean = mat_nombre.lower()
-
-        # 1. Coincidencia Exacta (Prioridad Maxima)
-        if nombre_clean in texto:
-            return mat_id, mat_nombre
+    Intenta detectar el nombre de una materia dentro de un texto dado.
 
-        # 2. Coincidencia por palabras (Intersección de conjuntos)
-        tokens_materia = set(re.findall(r'\w+', nombre_clean))
-        # Filtramos palabras irrelevantes cortas (de, la, i, ii)
-        tokens_importantes = {t for t in tokens_materia if len(t) > 2}
-
-        if not tokens_importantes:
-            continue
-
-        coincidencias = len(tokens_usuario.intersection(tokens_importantes))
-
-        # Necesitamos al menos una palabra relevante coincidente
-        if coincidencias > 0:
-            if coincidencias > max_matches:
-                max_matches = coincidencias
-                candidato = (mat_id, mat_nombre)
-
-    return candidato if candidato else (None, None)
+    Usa el indice en memoria de materias (coincidencia exacta del nombre
+    y luego interseccion de palabras clave) en lugar de consultar y
+    tokenizar todas las materias en cada pregunta.
+    """
+    return indice_materias.indice.buscar(texto, db)
 
 
-def generar_y_guardar_recursos_auto(
-    materia_id: int, materia_nombre: str, db: Session
-):
+def _guardar_recursos_generados(materia_id: int, json_text: str, db: Session):
     """
-    Utiliza la IA para generar sugerencias de recursos académicos
-    cuando una materia no tiene materiales registrados.
+    Interpreta el JSON generado por la IA y guarda los recursos en la BD.
     """
-    print(f"IA: Generando recursos para '{materia_nombre}'...")
-
-    prompt = (
-        f'Actúa como profesor experto de: "{materia_nombre}". '
-        'Genera 3 recursos.\n'
-        'Descripciones MUY BREVES (Max 20 palabras).\n'
-        'JSON FORMAT:\n'
-        '[{"titulo": "X", "tipo": "video/pdf/link", '
-        '"url": "url", "desc": "txt"}]'
-    )
-
-    json_text = generate_smart(prompt)
-
     try:
+        # Otro proceso (worker de uvicorn) pudo generarlos mientras tanto
+        ya_existen = db.query(study_models.Resource.id).filter(
+            study_models.Resource.materia_id == materia_id
+        ).first()
+        if ya_existen:
+            return []
+
         clean_text = json_text.replace(
             "```json", ""
         ).replace("```", "").strip()
@@ -410,6 +206,12 @@ def generar_y_guardar_recursos_auto(
             nuevos_recursos.append(nuevo)
 
         db.commit()
+        cache_respuestas.cache.invalidar_materia(materia_id)
+        contadores.incrementar("recursos", len(nuevos_recursos))
+        recuperacion.indice.agregar_recursos(materia_id, nuevos_recursos)
+        # Se recargan aqui para no consultar la BD desde el event loop
+        for nuevo in nuevos_recursos:
+            db.refresh(nuevo)
         return nuevos_recursos
 
     except Exception as e:
@@ -418,6 +220,101 @@ def generar_y_guardar_recursos_auto(
         return []
 
 
+async def generar_y_guardar_recursos_auto(
+    materia_id: int, materia_nombre: str, db: Session
+):
+    """
+    Utiliza la IA para generar sugerencias de recursos académicos
+    cuando una materia no tiene materiales registrados.
+    """
+    print(f"IA: Generando recursos para '{materia_nombre}'...")
+
+    prompt = (
+        f'Actúa como profesor experto de: "{materia_nombre}". '
+        'Genera 3 recursos.\n'
+        'Descripciones MUY BREVES (Max 20 palabras).\n'
+        'JSON FORMAT:\n'
+        '[{"titulo": "X", "tipo": "video/pdf/link", '
+        '"url": "url", "desc": "txt"}]'
+    )
+
+    json_text = await generate_smart(prompt)
+
+    return await run_in_threadpool(
+        _guardar_recursos_generados, materia_id, json_text, db
+    )
+
+
+# Generaciones de recursos en curso por materia (una a la vez)
+_generaciones_en_curso: Dict[int, asyncio.Task] = {}
+
+# Segundos que una pregunta espera los recursos generados antes de
+# responder sin ellos (0 = responder de inmediato)
+ESPERA_RECURSOS_SEGUNDOS = float(os.getenv("CHATBOT_ESPERA_RECURSOS", "0"))
+
+
+async def _generar_recursos_segundo_plano(
+    materia_id: int, materia_nombre: str
+):
+    """Genera los recursos de una materia con su propia sesion."""
+    db = SessionLocal()
+    try:
+        return await generar_y_guardar_recursos_auto(
+            materia_id, materia_nombre, db
+        )
+    finally:
+        await run_in_threadpool(db.close)
+
+
+def _terminar_generacion(materia_id: int, tarea: asyncio.Task):
+    """
+    Libera la materia al terminar su generacion y reporta si fallo.
+
+    Nadie espera la tarea cuando las preguntas responden sin los
+    recursos, asi que el error se registra aqui para no perderlo.
+    """
+    if _generaciones_en_curso.get(materia_id) is tarea:
+        del _generaciones_en_curso[materia_id]
+    if tarea.cancelled():
+        return
+    error = tarea.exception()
+    if error is not None:
+        print(
+            f"Error generando recursos de la materia {materia_id}: "
+            f"{error!r}"
+        )
+
+
+def iniciar_generacion_recursos(
+    materia_id: int, materia_nombre: str
+) -> asyncio.Task:
+    """
+    Inicia la generacion de recursos de una materia en segundo plano, o
+    devuelve la que ya esta en curso.
+
+    Si muchos estudiantes abren a la vez una materia sin recursos, se
+    hace una sola llamada al modelo y se guarda un solo juego de
+    recursos.
+
+    Args:
+        materia_id (int): Materia sin recursos.
+        materia_nombre (str): Nombre de la materia (para el prompt).
+
+    Returns:
+        asyncio.Task: Tarea que devuelve los recursos creados.
+    """
+    tarea = _generaciones_en_curso.get(materia_id)
+    if tarea is None:
+        tarea = asyncio.create_task(
+            _generar_recursos_segundo_plano(materia_id, materia_nombre)
+        )
+        _generaciones_en_curso[materia_id] = tarea
+        tarea.add_done_callback(
+            lambda t: _terminar_generacion(materia_id, t)
+        )
+    return tarea
+
+
 # ==========================================
 # ENDPOINT PRINCIPAL
 # ==========================================
@@ -425,87 +322,149 @@ def generar_y_guardar_recursos_auto(
 router = APIRouter()
 
 
-@router.post("/preguntar", response_model=esquemas.RespuestaChat)
-def preguntar_al_bot(
-    pregunta: esquemas.PreguntaChat,
-    db: Session = Depends(get_db)
-):
+def _recursos_de_materia(materia_id: int, db: Session):
     """
-    Endpoint principal para interactuar con el Chatbot. Maneja límites,
-    historial, detección de materia y generación de respuestas.
+    Devuelve los recursos registrados de una materia (solo titulo y
+    enlace; el contenido se obtiene del indice de recuperacion).
+    """
+    return db.query(
+        study_models.Resource.id,
+        study_models.Resource.title,
+        study_models.Resource.url_or_path
+    ).filter(
+        study_models.Resource.materia_id == materia_id
+    ).order_by(study_models.Resource.id).all()
+
+
+def _nombre_materia(materia_id: int, db: Session) -> str:
+    """Devuelve el nombre de una materia por su ID."""
+    mat_obj = db.query(main_models.Materia).filter(
+        main_models.Materia.id == materia_id
+    ).first()
+    return mat_obj.nombre if mat_obj else "Materia"
+
+
+async def _preparar_respuesta(
+    pregunta: esquemas.PreguntaChat, cuota: limitador.Cuota, db: Session
+) -> dict:
+    """
+    Resuelve todo lo previo a la llamada al modelo: límites, historial,
+    detección de materia, respuestas locales, recursos y cache.
+
+    Args:
+        pregunta (PreguntaChat): Datos de la pregunta.
+        cuota (Cuota): Resultado de verificar_limite_usuario.
+        db (Session): Sesión de la base de datos.
+
+    Returns:
+        dict: Con 'respuesta' si ya hay una respuesta lista ('guardar'
+            indica si debe registrarse en el historial), o con 'prompt',
+            'sufijo' (bloque de fuentes), 'materia_id', 'version',
+            'huella' (del historial) y 'cachear' si hay que consultar al
+            modelo.
     """
     user_query = pregunta.texto
     user_id = pregunta.user_id
     materia_actual_id = pregunta.materia_id
     nombre_materia_detectada = None
+    # Textos pegados muy largos no deben acaparar el prompt
+    pregunta_prompt = prompts.recortar(
+        user_query, prompts.MAX_PREGUNTA_TOKENS
+    )
 
-    # 1. Verificar Limite
-    puede_preguntar = verificar_limite_usuario(user_id, db)
-    if not puede_preguntar:
+    # 1. Verificar Limite (ya consumido por el endpoint)
+    if not cuota.permitido:
         return {
             "respuesta": (
                 "Me tengo que retirar por el momento, he alcanzado "
                 "mi límite de respuestas por hoy."
-            )
+            ),
+            "guardar": False,
         }
 
-    # 2. Recuperar Historial
-    historial_contexto = recuperar_historial(user_id, db)
+    # 2. Recuperar Historial (se recorta al armar el prompt)
+    mensajes_historial = await run_in_threadpool(
+        recuperar_historial, user_id, db
+    )
 
     # 3. Deteccion de Materia (Si no viene en el request)
     if not materia_actual_id:
-        det_id, det_nom = detectar_materia_automatica(user_query, db)
+        det_id, det_nom = await run_in_threadpool(
+            detectar_materia_automatica, user_query, db
+        )
         if det_id:
             materia_actual_id = det_id
             nombre_materia_detectada = det_nom
 
     # 4. Logica Local (Respuestas rapidas)
     if not materia_actual_id:
-        local_resp = check_local_intent(user_query, db)
+        local_resp = await run_in_threadpool(
+            check_local_intent, user_query, db
+        )
         if local_resp:
-            guardar_interaccion(user_id, user_query, local_resp, db)
-            return {"respuesta": local_resp}
+            return {"respuesta": local_resp, "guardar": True}
 
     # 5. Modo Soporte General (Sin materia)
     if not materia_actual_id:
-        prompt = (
-            f"Eres el asistente de ESCOM Review Hub.\n{historial_contexto}\n"
-            f"Usuario: '{user_query}'\n"
-            "Responde brevemente. Si es duda académica, pide la materia."
+        prompt = prompts.armar_prompt(
+            sistema="Eres el asistente de ESCOM Review Hub.\n",
+            pregunta=(
+                f"Usuario: '{pregunta_prompt}'\n"
+                "Responde brevemente. Si es duda académica, pide la materia."
+            ),
+            historial=mensajes_historial
         )
-        resp = generate_smart(prompt)
-        guardar_interaccion(user_id, user_query, resp, db)
-        return {"respuesta": resp}
+        prompts.estadisticas.registrar(prompt)
+        return {
+            "prompt": prompt.texto,
+            "sufijo": "",
+            "materia_id": None,
+            "version": None,
+            "huella": "",
+            "cachear": False,
+        }
 
     # 6. Modo Estudio (Con materia identificada)
-    recursos = db.query(study_models.Resource).filter(
-        study_models.Resource.materia_id == materia_actual_id
-    ).all()
+    # La version se lee antes que los recursos para no guardar en cache
+    # una respuesta basada en recursos que cambiaron mientras tanto.
+    version_recursos = cache_respuestas.cache.version(materia_actual_id)
+    recursos = await run_in_threadpool(
+        _recursos_de_materia, materia_actual_id, db
+    )
 
     mensaje_sistema = ""
     if not recursos:
         if not nombre_materia_detectada:
-            mat_obj = db.query(main_models.Materia).filter(
-                main_models.Materia.id == materia_actual_id
-            ).first()
-            nombre_materia_detectada = (
-                mat_obj.nombre if mat_obj else "Materia"
+            nombre_materia_detectada = await run_in_threadpool(
+                _nombre_materia, materia_actual_id, db
             )
 
-        recursos = generar_y_guardar_recursos_auto(
-            materia_actual_id, nombre_materia_detectada, db
+        # La generacion corre en segundo plano (una por materia); la
+        # pregunta se responde sin esperarla
+        tarea = iniciar_generacion_recursos(
+            materia_actual_id, nombre_materia_detectada
         )
-        mensaje_sistema = "He buscado nuevas referencias para ti.\n"
+        if not tarea.done() and ESPERA_RECURSOS_SEGUNDOS > 0:
+            await asyncio.wait({tarea}, timeout=ESPERA_RECURSOS_SEGUNDOS)
+        if (
+            tarea.done() and not tarea.cancelled()
+            and tarea.exception() is None
+        ):
+            recursos = tarea.result() or []
+            mensaje_sistema = "He buscado nuevas referencias para ti.\n"
 
-    # Contexto visual limitado (Max 1000 chars por recurso)
     lista_links = []
-    contexto_recursos = ""
     for res in recursos:
-        texto_limpio = (res.content_text or "")[:1000]
-        contexto_recursos += f"--- {res.title} ---\n{texto_limpio}\n"
         lista_links.append(f"🔗 [{res.title}]({res.url_or_path})")
 
     texto_links = "\n".join(lista_links[:5])
+    if recursos:
+        sufijo = f"\n\n**Fuentes:**\n{texto_links}"
+    else:
+        sufijo = (
+            "\n\n_Estoy preparando referencias para esta materia; "
+            "pregunta de nuevo en unos segundos para verlas._"
+        )
 
     # 7. Modo Turbo (Solo links)
     keywords_recursos = ["recursos", "material", "links", "bibliografia"]
@@ -514,22 +473,273 @@ def preguntar_al_bot(
             f"Aquí tienes los materiales para "
             f"{nombre_materia_detectada}:\n\n{texto_links}"
         )
-        guardar_interaccion(user_id, user_query, resp_turbo, db)
-        return {"respuesta": resp_turbo}
+        return {"respuesta": resp_turbo, "guardar": True}
 
     # 8. Generacion IA con Contexto
-    prompt = (
-        "Eres un tutor experto.\n"
-        f"{mensaje_sistema}\n"
-        f"{historial_contexto}\n"
-        "INFORMACIÓN DE REFERENCIA:\n"
-        f"{contexto_recursos}\n"
-        f"PREGUNTA: '{user_query}'\n"
-        "Responde usando las referencias si sirven."
+    # Preguntas repetidas (o casi iguales) sobre la misma materia y con
+    # el mismo historial se responden desde el cache sin llamar al modelo.
+    huella = cache_respuestas.huella_historial(mensajes_historial)
+    respuesta_cache = cache_respuestas.cache.obtener(
+        materia_actual_id, user_query, huella
+    )
+    if respuesta_cache:
+        return {"respuesta": respuesta_cache, "guardar": True}
+
+    # Solo los fragmentos de los recursos relevantes para la pregunta
+    fragmentos = await run_in_threadpool(
+        recuperacion.indice.buscar, materia_actual_id, user_query, db
+    )
+    prompt = prompts.armar_prompt(
+        sistema=f"Eres un tutor experto.\n{mensaje_sistema}\n",
+        pregunta=(
+            f"PREGUNTA: '{pregunta_prompt}'\n"
+            "Responde usando las referencias si sirven."
+        ),
+        historial=mensajes_historial,
+        fragmentos=fragmentos
+    )
+    prompts.estadisticas.registrar(prompt)
+    return {
+        "prompt": prompt.texto,
+        "sufijo": sufijo,
+        "materia_id": materia_actual_id,
+        "version": version_recursos,
+        "huella": huella,
+        # Sin recursos aun, la respuesta no se reutiliza
+        "cachear": bool(recursos),
+    }
+
+
+async def _consumir_cuota(
+    pregunta: esquemas.PreguntaChat, request: Request, db: Session
+) -> limitador.Cuota:
+    """Consume una pregunta de la cuota del usuario (o de su IP)."""
+    ip = limitador.ip_cliente(request)
+    return await run_in_threadpool(
+        verificar_limite_usuario, pregunta.user_id, db, ip
     )
 
-    respuesta_ia = generate_smart(prompt)
-    respuesta_final = f"{respuesta_ia}\n\n**Fuentes:**\n{texto_links}"
 
-    guardar_interaccion(user_id, user_query, respuesta_final, db)
+@router.post("/preguntar", response_model=esquemas.RespuestaChat)
+async def preguntar_al_bot(
+    pregunta: esquemas.PreguntaChat,
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
+    """
+    Endpoint principal para interactuar con el Chatbot. Maneja límites,
+    historial, detección de materia y generación de respuestas.
+
+    Es asincrono: mientras espera al modelo no ocupa un hilo del
+    servidor. Las consultas a la base de datos se ejecutan en hilos.
+
+    La cuota restante se informa en los encabezados X-RateLimit-*.
+    """
+    user_query = pregunta.texto
+    user_id = pregunta.user_id
+
+    cuota = await _consumir_cuota(pregunta, request, db)
+    response.headers.update(cuota.encabezados())
+
+    plan = await _preparar_respuesta(pregunta, cuota, db)
+    if "respuesta" in plan:
+        if plan["guardar"]:
+            guardar_interaccion(user_id, user_query, plan["respuesta"])
+        return {"respuesta": plan["respuesta"]}
+
+    inicio = time.perf_counter()
+    respuesta_ia = await generate_smart(plan["prompt"])
+    latencia = time.perf_counter() - inicio
+    respuesta_final = f"{respuesta_ia}{plan['sufijo']}"
+
+    if plan["cachear"] and respuesta_ia not in (
+        RESPUESTA_SATURADO, RESPUESTA_ERROR
+    ):
+        cache_respuestas.cache.guardar(
+            plan["materia_id"], user_query, respuesta_final,
+            version=plan["version"], latencia=latencia,
+            huella=plan["huella"]
+        )
+
+    guardar_interaccion(user_id, user_query, respuesta_final)
     return {"respuesta": respuesta_final}
+
+
+def _evento_sse(datos: dict, evento: str = None) -> str:
+    """Da formato de Server-Sent Event a un diccionario."""
+    linea = f"data: {json.dumps(datos, ensure_ascii=False)}\n\n"
+    return f"event: {evento}\n{linea}" if evento else linea
+
+
+@router.post("/preguntar/stream")
+async def preguntar_al_bot_stream(
+    pregunta: esquemas.PreguntaChat,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """
+    Variante de /preguntar que envia la respuesta conforme el modelo la
+    genera (Server-Sent Events).
+
+    Eventos:
+    - 'data: {"texto": ...}' por cada fragmento de la respuesta.
+    - 'event: fin' con la respuesta completa (incluye las fuentes).
+
+    La respuesta completa se guarda en el historial (y en el cache) al
+    terminar el envio. Si el cliente se desconecta antes, se guarda en
+    el historial lo generado hasta ese momento.
+    """
+    user_query = pregunta.texto
+    user_id = pregunta.user_id
+
+    cuota = await _consumir_cuota(pregunta, request, db)
+    plan = await _preparar_respuesta(pregunta, cuota, db)
+
+    async def eventos():
+        if "respuesta" in plan:
+            if plan["guardar"]:
+                guardar_interaccion(user_id, user_query, plan["respuesta"])
+            yield _evento_sse({"texto": plan["respuesta"]})
+            yield _evento_sse({"respuesta": plan["respuesta"]}, "fin")
+            return
+
+        partes = []
+        completa = False
+        guardada = False
+        inicio = time.perf_counter()
+        try:
+            try:
+                async for fragmento in cliente_ia.generar_stream(
+                    plan["prompt"]
+                ):
+                    partes.append(fragmento)
+                    yield _evento_sse({"texto": fragmento})
+                completa = True
+            except ErrorIA:
+                error = RESPUESTA_SATURADO
+            except Exception as e:
+                print(f"Error en streaming del Chatbot: {e}")
+                error = RESPUESTA_ERROR
+
+            if not completa:
+                # Si ya se habia enviado parte de la respuesta, el aviso
+                # se agrega al final en lugar de reemplazarla
+                aviso = f"\n\n{error}" if partes else error
+                partes.append(aviso)
+                yield _evento_sse({"texto": aviso})
+
+            latencia = time.perf_counter() - inicio
+            if plan["sufijo"]:
+                partes.append(plan["sufijo"])
+                yield _evento_sse({"texto": plan["sufijo"]})
+
+            respuesta_final = "".join(partes)
+            if completa and plan["cachear"]:
+                cache_respuestas.cache.guardar(
+                    plan["materia_id"], user_query, respuesta_final,
+                    version=plan["version"], latencia=latencia,
+                    huella=plan["huella"]
+                )
+            guardar_interaccion(user_id, user_query, respuesta_final)
+            guardada = True
+            yield _evento_sse({"respuesta": respuesta_final}, "fin")
+        finally:
+            # Si el cliente cierra la conexion, el generador se cierra en
+            # un yield: se guarda lo que alcanzo a generarse
+            if not guardada and partes:
+                guardar_interaccion(user_id, user_query, "".join(partes))
+
+    return StreamingResponse(
+        eventos(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "X-Accel-Buffering": "no",
+            **cuota.encabezados(),
+        }
+    )
+
+
+@router.get("/intenciones/stats")
+def estadisticas_intenciones(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra cuantas preguntas se respondieron con intenciones locales.
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Aciertos por intencion y llamadas a la IA evitadas.
+    """
+    return intenciones.motor.obtener_estadisticas()
+
+
+@router.get("/cache/stats")
+def estadisticas_cache_respuestas(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra el uso del cache de respuestas del Chatbot.
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Aciertos (exactos y similares), fallos, tasa de acierto y
+            segundos de modelo ahorrados.
+    """
+    return cache_respuestas.cache.obtener_estadisticas()
+
+
+@router.get("/historial/stats")
+def estadisticas_historial(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra el estado del historial con escritura diferida.
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Mensajes pendientes, volcados a la BD y lecturas servidas
+            desde memoria o desde la BD.
+    """
+    return historial.buffer.obtener_estadisticas()
+
+
+@router.post("/historial/retencion")
+async def ejecutar_retencion_historial(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Ejecuta en este momento la compactacion y purga del historial (se
+    ejecuta tambien automaticamente cada CHATBOT_RETENCION_HORAS).
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Mensajes archivados y dias de archivo purgados.
+    """
+    return await run_in_threadpool(retencion.ejecutar_retencion)
+
+
+@router.get("/prompts/stats")
+def estadisticas_prompts(
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Muestra los tokens (estimados) de los prompts enviados al modelo.
+
+    Args:
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Totales, promedio, p50/p95, maximo y piezas descartadas
+            por el presupuesto de tokens.
+    """
+    return prompts.estadisticas.obtener_estadisticas()
@@ -1,5 +1,14 @@
+from typing import Dict, Iterable, Tuple
+
+from sqlalchemy import func, insert, or_
 from sqlalchemy.orm import Session
+
+from app.Chatbot import indice_materias
 from app.Creacion_mats_prof import esquemas, modelos
+from app.Estadistica.contadores import contadores
+
+# Nombres por consulta al buscar profesores en lote (ilike unidos por OR)
+LOTE_BUSQUEDA_PROFESORES = 200
 
 
 def get_profesores(db: Session, skip: int = 0, limit: int = 100):
@@ -18,6 +27,7 @@ def create_profesor(db: Session, profesor: esquemas.ProfesorCreate):
     db.add(db_profesor)
     db.commit()
     db.refresh(db_profesor)
+    contadores.incrementar("profesores")
     return db_profesor
 
 
@@ -30,6 +40,90 @@ def get_profesor_by_name(db: Session, nombre: str):
     ).first()
 
 
+def get_or_create_profesores_bulk(
+    db: Session, nombres: Iterable[str]
+) -> Tuple[Dict[str, modelos.Profesor], int]:
+    """
+    Resuelve muchos nombres de profesor con un numero fijo de consultas.
+
+    Conserva la busqueda parcial de get_profesor_by_name ("Lopez"
+    encuentra a "LOPEZ JUAN"): los candidatos se traen con una consulta
+    de ilike unidos por OR (por lotes) y cada nombre se resuelve en
+    memoria con el primer profesor que lo contiene. Los faltantes se
+    insertan en un solo INSERT multiple; un nombre contenido en otro
+    nuevo del mismo lote reutiliza ese registro, igual que al crearlos
+    uno por uno. No hace commit: el llamador decide cuando cerrar la
+    transaccion.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        nombres (Iterable[str]): Nombres de profesores a resolver.
+
+    Returns:
+        tuple: (mapa nombre_en_minusculas -> Profesor, profesores_creados)
+    """
+    # Normalizamos y quitamos duplicados conservando la primera grafia
+    unicos = {}
+    for nombre in nombres:
+        nombre_limpio = nombre.strip()
+        if nombre_limpio:
+            unicos.setdefault(nombre_limpio.lower(), nombre_limpio)
+
+    if not unicos:
+        return {}, 0
+
+    claves = list(unicos)
+    candidatos = {}
+    for i in range(0, len(claves), LOTE_BUSQUEDA_PROFESORES):
+        lote = claves[i:i + LOTE_BUSQUEDA_PROFESORES]
+        filtro = or_(*(
+            modelos.Profesor.nombre.ilike(f"%{clave}%") for clave in lote
+        ))
+        for profesor in db.query(modelos.Profesor).filter(filtro):
+            candidatos[profesor.id] = profesor
+
+    # Mismo criterio que .first(): el profesor mas antiguo que coincide
+    existentes = sorted(candidatos.values(), key=lambda p: p.id)
+    encontrados = {}
+    faltantes = []
+    for clave in claves:
+        profesor = next(
+            (p for p in existentes if clave in p.nombre.lower()), None
+        )
+        if profesor is not None:
+            encontrados[clave] = profesor
+        else:
+            faltantes.append(clave)
+
+    if not faltantes:
+        return encontrados, 0
+
+    # Entre los nuevos, un nombre contenido en otro creado antes lo reusa
+    nuevos = []
+    alias = {}
+    for clave in faltantes:
+        previo = next((n for n in nuevos if clave in n), None)
+        if previo is not None:
+            alias[clave] = previo
+        else:
+            nuevos.append(clave)
+
+    db.execute(
+        insert(modelos.Profesor),
+        [{"nombre": unicos[k]} for k in nuevos]
+    )
+    creados = {}
+    for profesor in db.query(modelos.Profesor).filter(
+        func.lower(modelos.Profesor.nombre).in_(nuevos)
+    ).order_by(modelos.Profesor.id):
+        creados.setdefault(profesor.nombre.lower(), profesor)
+
+    for clave in faltantes:
+        encontrados[clave] = creados[alias.get(clave, clave)]
+
+    return encontrados, len(nuevos)
+
+
 # --- GESTION DE MATERIAS ---
 
 def get_materias(db: Session, skip: int = 0, limit: int = 100):
@@ -48,6 +142,10 @@ def create_materia(db: Session, materia: esquemas.MateriaCreate):
     db.add(db_materia)
     db.commit()
     db.refresh(db_materia)
+
+    # Mantener al dia el indice de materias del Chatbot y los totales
+    indice_materias.indice.agregar(db_materia.id, db_materia.nombre)
+    contadores.incrementar("materias")
     return db_materia
 
 
@@ -0,0 +1,103 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from app.Estadistica import crud
+
+# Reseñas recientes que se guardan en memoria para el feed
+TAMANO_FEED = int(os.getenv("STATS_ACTIVIDAD_TAMANO", "20"))
+
+# Segundos tras los cuales el feed se recarga desde la BD. Corrige lo
+# creado por otros procesos (varios workers de uvicorn).
+RECARGA_SEGUNDOS = float(os.getenv("STATS_ACTIVIDAD_TTL_SEGUNDOS", "60"))
+
+
+class FeedActividad:
+    """
+    Buffer circular con las ultimas TAMANO_FEED reseñas del feed de
+    actividad reciente.
+
+    create_resena agrega cada reseña nueva y votar_resena actualiza su
+    total de votos, de modo que el endpoint responde desde memoria. Se
+    recarga con una sola consulta (crud.get_actividad_reciente) al
+    primer uso, tras invalidar() o cada RECARGA_SEGUNDOS.
+    """
+
+    def __init__(self, tamano: int = TAMANO_FEED):
+        self.tamano = tamano
+        self._lock = threading.Lock()
+        self._items: deque = deque(maxlen=tamano)
+        self._cargado_en: Optional[float] = None
+
+    def _vigente(self) -> bool:
+        return (
+            self._cargado_en is not None
+            and time.monotonic() - self._cargado_en < RECARGA_SEGUNDOS
+        )
+
+    def obtener(self, db: Session, limite: int = 5) -> List[Dict[str, Any]]:
+        """
+        Devuelve las reseñas mas recientes del feed.
+
+        Args:
+            db (Session): Sesión usada solo para recargar.
+            limite (int): Cantidad de reseñas (a lo mas el tamaño del
+                buffer).
+
+        Returns:
+            List[Dict]: Items del feed, del mas reciente al mas antiguo.
+        """
+        if not self._vigente():
+            items = crud.get_actividad_reciente(db, self.tamano)
+            with self._lock:
+                self._items = deque(items, maxlen=self.tamano)
+                self._cargado_en = time.monotonic()
+
+        with self._lock:
+            items = list(self._items)[:max(limite, 0)]
+            return [dict(item) for item in items]
+
+    def agregar(self, db: Session, resena_id: int):
+        """
+        Agrega una reseña recien creada (llamar despues del commit).
+
+        Args:
+            db (Session): Sesión de la base de datos.
+            resena_id (int): ID de la reseña creada.
+        """
+        if self._cargado_en is None:
+            # Aun no se ha cargado; la primera lectura la incluira
+            return
+        nuevos = crud.get_actividad_reciente(db, 1, ids=[resena_id])
+        with self._lock:
+            items = sorted(
+                [*self._items, *nuevos], key=lambda i: i["id"], reverse=True
+            )
+            self._items = deque(items[:self.tamano], maxlen=self.tamano)
+
+    def actualizar_votos(self, resena_id: int, total: int):
+        """
+        Actualiza el total de votos utiles de una reseña del feed.
+
+        Args:
+            resena_id (int): ID de la reseña votada.
+            total (int): Nuevo total de votos utiles.
+        """
+        with self._lock:
+            for item in self._items:
+                if item["id"] == resena_id:
+                    item["total_votos_utiles"] = total
+                    break
+
+    def invalidar(self):
+        """Obliga a recargar el feed en la siguiente lectura."""
+        with self._lock:
+            self._cargado_en = None
+
+
+# Instancia global compartida por las reseñas y el dashboard
+feed = FeedActividad()
@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+
+from app.Creacion_mats_prof.modelos import Materia, Profesor
+from app.Porta_Estudio.modelos import Resource
+from app.Reviews.modelos import Resena
+from app.Usuarios.modelos import User
+
+# Segundos tras los cuales los totales se recalculan desde la BD. Corrige
+# lo creado por otros procesos (varios workers de uvicorn) o fuera de
+# la API.
+RECONCILIACION_SEGUNDOS = float(os.getenv("STATS_TTL_SEGUNDOS", "60"))
+
+# Segundos que el navegador puede reutilizar la respuesta sin preguntar
+CACHE_MAX_AGE_SEGUNDOS = int(os.getenv("STATS_MAX_AGE_SEGUNDOS", "15"))
+
+# Modelo que se cuenta para cada total del dashboard
+MODELOS_CONTADOS = {
+    "usuarios": User,
+    "resenas": Resena,
+    "recursos": Resource,
+    "profesores": Profesor,
+    "materias": Materia,
+}
+
+
+class ContadoresGenerales:
+    """
+    Totales del dashboard (usuarios, reseñas, recursos, profesores y
+    materias) servidos desde memoria.
+
+    Las rutas de creacion los incrementan al hacer commit y cada
+    RECONCILIACION_SEGUNDOS se recalculan con una sola consulta (cinco
+    subconsultas COUNT) en lugar de cinco consultas por peticion.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._lock_reconciliar = threading.Lock()
+        self._valores: Dict[str, int] = {}
+        self._etag = ""
+        self._cargado_en: Optional[float] = None
+
+    def _calcular_etag(self):
+        """Actualiza el ETag a partir de los valores (con el lock)."""
+        contenido = json.dumps(self._valores, sort_keys=True)
+        resumen = hashlib.md5(contenido.encode("utf-8")).hexdigest()[:16]
+        self._etag = f'W/"{resumen}"'
+
+    def _vigente(self) -> bool:
+        return (
+            self._cargado_en is not None
+            and time.monotonic() - self._cargado_en < RECONCILIACION_SEGUNDOS
+        )
+
+    def reconciliar(self, db: Session):
+        """
+        Recalcula todos los totales con una sola consulta.
+
+        Args:
+            db (Session): Sesión de la base de datos.
+        """
+        consulta = select(*[
+            select(func.count()).select_from(modelo).scalar_subquery()
+            .label(nombre)
+            for nombre, modelo in MODELOS_CONTADOS.items()
+        ])
+        fila = db.execute(consulta).one()
+
+        with self._lock:
+            self._valores = dict(fila._mapping)
+            self._cargado_en = time.monotonic()
+            self._calcular_etag()
+
+    def obtener(self, db: Session) -> Tuple[Dict[str, int], str]:
+        """
+        Devuelve los totales y su ETag, recalculandolos si vencieron.
+
+        Args:
+            db (Session): Sesión usada solo para reconciliar.
+
+        Returns:
+            tuple: (totales, etag)
+        """
+        if not self._vigente():
+            with self._lock_reconciliar:
+                # Otro hilo pudo reconciliar mientras se esperaba
+                if not self._vigente():
+                    self.reconciliar(db)
+
+        with self._lock:
+            return dict(self._valores), self._etag
+
+    def incrementar(self, nombre: str, cantidad: int = 1):
+        """
+        Suma registros recien creados (llamar despues del commit).
+
+        Args:
+            nombre (str): Total afectado ('usuarios', 'resenas', ...).
+            cantidad (int): Registros creados.
+        """
+        if not cantidad:
+            return
+        with self._lock:
+            if self._cargado_en is None:
+                # Aun no se ha cargado; la primera lectura los incluira
+                return
+            self._valores[nombre] = self._valores.get(nombre, 0) + cantidad
+            self._calcular_etag()
+
+    def invalidar(self):
+        """Obliga a recalcular en la siguiente lectura (p. ej. tras borrar)."""
+        with self._lock:
+            self._cargado_en = None
+
+
+# Instancia global compartida por las rutas de creacion y el dashboard
+contadores = ContadoresGenerales()
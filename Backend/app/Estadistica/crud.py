@@ -0,0 +1,268 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence
+
+from sqlalchemy import case, delete, desc, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+
+from app.Creacion_mats_prof.modelos import Materia, Profesor
+from app.database import SessionLocal
+from app.Estadistica.modelos import ProfesorStats
+from app.Reviews.modelos import Resena
+
+
+# --- AGREGADOS POR PROFESOR (TABLA profesor_stats) ---
+
+def _tiene_comentario(columna):
+    """Condicion SQL: el comentario no es nulo ni vacio."""
+    return columna.is_not(None) & (columna != "")
+
+
+def registrar_resenas(db: Session, filas: List[Dict[str, Any]]):
+    """
+    Actualiza los agregados de los profesores de reseñas recien
+    insertadas.
+
+    Cada profesor se actualiza con un UPDATE atomico (suma sobre el
+    valor actual), por lo que inserciones simultaneas no se pisan. No
+    hace commit: debe llamarse en la misma transaccion del INSERT.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        filas (List[Dict]): Reseñas insertadas (profesor_id,
+            calificacion, dificultad y comentario).
+    """
+    por_profesor: Dict[int, Dict[str, Any]] = {}
+    for fila in filas:
+        profesor_id = fila.get("profesor_id")
+        if profesor_id is None:
+            continue
+        datos = por_profesor.setdefault(profesor_id, {
+            "total": 0, "calificacion": 0.0, "dificultad": 0,
+            "con_comentario": False,
+        })
+        datos["total"] += 1
+        datos["calificacion"] += fila["calificacion"]
+        datos["dificultad"] += fila["dificultad"]
+        if fila.get("comentario"):
+            datos["con_comentario"] = True
+
+    if not por_profesor:
+        return
+
+    # La reseña con comentario mas reciente solo cambia para los
+    # profesores con comentarios nuevos (consulta por profesor_id)
+    con_comentario = [
+        p for p, datos in por_profesor.items() if datos["con_comentario"]
+    ]
+    ultimas = {}
+    if con_comentario:
+        ultimas = dict(db.execute(
+            select(Resena.profesor_id, func.max(Resena.id)).where(
+                Resena.profesor_id.in_(con_comentario),
+                _tiene_comentario(Resena.comentario)
+            ).group_by(Resena.profesor_id)
+        ).all())
+
+    for profesor_id, datos in por_profesor.items():
+        ultima = ultimas.get(profesor_id)
+        if not _sumar(db, profesor_id, datos, ultima):
+            try:
+                with db.begin_nested():
+                    db.execute(insert(ProfesorStats).values(
+                        profesor_id=profesor_id,
+                        total_resenas=datos["total"],
+                        suma_calificacion=datos["calificacion"],
+                        suma_dificultad=datos["dificultad"],
+                        promedio_calificacion=(
+                            datos["calificacion"] / datos["total"]
+                        ),
+                        promedio_dificultad=(
+                            datos["dificultad"] / datos["total"]
+                        ),
+                        ultima_resena_id=ultima,
+                        actualizado=datetime.utcnow()
+                    ))
+            except IntegrityError:
+                # Otra transaccion creo la fila al mismo tiempo
+                _sumar(db, profesor_id, datos, ultima)
+
+
+def _sumar(
+    db: Session, profesor_id: int, datos: Dict[str, Any], ultima
+) -> bool:
+    """Suma los datos a la fila del profesor. False si no existe."""
+    stats = ProfesorStats
+    total = stats.total_resenas + datos["total"]
+    # Los promedios se asignan antes que las sumas: MySQL evalua el SET
+    # en orden y usa los valores ya actualizados
+    valores = [
+        (stats.promedio_calificacion,
+         (stats.suma_calificacion + datos["calificacion"]) / total),
+        (stats.promedio_dificultad,
+         (stats.suma_dificultad + datos["dificultad"]) * 1.0 / total),
+        (stats.total_resenas, total),
+        (stats.suma_calificacion,
+         stats.suma_calificacion + datos["calificacion"]),
+        (stats.suma_dificultad, stats.suma_dificultad + datos["dificultad"]),
+        (stats.actualizado, datetime.utcnow()),
+    ]
+    if ultima is not None:
+        valores.append((stats.ultima_resena_id, case(
+            (
+                stats.ultima_resena_id.is_(None)
+                | (stats.ultima_resena_id < ultima),
+                ultima
+            ),
+            else_=stats.ultima_resena_id
+        )))
+
+    resultado = db.execute(
+        update(stats).where(
+            stats.profesor_id == profesor_id
+        ).ordered_values(*valores)
+    )
+    return resultado.rowcount > 0
+
+
+def reconstruir_profesor_stats(db: Session) -> int:
+    """
+    Recalcula toda la tabla profesor_stats desde 'resenas'.
+
+    Se usa para llenarla la primera vez (o corregirla) con una sola
+    consulta INSERT ... SELECT agrupada.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+
+    Returns:
+        int: Numero de profesores con agregados.
+    """
+    consulta = select(
+        Resena.profesor_id,
+        func.count(Resena.id),
+        func.sum(Resena.calificacion),
+        func.sum(Resena.dificultad),
+        func.avg(Resena.calificacion),
+        func.avg(Resena.dificultad),
+        func.max(case(
+            (_tiene_comentario(Resena.comentario), Resena.id)
+        )),
+        func.now()
+    ).where(
+        Resena.profesor_id.is_not(None)
+    ).group_by(Resena.profesor_id)
+
+    db.execute(delete(ProfesorStats))
+    db.execute(insert(ProfesorStats).from_select([
+        "profesor_id", "total_resenas", "suma_calificacion",
+        "suma_dificultad", "promedio_calificacion", "promedio_dificultad",
+        "ultima_resena_id", "actualizado"
+    ], consulta))
+    db.commit()
+    return db.query(ProfesorStats).count()
+
+
+def asegurar_profesor_stats():
+    """
+    Llena profesor_stats si esta vacia y ya hay reseñas (primer
+    arranque con esta tabla), con su propia sesion.
+
+    Debe llamarse en el evento 'startup' de la aplicacion.
+    """
+    db = SessionLocal()
+    try:
+        vacia = db.query(ProfesorStats.profesor_id).first() is None
+        if vacia and db.query(Resena.id).first() is not None:
+            total = reconstruir_profesor_stats(db)
+            print(f"--- profesor_stats: {total} profesores calculados ---")
+    finally:
+        db.close()
+
+
+def get_top_profesores(db: Session, limit: int = 5):
+    """
+    Obtiene los profesores con mejor calificacion promedio desde la
+    tabla de agregados, junto con su comentario mas reciente.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        limit (int): Cantidad de profesores (Top N).
+
+    Returns:
+        List[Row]: nombre, promedio, total y comentario de cada profesor.
+    """
+    return db.query(
+        Profesor.nombre,
+        ProfesorStats.promedio_calificacion.label("promedio"),
+        ProfesorStats.total_resenas.label("total"),
+        Resena.comentario
+    ).join(
+        Profesor, Profesor.id == ProfesorStats.profesor_id
+    ).outerjoin(
+        Resena, Resena.id == ProfesorStats.ultima_resena_id
+    ).filter(
+        ProfesorStats.total_resenas > 0
+    ).order_by(
+        desc(ProfesorStats.promedio_calificacion),
+        ProfesorStats.profesor_id
+    ).limit(limit).all()
+
+
+# --- ACTIVIDAD RECIENTE ---
+
+def _formatear_actividad(fila) -> Dict[str, Any]:
+    """Convierte una fila de get_actividad_reciente en un item del feed."""
+    return {
+        "id": fila.id,
+        "profesor": fila.profesor or "Desconocido",
+        "materia": fila.materia or "General",
+        "calificacion": fila.calificacion,
+        "dificultad": fila.dificultad,
+        "total_votos_utiles": fila.total_votos_utiles,
+        "comentario": fila.comentario,
+        "comentario_corto": (
+            (fila.comentario[:40] + "...") if fila.comentario
+            else "Sin comentario"
+        )
+    }
+
+
+def get_actividad_reciente(
+    db: Session,
+    limit: int = 5,
+    ids: Optional[Sequence[int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    Obtiene las reseñas mas recientes con los nombres del profesor y de
+    la materia y su total de votos utiles, en una sola consulta.
+
+    Los votos se leen de la columna 'utiles' en lugar de cargar la
+    relacion 'votos' de cada reseña.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        limit (int): Cantidad de reseñas.
+        ids (List[int] | None): Limitar a estas reseñas (p. ej. una
+            recien creada).
+
+    Returns:
+        List[Dict]: Items del feed, de la mas reciente a la mas antigua.
+    """
+    consulta = select(
+        Resena.id,
+        Resena.calificacion,
+        Resena.dificultad,
+        Resena.comentario,
+        Profesor.nombre.label("profesor"),
+        Materia.nombre.label("materia"),
+        Resena.utiles.label("total_votos_utiles")
+    ).outerjoin(
+        Profesor, Resena.profesor_id == Profesor.id
+    ).outerjoin(
+        Materia, Resena.materia_id == Materia.id
+    ).order_by(desc(Resena.id)).limit(limit)
+    if ids is not None:
+        consulta = consulta.where(Resena.id.in_(ids))
+
+    return [_formatear_actividad(fila) for fila in db.execute(consulta)]
@@ -1,3 +1,5 @@
+from typing import Optional
+
 from pydantic import BaseModel
 
 
@@ -47,12 +49,20 @@ class ActividadReciente(BaseModel):
     Representa una tarjeta simplificada de una reseña recien creada.
 
     Atributos:
+        id (int): Identificador de la reseña (para votar).
         profesor (str): Nombre del profesor calificado.
         materia (str): Nombre de la materia asociada.
         calificacion (float): Calificacion otorgada en la reseña.
+        dificultad (int): Nivel de dificultad otorgado.
+        total_votos_utiles (int): Votos positivos recibidos.
+        comentario (Optional[str]): Comentario completo.
         comentario_corto (str): Extracto truncado del comentario original.
     """
+    id: int
     profesor: str
     materia: str
     calificacion: float
+    dificultad: int
+    total_votos_utiles: int = 0
+    comentario: Optional[str] = None
     comentario_corto: str
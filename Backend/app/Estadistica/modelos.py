@@ -0,0 +1,44 @@
+from datetime import datetime
+
+from sqlalchemy import Column, DateTime, Float, ForeignKey, Integer
+
+from app.database import Base
+
+
+class ProfesorStats(Base):
+    """
+    Modelo de Base de Datos con los agregados de reseñas por profesor.
+
+    Es una tabla materializada: se actualiza de forma incremental cada
+    vez que se insertan reseñas (Reviews.crud), de modo que el ranking
+    de profesores no agrupa toda la tabla 'resenas' en cada consulta.
+
+    Atributos:
+        profesor_id (int): Profesor al que pertenecen los agregados.
+        total_resenas (int): Numero de reseñas del profesor.
+        suma_calificacion (float): Suma de las calificaciones.
+        suma_dificultad (int): Suma de las dificultades.
+        promedio_calificacion (float): Calificacion promedio.
+        promedio_dificultad (float): Dificultad promedio.
+        ultima_resena_id (int): Reseña mas reciente con comentario.
+        actualizado (datetime): Fecha de la ultima actualizacion (UTC).
+    """
+    __tablename__ = "profesor_stats"
+
+    profesor_id = Column(
+        Integer, ForeignKey("profesores.id"), primary_key=True
+    )
+    total_resenas = Column(Integer, default=0, nullable=False)
+    suma_calificacion = Column(Float, default=0.0, nullable=False)
+    suma_dificultad = Column(Integer, default=0, nullable=False)
+    # Indexado para el ORDER BY del ranking
+    promedio_calificacion = Column(
+        Float, default=0.0, nullable=False, index=True
+    )
+    promedio_dificultad = Column(Float, default=0.0, nullable=False)
+    ultima_resena_id = Column(
+        Integer, ForeignKey("resenas.id"), nullable=True
+    )
+    actualizado = Column(
+        DateTime, default=datetime.utcnow, onupdate=datetime.utcnow
+    )
@@ -1,42 +1,53 @@
 from typing import List
 
-from fastapi import APIRouter, Depends
-from sqlalchemy import desc, func
+from fastapi import APIRouter, Depends, Query, Request, Response
 from sqlalchemy.orm import Session
 
-from app.Creacion_mats_prof.modelos import Materia, Profesor
+from app import dependencias
 from app.database import get_db
-from app.Estadistica import esquemas
-from app.Porta_Estudio.modelos import Resource
-from app.Reviews.modelos import Resena
-from app.Usuarios.modelos import User
+from app.Estadistica import actividad, contadores, crud, esquemas
+from app.Usuarios import esquemas as user_schemas
 
 router = APIRouter()
 
 
 @router.get("/general", response_model=esquemas.StatsGeneral)
-def estadisticas_generales(db: Session = Depends(get_db)):
+def estadisticas_generales(
+    request: Request,
+    response: Response,
+    db: Session = Depends(get_db)
+):
     """
     Obtiene los contadores totales de las entidades principales del sistema.
 
     Se utiliza para poblar las tarjetas de estadísticas en el panel de
-    control (dashboard) principal.
+    control (dashboard) principal. Los totales se sirven desde memoria
+    (app.Estadistica.contadores) con un ETag; si el cliente envia
+    If-None-Match con el mismo valor se responde 304 sin cuerpo.
 
     Args:
+        request (Request): Peticion (para leer If-None-Match).
+        response (Response): Respuesta (para los encabezados de cache).
         db (Session): Sesion de base de datos.
 
     Returns:
         StatsGeneral: Objeto con los totales de usuarios, reseñas,
         recursos, profesores y materias.
     """
-    return {
-        "usuarios": db.query(User).count(),
-        "resenas": db.query(Resena).count(),
-        "recursos": db.query(Resource).count(),
-        "profesores": db.query(Profesor).count(),
-        "materias": db.query(Materia).count(),
+    valores, etag = contadores.contadores.obtener(db)
+    encabezados = {
+        "ETag": etag,
+        "Cache-Control": (
+            f"public, max-age={contadores.CACHE_MAX_AGE_SEGUNDOS}"
+        ),
     }
 
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=encabezados)
+
+    response.headers.update(encabezados)
+    return valores
+
 
 @router.get("/top-profesores")
 def mejores_profesores(limit: int = 5, db: Session = Depends(get_db)):
@@ -50,41 +61,16 @@ def mejores_profesores(limit: int = 5, db: Session = Depends(get_db)):
     Returns:
         List[ItemRanking]: Lista ordenada de profesores con su promedio.
     """
-    # Consulta de agregacion:
-    # 1. Selecciona nombre, promedio de calificacion y total de reseñas.
-    # 2. Une con la tabla de reseñas.
-    # 3. Agrupa los resultados por ID del profesor.
-    # 4. Filtra aquellos que tengan al menos 1 reseña.
-    # 5. Ordena descendente por el promedio calculado.
-    # 1. Tu consulta original para obtener el Top
-    resultados = db.query(
-        # Agregamos el ID para poder buscar sus reseñas luego
-        Profesor.id,
-        Profesor.nombre,
-        func.avg(Resena.calificacion).label("promedio"),
-        func.count(Resena.id).label("total")
-    ).join(Resena).group_by(
-        Profesor.id
-    ).having(
-        func.count(Resena.id) > 0
-    ).order_by(
-        desc("promedio")
-    ).limit(limit).all()
-
-    # 2. Procesamos la lista para agregar el "comentario destacado"
+    # Se lee de la tabla materializada profesor_stats (una sola
+    # consulta, sin GROUP BY sobre todas las reseñas)
+    resultados = crud.get_top_profesores(db, limit)
+
     lista_final = []
     for r in resultados:
-        # Buscamos la reseña más reciente de este profesor específico
-        ultima_resena = db.query(Resena).filter(
-            Resena.profesor_id == r.id,
-            Resena.comentario.is_not(None),  # Que tenga texto
-            Resena.comentario != ""
-        ).order_by(desc(Resena.id)).first()
-
         # Recortamos el comentario si es muy largo
         comentario_texto = "Sin comentarios aún"
-        if ultima_resena and ultima_resena.comentario:
-            comentario_texto = ultima_resena.comentario
+        if r.comentario:
+            comentario_texto = r.comentario
             if len(comentario_texto) > 60:
                 comentario_texto = comentario_texto[:60] + "..."
 
@@ -98,28 +84,48 @@ def mejores_profesores(limit: int = 5, db: Session = Depends(get_db)):
     return lista_final
 
 
+@router.post("/top-profesores/reconstruir")
+def reconstruir_top_profesores(
+    db: Session = Depends(get_db),
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Recalcula la tabla profesor_stats desde todas las reseñas.
+
+    Solo es necesario si se modificaron reseñas directamente en la base
+    de datos; las inserciones normales la mantienen actualizada.
+
+    Args:
+        db (Session): Sesion de base de datos.
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Numero de profesores recalculados.
+    """
+    return {"profesores": crud.reconstruir_profesor_stats(db)}
+
+
 @router.get(
     "/actividad-reciente",
     response_model=List[esquemas.ActividadReciente]
 )
-@router.get("/actividad-reciente")
-def actividad_reciente(db: Session = Depends(get_db)):
+def actividad_reciente(
+    limit: int = Query(5, ge=1, le=actividad.TAMANO_FEED),
+    db: Session = Depends(get_db)
+):
     """
     Obtiene las ultimas reseñas para la sección de actividad reciente.
+
+    Se sirven desde el feed en memoria (app.Estadistica.actividad), que
+    se carga con una sola consulta con los nombres y los votos.
+
+    Args:
+        limit (int): Cantidad de reseñas a mostrar (de 1 a
+            TAMANO_FEED, el tamaño del feed).
+        db (Session): Sesion de base de datos.
+
+    Returns:
+        List[ActividadReciente]: Reseñas de la mas reciente a la mas
+        antigua.
     """
-    # Obtenemos las últimas 5 reseñas
-    resenas = db.query(Resena).order_by(desc(Resena.id)).limit(5).all()
-
-    return [
-        {
-            "id": r.id,
-            "profesor": r.profesor.nombre if r.profesor else "Desconocido",
-            "materia": r.materia.nombre if r.materia else "General",
-            "calificacion": r.calificacion,
-            "dificultad": r.dificultad,
-            "total_votos_utiles": r.total_votos_utiles,
-            "comentario": r.comentario,
-            "comentario_corto": (r.comentario[:40] + "...") if r.comentario else "Sin comentario"
-        }
-        for r in resenas
-    ]
\ No newline at end of file
+    return actividad.feed.obtener(db, limit)
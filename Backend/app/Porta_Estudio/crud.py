@@ -1,14 +1,31 @@
 from typing import Optional
 
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, load_only
 
+from app.Chatbot import cache_respuestas, recuperacion
+from app.Estadistica.contadores import contadores
 from app.Porta_Estudio import modelos
 
 
+# Columnas necesarias para listar recursos (esquemas.ResourceResponse).
+# Nunca incluye content_text.
+COLUMNAS_LISTADO = (
+    modelos.Resource.id,
+    modelos.Resource.title,
+    modelos.Resource.description,
+    modelos.Resource.type,
+    modelos.Resource.url_or_path,
+    modelos.Resource.materia_id,
+    modelos.Resource.user_id,
+)
+
+
 def get_resources_by_materia(db: Session, materia_id: int):
     """
     Obtiene todos los recursos asociados a una materia específica.
 
+    Solo carga las columnas del listado, no el texto extraído.
+
     Args:
         db (Session): Sesión de la base de datos.
         materia_id (int): ID de la materia a consultar.
@@ -16,11 +33,35 @@ def get_resources_by_materia(db: Session, materia_id: int):
     Returns:
         List[Resource]: Lista de objetos Resource encontrados.
     """
-    return db.query(modelos.Resource).filter(
+    return db.query(modelos.Resource).options(
+        load_only(*COLUMNAS_LISTADO)
+    ).filter(
         modelos.Resource.materia_id == materia_id
     ).all()
 
 
+def get_resource_for_download(db: Session, resource_id: int):
+    """
+    Obtiene un recurso con solo los datos necesarios para descargarlo.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        resource_id (int): ID del recurso.
+
+    Returns:
+        Resource | None: Recurso con id, tipo y ruta cargados.
+    """
+    return db.query(modelos.Resource).options(
+        load_only(
+            modelos.Resource.id,
+            modelos.Resource.type,
+            modelos.Resource.url_or_path
+        )
+    ).filter(
+        modelos.Resource.id == resource_id
+    ).first()
+
+
 def create_resource_manual(
     db: Session,
     title: str,
@@ -65,4 +106,11 @@ def create_resource_manual(
     db.add(db_resource)
     db.commit()
     db.refresh(db_resource)
+
+    # Indexar el contenido para el Chatbot; sus respuestas anteriores
+    # sobre esta materia ya no estan al dia
+    if content_text:
+        recuperacion.indice.agregar_recursos(materia_id, [db_resource])
+    cache_respuestas.cache.invalidar_materia(materia_id)
+    contadores.incrementar("recursos")
     return db_resource
@@ -2,7 +2,7 @@ import enum
 
 from sqlalchemy import Column, Enum, ForeignKey, Integer, String
 from sqlalchemy.dialects.mysql import LONGTEXT
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 
 from app.database import Base
 
@@ -45,7 +45,9 @@ class Resource(Base):
 
     # Se usa LONGTEXT de MySQL para almacenar grandes cantidades de texto
     # extraído de PDFs o transcripciones, necesario para el contexto de la IA.
-    content_text = Column(LONGTEXT, nullable=True)
+    # Es diferido: solo se lee al acceder al atributo (o con undefer), para
+    # que los listados y descargas no traigan megabytes de texto.
+    content_text = deferred(Column(LONGTEXT, nullable=True))
 
     materia_id = Column(Integer, ForeignKey("materias.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
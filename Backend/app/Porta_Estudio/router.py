@@ -11,13 +11,16 @@ from fastapi import (
     UploadFile,
     status,
 )
+from fastapi.concurrency import run_in_threadpool
 from fastapi.responses import FileResponse
 from pypdf import PdfReader
 from sqlalchemy.orm import Session
 
 from app import dependencias
+from app.Chatbot import cache_respuestas, recuperacion
 from app.Creacion_mats_prof import crud as crud_catalogos
 from app.database import get_db
+from app.Estadistica.contadores import contadores
 from app.Porta_Estudio import crud, esquemas, modelos
 from app.Usuarios import esquemas as user_schemas
 
@@ -88,7 +91,11 @@ async def subir_recurso(
     else:
         raise HTTPException(status_code=400, detail="Falta archivo o URL.")
 
-    return crud.create_resource_manual(
+    # Guardar e indexar el recurso (fragmentar y escribir el indice de la
+    # materia) es trabajo sincrono: se hace fuera del event loop para no
+    # detener las demas peticiones
+    return await run_in_threadpool(
+        crud.create_resource_manual,
         db=db, title=title, description=description, type=type,
         path=path_final, materia_id=materia_db.id,
         user_id=current_user.id, content_text=texto_extraido
@@ -97,9 +104,7 @@ async def subir_recurso(
 
 @router.get("/download/{resource_id}")
 def download_resource(resource_id: int, db: Session = Depends(get_db)):
-    recurso = db.query(modelos.Resource).filter(
-        modelos.Resource.id == resource_id
-    ).first()
+    recurso = crud.get_resource_for_download(db, resource_id)
 
     if not recurso:
         raise HTTPException(status_code=404, detail="Recurso no encontrado")
@@ -174,6 +179,9 @@ def limpiar_base_de_datos(db: Session = Depends(get_db)):
     try:
         num_borrados = db.query(modelos.Resource).delete()
         db.commit()
+        cache_respuestas.cache.invalidar_todo()
+        recuperacion.indice.limpiar()
+        contadores.invalidar()
         return {
             "mensaje": f"Limpieza completada. Se eliminaron {num_borrados} recs."
         }
@@ -1,5 +1,14 @@
+from typing import Any, Dict, List
+
+from sqlalchemy import delete, func, insert, inspect, select, text, update
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
+from sqlalchemy.schema import CreateColumn
 
+from app.database import SessionLocal, engine
+from app.Estadistica import actividad
+from app.Estadistica import crud as crud_estadistica
+from app.Estadistica.contadores import contadores
 from app.Reviews import esquemas, modelos
 from app.Reviews.modelos import Voto
 
@@ -48,13 +57,116 @@ def create_resena(
         user_id=user_id
     )
     db.add(db_resena)
+    db.flush()
+    # Agregados del ranking de profesores, en la misma transaccion
+    crud_estadistica.registrar_resenas(db, [{
+        "profesor_id": db_resena.profesor_id,
+        "calificacion": db_resena.calificacion,
+        "dificultad": db_resena.dificultad,
+        "comentario": db_resena.comentario,
+    }])
     db.commit()
     db.refresh(db_resena)
+    contadores.incrementar("resenas")
+    actividad.feed.agregar(db, db_resena.id)
     return db_resena
 
 
+def bulk_create_resenas(db: Session, filas: List[Dict[str, Any]]) -> int:
+    """
+    Inserta muchas reseñas con un solo INSERT multiple (executemany).
+
+    No hace commit: el llamador decide cuando cerrar la transaccion.
+    Los agregados de profesor_stats se actualizan en la misma
+    transaccion.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+        filas (List[Dict]): Diccionarios con las columnas de Resena
+            (comentario, calificacion, dificultad, profesor_id,
+            materia_id, user_id).
+
+    Returns:
+        int: Número de reseñas insertadas.
+    """
+    if not filas:
+        return 0
+    db.execute(insert(modelos.Resena), filas)
+    crud_estadistica.registrar_resenas(db, filas)
+    return len(filas)
+
+
 # --- GESTION DE VOTOS ---
 
+def _sumar_votos(
+    db: Session, resena_id: int, utiles: int = 0, no_utiles: int = 0
+):
+    """Suma a los contadores de votos de una reseña (UPDATE atomico)."""
+    db.execute(update(modelos.Resena).where(
+        modelos.Resena.id == resena_id
+    ).values(
+        utiles=modelos.Resena.utiles + utiles,
+        no_utiles=modelos.Resena.no_utiles + no_utiles
+    ))
+
+
+def _aplicar_voto(
+    db: Session, resena_id: int, user_id: int, es_util: bool
+) -> str:
+    """
+    Aplica el voto y ajusta los contadores de la reseña, sin commit.
+
+    Los DELETE y UPDATE del voto llevan como condicion el valor leido,
+    de modo que si otra peticion ya lo cambio no se cuenta dos veces.
+
+    Returns:
+        str: Accion realizada ('registrado', 'eliminado' o
+        'actualizado').
+    """
+    delta = {"utiles": 0, "no_utiles": 0}
+    columna = "utiles" if es_util else "no_utiles"
+    contraria = "no_utiles" if es_util else "utiles"
+
+    # 1. Buscamos si ya existe un voto previo de este usuario para esta reseña
+    voto_existente = db.query(Voto.id, Voto.es_util).filter(
+        Voto.resena_id == resena_id,
+        Voto.user_id == user_id
+    ).first()
+
+    if voto_existente is None:
+        # Si es un voto nuevo, creamos el registro. El indice unico
+        # (resena_id, user_id) rechaza un segundo voto simultaneo.
+        db.add(Voto(resena_id=resena_id, user_id=user_id, es_util=es_util))
+        db.flush()
+        delta[columna] += 1
+        accion = "registrado"
+    elif voto_existente.es_util == es_util:
+        # LOGICA DE CONMUTACION (TOGGLE):
+        # Si el usuario intenta votar lo mismo que ya tenia,
+        # se interpreta como cancelar el voto (borrarlo).
+        resultado = db.execute(delete(Voto).where(
+            Voto.id == voto_existente.id,
+            Voto.es_util == es_util
+        ))
+        if resultado.rowcount:
+            delta[columna] -= 1
+        accion = "eliminado"
+    else:
+        # Si cambia de opinion (Like -> Dislike), actualizamos el registro
+        resultado = db.execute(update(Voto).where(
+            Voto.id == voto_existente.id,
+            Voto.es_util == voto_existente.es_util
+        ).values(es_util=es_util))
+        if resultado.rowcount:
+            delta[columna] += 1
+            delta[contraria] -= 1
+        accion = "actualizado"
+
+    if delta["utiles"] or delta["no_utiles"]:
+        _sumar_votos(db, resena_id, **delta)
+    return accion
+
+
 def votar_resena(db: Session, resena_id: int, user_id: int, es_util: bool):
     """
     Registra, actualiza o elimina un voto de utilidad en una reseña.
@@ -64,6 +176,9 @@ def votar_resena(db: Session, resena_id: int, user_id: int, es_util: bool):
     - Si ya hay voto igual: Lo elimina (quita el like/dislike).
     - Si hay voto diferente: Lo actualiza.
 
+    Los contadores 'utiles' y 'no_utiles' de la reseña se ajustan en la
+    misma transaccion del voto, por lo que no se recuentan los votos.
+
     Args:
         db (Session): Sesión de base de datos.
         resena_id (int): ID de la reseña a votar.
@@ -73,40 +188,112 @@ def votar_resena(db: Session, resena_id: int, user_id: int, es_util: bool):
     Returns:
         tuple: (total_votos_utiles, accion_realizada)
     """
-    # 1. Buscamos si ya existe un voto previo de este usuario para esta reseña
-    voto_existente = db.query(Voto).filter(
-        Voto.resena_id == resena_id,
-        Voto.user_id == user_id
-    ).first()
+    try:
+        accion = _aplicar_voto(db, resena_id, user_id, es_util)
+    except IntegrityError:
+        # Otro voto del mismo usuario se inserto primero: se repite
+        # la operacion sobre ese voto
+        db.rollback()
+        accion = _aplicar_voto(db, resena_id, user_id, es_util)
+    db.commit()
 
-    accion = "registrado"
+    # 2. Leemos el contador para devolverlo al frontend
+    total = db.query(modelos.Resena.utiles).filter(
+        modelos.Resena.id == resena_id
+    ).scalar() or 0
+    actividad.feed.actualizar_votos(resena_id, total)
 
-    if voto_existente:
-        # LOGICA DE CONMUTACION (TOGGLE):
-        # Si el usuario intenta votar lo mismo que ya tenia,
-        # se interpreta como cancelar el voto (borrarlo).
-        if voto_existente.es_util == es_util:
-            db.delete(voto_existente)
-            accion = "eliminado"
-        else:
-            # Si cambia de opinion (Like -> Dislike), actualizamos el registro
-            voto_existente.es_util = es_util
-            accion = "actualizado"
-    else:
-        # Si es un voto nuevo, creamos el registro
-        nuevo_voto = Voto(
-            resena_id=resena_id,
-            user_id=user_id,
-            es_util=es_util
-        )
-        db.add(nuevo_voto)
+    return total, accion
+
+
+# --- CONTADORES DE VOTOS (MANTENIMIENTO) ---
+
+def reconciliar_votos(db: Session) -> int:
+    """
+    Recalcula 'utiles' y 'no_utiles' de todas las reseñas desde la
+    tabla de votos.
+
+    Solo es necesario tras modificar votos directamente en la base de
+    datos; votar_resena mantiene los contadores al dia.
+
+    Args:
+        db (Session): Sesión de la base de datos.
+
+    Returns:
+        int: Numero de reseñas recalculadas.
+    """
+    def contar(es_util: bool):
+        return select(func.count(Voto.id)).where(
+            Voto.resena_id == modelos.Resena.id,
+            Voto.es_util == es_util
+        ).scalar_subquery()
 
+    resultado = db.execute(update(modelos.Resena).values(
+        utiles=contar(True),
+        no_utiles=contar(False)
+    ))
     db.commit()
+    actividad.feed.invalidar()
+    return resultado.rowcount or 0
 
-    # 2. Recalculamos totales de votos positivos para devolver al frontend
-    total = db.query(Voto).filter(
-        Voto.resena_id == resena_id,
-        Voto.es_util == True  # noqa: E712 (SQLAlchemy requiere == True)
-    ).count()
 
-    return total, accion
+def _eliminar_votos_duplicados(db: Session) -> int:
+    """Deja solo el voto mas reciente de cada (reseña, usuario)."""
+    # Tabla derivada: MySQL no permite leer de 'votos' en la subconsulta
+    # de un DELETE sobre 'votos'
+    conservar = select(func.max(Voto.id).label("id")).group_by(
+        Voto.resena_id, Voto.user_id
+    ).subquery()
+    resultado = db.execute(delete(Voto).where(
+        Voto.id.notin_(select(conservar.c.id))
+    ))
+    db.commit()
+    return resultado.rowcount or 0
+
+
+def asegurar_contadores_votos():
+    """
+    Agrega a una base de datos existente las columnas de contadores de
+    votos y el indice unico de votos, y rellena los contadores.
+
+    create_all() solo crea tablas nuevas, por lo que los cambios sobre
+    'resenas' y 'votos' se aplican aqui. Debe llamarse al iniciar la
+    aplicacion.
+    """
+    db = SessionLocal()
+    try:
+        inspector = inspect(engine)
+        columnas = {
+            c["name"] for c in inspector.get_columns("resenas")
+        }
+        indices = {i["name"] for i in inspector.get_indexes("votos")}
+        recalcular = False
+
+        for indice in Voto.__table__.indexes:
+            if indice.name not in indices:
+                borrados = _eliminar_votos_duplicados(db)
+                print(
+                    f"--- Creando indice {indice.name} "
+                    f"({borrados} votos duplicados eliminados) ---"
+                )
+                indice.create(bind=engine)
+                recalcular = recalcular or borrados > 0
+
+        for columna in ("utiles", "no_utiles"):
+            if columna not in columnas:
+                ddl = CreateColumn(
+                    modelos.Resena.__table__.c[columna]
+                ).compile(dialect=engine.dialect)
+                print(f"--- Agregando columna resenas.{columna} ---")
+                db.execute(text(f"ALTER TABLE resenas ADD COLUMN {ddl}"))
+                db.commit()
+                recalcular = True
+
+        if recalcular:
+            total = reconciliar_votos(db)
+            print(f"--- Contadores de votos: {total} reseñas ---")
+    except Exception as e:
+        db.rollback()
+        print(f"Error preparando los contadores de votos: {e}")
+    finally:
+        db.close()
@@ -1,4 +1,6 @@
-from sqlalchemy import Boolean, Column, Float, ForeignKey, Integer, Text
+from sqlalchemy import (
+    Boolean, Column, Float, ForeignKey, Index, Integer, Text
+)
 from sqlalchemy.orm import relationship
 
 from app.database import Base
@@ -20,6 +22,8 @@ class Resena(Base):
         profesor_id (int): Clave foránea del profesor evaluado.
         materia_id (int): Clave foránea de la materia cursada.
         user_id (int): Clave foránea del usuario autor.
+        utiles (int): Votos 'Útil' recibidos (contador desnormalizado).
+        no_utiles (int): Votos 'No útil' recibidos.
     """
     __tablename__ = "resenas"
 
@@ -33,6 +37,13 @@ class Resena(Base):
     materia_id = Column(Integer, ForeignKey("materias.id"))
     user_id = Column(Integer, ForeignKey("users.id"))
 
+    # Contadores de votos mantenidos por votar_resena en la misma
+    # transaccion del voto (ver app.Reviews.crud)
+    utiles = Column(Integer, default=0, server_default="0", nullable=False)
+    no_utiles = Column(
+        Integer, default=0, server_default="0", nullable=False
+    )
+
     # Relaciones con otras entidades
     # Se usan cadenas para evitar importaciones circulares en tiempo de carga
     profesor = relationship(
@@ -52,13 +63,11 @@ class Resena(Base):
     @property
     def total_votos_utiles(self):
         """
-        Calcula dinámicamente el total de votos marcados como 'útiles'.
+        Total de votos marcados como 'útiles'.
 
-        Itera sobre la relación 'votos' cargada en memoria.
-        Nota: Esto puede impactar el rendimiento si hay muchos votos
-        y no se usa eager loading.
+        Se lee de la columna 'utiles', sin cargar la relación 'votos'.
         """
-        return sum(1 for voto in self.votos if voto.es_util)
+        return self.utiles or 0
 
 
 class Voto(Base):
@@ -74,6 +83,13 @@ class Voto(Base):
         es_util (bool): True indica 'Útil' (Like), False indica 'No útil'.
     """
     __tablename__ = "votos"
+    # Un voto por usuario y reseña: evita duplicados si el mismo
+    # usuario vota dos veces a la vez. Ver asegurar_contadores_votos.
+    __table_args__ = (
+        Index(
+            "uq_votos_resena_usuario", "resena_id", "user_id", unique=True
+        ),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"))
@@ -125,3 +125,24 @@ def votar_comentario(
     msg = mensajes.get(accion, "Accion realizada")
 
     return {"mensaje": msg, "total_utiles": total}
+
+
+@router.post("/votos/reconciliar")
+def reconciliar_votos(
+    db: Session = Depends(get_db),
+    admin_user: user_schemas.UserResponse = Depends(dependencias.require_admin)
+):
+    """
+    Recalcula los contadores de votos de todas las reseñas.
+
+    Solo es necesario si se modificaron votos directamente en la base
+    de datos; votar_resena mantiene los contadores al dia.
+
+    Args:
+        db (Session): Sesion de base de datos.
+        admin_user (UserResponse): Usuario administrador autenticado.
+
+    Returns:
+        dict: Numero de reseñas recalculadas.
+    """
+    return {"resenas": crud.reconciliar_votos(db)}
@@ -1,6 +1,7 @@
 from sqlalchemy.orm import Session
 
 from app import auth
+from app.Estadistica.contadores import contadores
 from app.Usuarios import esquemas, modelos
 
 
@@ -45,6 +46,7 @@ def create_user(db: Session, user: esquemas.UserCreate):
     db.add(db_user)
     db.commit()
     db.refresh(db_user)
+    contadores.incrementar("usuarios")
     return db_user
 
 
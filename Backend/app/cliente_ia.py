@@ -0,0 +1,514 @@
+import asyncio
+import json
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Dict, List, Optional
+
+import google.ai.generativelanguage as glm
+import google.generativeai as genai
+from dotenv import load_dotenv
+from google.api_core import exceptions
+
+from app.llaves_ia import PoolLlaves
+
+load_dotenv()
+
+# --- CONFIGURACION ---
+# Maximo de llamadas simultaneas al modelo en todo el proceso
+# (Chatbot + Analisis de WhatsApp comparten este limite).
+MAX_LLAMADAS_CONCURRENTES = int(os.getenv("IA_LLAMADAS_CONCURRENTES", "8"))
+
+# Backend a utilizar: "gemini" (produccion) o "falso" (pruebas locales
+# sin red ni API Keys).
+IA_BACKEND = os.getenv("IA_BACKEND", "gemini")
+
+# Maximo de instancias de GenerativeModel guardadas para reutilizar
+MAX_MODELOS_EN_CACHE = int(os.getenv("IA_MODELOS_EN_CACHE", "32"))
+
+# Numero de latencias recientes por modelo usadas para los percentiles
+MUESTRAS_LATENCIA = 500
+
+# Errores de cuota o disponibilidad que activan el cambio de modelo/llave
+ERRORES_REINTENTABLES = (
+    exceptions.ResourceExhausted,
+    exceptions.ServiceUnavailable,
+    exceptions.InternalServerError,
+)
+
+
+class ErrorIA(Exception):
+    """Se lanza cuando fallan todos los modelos y llaves disponibles."""
+
+
+class RespuestaIA:
+    """
+    Respuesta normalizada del modelo, independiente del backend.
+
+    Atributos:
+        text (str): Texto generado.
+        finish_reason (int): Motivo de fin (2 = MAX_TOKENS).
+        tokens_entrada (int): Tokens del prompt reportados por el modelo.
+        tokens_salida (int): Tokens de la respuesta reportados por el modelo.
+    """
+
+    def __init__(
+        self,
+        text: str,
+        finish_reason: int = 1,
+        tokens_entrada: int = 0,
+        tokens_salida: int = 0
+    ):
+        self.text = text
+        self.finish_reason = finish_reason
+        self.tokens_entrada = tokens_entrada
+        self.tokens_salida = tokens_salida
+
+
+def estimar_tokens(texto: str) -> int:
+    """
+    Estima los tokens de un texto (aprox. 4 caracteres por token).
+
+    Es una aproximación barata para presupuestos y estadísticas; el
+    conteo real lo reporta el modelo en usage_metadata.
+    """
+    return len(texto) // 4 + 1
+
+
+# ==========================================
+# BACKENDS
+# ==========================================
+
+class BackendGemini:
+    """
+    Backend de produccion basado en google-generativeai.
+
+    Usa las llamadas asincronas del SDK (generate_content_async), por lo
+    que nunca bloquea el event loop. Cada llave tiene su propio cliente
+    de la API, asi que no se usa genai.configure (que es global al
+    proceso y haria que dos llamadas simultaneas se cambiaran la llave).
+
+    Las instancias de GenerativeModel se reutilizan entre peticiones
+    (cache por modelo, llave y configuracion) en lugar de crearse en cada
+    intento.
+    """
+
+    def __init__(self):
+        # Un cliente asincrono por llave, creado al primer uso
+        self._clientes: Dict[str, Any] = {}
+        # (modelo, llave, configuracion) -> GenerativeModel, en orden LRU
+        self._modelos: "OrderedDict[tuple, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _cliente(self, llave: str):
+        """Devuelve (o crea) el cliente de la API para una llave."""
+        cliente = self._clientes.get(llave)
+        if cliente is None:
+            cliente = glm.GenerativeServiceAsyncClient(
+                client_options={"api_key": llave}
+            )
+            self._clientes[llave] = cliente
+        return cliente
+
+    def _modelo(
+        self,
+        modelo: str,
+        llave: str,
+        generation_config: Optional[Dict[str, Any]],
+        safety_settings: Optional[List[Dict[str, str]]]
+    ):
+        """
+        Devuelve la instancia de GenerativeModel para esta combinacion,
+        creandola solo la primera vez.
+        """
+        clave = (
+            modelo,
+            llave,
+            json.dumps(generation_config, sort_keys=True),
+            json.dumps(safety_settings, sort_keys=True)
+        )
+        with self._lock:
+            model = self._modelos.get(clave)
+            if model is not None:
+                self._modelos.move_to_end(clave)
+                return model
+
+            model = genai.GenerativeModel(
+                modelo,
+                generation_config=generation_config,
+                safety_settings=safety_settings
+            )
+            # El SDK no permite pasar el cliente en el constructor; si no
+            # se asigna, usaria el cliente global de genai.configure.
+            # '_async_client' es un atributo interno de
+            # google-generativeai 0.8.x (version fijada en
+            # requirements.txt); si una version nueva lo cambia se falla
+            # aqui en lugar de usar en silencio otra llave.
+            if not hasattr(model, "_async_client"):
+                raise RuntimeError(
+                    "google-generativeai ya no tiene "
+                    "GenerativeModel._async_client; revisar la version "
+                    "fijada en requirements.txt"
+                )
+            model._async_client = self._cliente(llave)
+
+            self._modelos[clave] = model
+            if len(self._modelos) > MAX_MODELOS_EN_CACHE:
+                self._modelos.popitem(last=False)
+            return model
+
+    def invalidar_llave(self, llave: str):
+        """
+        Descarta los modelos y el cliente de una llave.
+
+        Se llama cuando la llave agota su cuota; al volver a usarla se
+        crean de nuevo.
+        """
+        with self._lock:
+            for clave in [c for c in self._modelos if c[1] == llave]:
+                del self._modelos[clave]
+            self._clientes.pop(llave, None)
+
+    async def generar(
+        self,
+        modelo: str,
+        llave: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None
+    ) -> RespuestaIA:
+        """Llama al modelo de forma asincrona con la llave indicada."""
+        model = self._modelo(
+            modelo, llave, generation_config, safety_settings
+        )
+        response = await model.generate_content_async(prompt)
+
+        finish_reason = 1
+        if response.candidates and hasattr(
+            response.candidates[0], 'finish_reason'
+        ):
+            finish_reason = response.candidates[0].finish_reason
+
+        # Si el modelo corto la respuesta, response.text puede fallar
+        try:
+            text = response.text
+        except ValueError:
+            text = ""
+
+        usage = getattr(response, "usage_metadata", None)
+        return RespuestaIA(
+            text=text,
+            finish_reason=finish_reason,
+            tokens_entrada=getattr(usage, "prompt_token_count", 0) or 0,
+            tokens_salida=getattr(usage, "candidates_token_count", 0) or 0
+        )
+
+    async def generar_stream(
+        self,
+        modelo: str,
+        llave: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        """Llama al modelo en modo streaming y entrega el texto por partes."""
+        model = self._modelo(
+            modelo, llave, generation_config, safety_settings
+        )
+        response = await model.generate_content_async(prompt, stream=True)
+        async for chunk in response:
+            # Los fragmentos sin texto (p. ej. solo metadatos) se omiten
+            try:
+                texto = chunk.text
+            except ValueError:
+                continue
+            if texto:
+                yield texto
+
+
+class BackendFalso:
+    """
+    Backend local para pruebas: no usa red ni API Keys.
+
+    Simula la latencia del modelo y devuelve una respuesta fija, de modo
+    que se pueden medir concurrencia y throughput sin costo.
+    """
+
+    def __init__(self, latencia: float = 0.5, respuesta: str = "[]"):
+        """
+        Args:
+            latencia (float): Segundos que tarda cada llamada.
+            respuesta (str): Texto devuelto en cada llamada.
+        """
+        self.latencia = latencia
+        self.respuesta = respuesta
+        self.llamadas = 0
+
+    def invalidar_llave(self, llave: str):
+        pass
+
+    async def generar(
+        self,
+        modelo: str,
+        llave: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None
+    ) -> RespuestaIA:
+        self.llamadas += 1
+        await asyncio.sleep(self.latencia)
+        return RespuestaIA(
+            text=self.respuesta,
+            tokens_entrada=estimar_tokens(prompt),
+            tokens_salida=estimar_tokens(self.respuesta)
+        )
+
+    async def generar_stream(
+        self,
+        modelo: str,
+        llave: str,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None
+    ) -> AsyncIterator[str]:
+        self.llamadas += 1
+        palabras = self.respuesta.split(" ")
+        for i, palabra in enumerate(palabras):
+            await asyncio.sleep(self.latencia / len(palabras))
+            yield palabra if i == 0 else f" {palabra}"
+
+
+def crear_backend():
+    """Crea el backend configurado en la variable IA_BACKEND."""
+    if IA_BACKEND == "falso":
+        latencia = float(os.getenv("IA_BACKEND_FALSO_LATENCIA", "0.5"))
+        return BackendFalso(latencia=latencia)
+    return BackendGemini()
+
+
+# ==========================================
+# CLIENTE COMPARTIDO
+# ==========================================
+
+# El semaforo se crea al primer uso dentro del event loop de la app
+_semaforo: Optional[asyncio.Semaphore] = None
+_semaforo_loop = None
+
+
+def _obtener_semaforo() -> asyncio.Semaphore:
+    """Devuelve el semaforo global ligado al event loop actual."""
+    global _semaforo, _semaforo_loop
+    loop = asyncio.get_running_loop()
+    if _semaforo is None or _semaforo_loop is not loop:
+        _semaforo = asyncio.Semaphore(MAX_LLAMADAS_CONCURRENTES)
+        _semaforo_loop = loop
+    return _semaforo
+
+
+# Latencias recientes por modelo (segundos), compartidas entre clientes
+_latencias: Dict[str, deque] = {}
+_errores: Dict[str, int] = {}
+_lock_latencias = threading.Lock()
+
+
+def _registrar_latencia(modelo: str, segundos: float, exito: bool):
+    """Guarda la duracion de una llamada al modelo."""
+    with _lock_latencias:
+        if exito:
+            _latencias.setdefault(
+                modelo, deque(maxlen=MUESTRAS_LATENCIA)
+            ).append(segundos)
+        else:
+            _errores[modelo] = _errores.get(modelo, 0) + 1
+
+
+def _percentil(valores: List[float], p: float) -> float:
+    """Percentil p (0-100) de una lista ya ordenada."""
+    indice = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[indice]
+
+
+def obtener_estadisticas() -> Dict[str, Dict[str, Any]]:
+    """
+    Devuelve, por modelo, los percentiles de latencia de las llamadas
+    exitosas recientes (en milisegundos) y el numero de errores.
+    """
+    with _lock_latencias:
+        muestras = {m: sorted(v) for m, v in _latencias.items()}
+        errores = dict(_errores)
+
+    datos = {}
+    for modelo in set(muestras) | set(errores):
+        valores = muestras.get(modelo, [])
+        datos[modelo] = {"muestras": len(valores)}
+        if valores:
+            for p in (50, 90, 99):
+                datos[modelo][f"p{p}_ms"] = round(
+                    _percentil(valores, p) * 1000, 1
+                )
+        datos[modelo]["errores"] = errores.get(modelo, 0)
+    return datos
+
+
+class ClienteIA:
+    """
+    Cliente asincrono para modelos de lenguaje.
+
+    Centraliza la logica que antes estaba duplicada en el Chatbot y en el
+    Analisis de WhatsApp:
+    - Limite global de llamadas concurrentes (semaforo).
+    - Eleccion de la llave mas sana del pool en cada llamada.
+    - Cambio de modelo y enfriamiento de llaves ante errores de cuota.
+    - Espera entre reintentos con asyncio.sleep (no bloquea el servidor).
+    """
+
+    def __init__(self, backend, modelos: List[str], llaves: PoolLlaves):
+        """
+        Args:
+            backend: Implementacion con los metodos asincronos generar y
+                generar_stream.
+            modelos (List[str]): Modelos en orden de preferencia.
+            llaves (PoolLlaves): Pool de API Keys a utilizar.
+        """
+        self.backend = backend
+        self.modelos = modelos
+        self.llaves = llaves
+
+    async def generar(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None,
+        max_retries: int = 2
+    ) -> RespuestaIA:
+        """
+        Genera una respuesta con reintentos y fallback de modelos/llaves.
+
+        Args:
+            prompt (str): Texto de entrada.
+            generation_config (Dict): Configuracion de generacion.
+            safety_settings (List[Dict]): Filtros de seguridad.
+            max_retries (int): Rondas completas sobre la lista de modelos.
+
+        Returns:
+            RespuestaIA: Respuesta del primer modelo que conteste.
+
+        Raises:
+            ErrorIA: Si se agotan todos los intentos.
+        """
+        model_index = 0
+        total_attempts = max_retries * len(self.modelos)
+
+        for _ in range(total_attempts):
+            modelo = self.modelos[model_index]
+            async with _obtener_semaforo():
+                llave = self.llaves.elegir()
+                inicio = time.perf_counter()
+                try:
+                    respuesta = await self.backend.generar(
+                        modelo, llave, prompt,
+                        generation_config, safety_settings
+                    )
+                except ERRORES_REINTENTABLES as e:
+                    self._registrar_fallo(modelo, llave, e)
+                except BaseException:
+                    _registrar_latencia(modelo, 0.0, exito=False)
+                    self.llaves.liberar(llave, exito=False)
+                    raise
+                else:
+                    _registrar_latencia(
+                        modelo, time.perf_counter() - inicio, exito=True
+                    )
+                    self.llaves.liberar(llave)
+                    return respuesta
+
+            model_index = await self._siguiente_intento(model_index)
+
+        raise ErrorIA("Se agotaron los modelos y llaves disponibles.")
+
+    async def generar_stream(
+        self,
+        prompt: str,
+        generation_config: Optional[Dict[str, Any]] = None,
+        safety_settings: Optional[List[Dict[str, str]]] = None,
+        max_retries: int = 2
+    ) -> AsyncIterator[str]:
+        """
+        Genera una respuesta entregando el texto conforme llega.
+
+        Aplica el mismo fallback de modelos/llaves que generar(), pero
+        solo mientras no se haya entregado ningun fragmento: a partir del
+        primero, un error interrumpe la respuesta.
+
+        Args:
+            prompt (str): Texto de entrada.
+            generation_config (Dict): Configuracion de generacion.
+            safety_settings (List[Dict]): Filtros de seguridad.
+            max_retries (int): Rondas completas sobre la lista de modelos.
+
+        Yields:
+            str: Fragmentos de texto en orden.
+
+        Raises:
+            ErrorIA: Si se agotan los intentos o la respuesta se corta.
+        """
+        model_index = 0
+        total_attempts = max_retries * len(self.modelos)
+
+        for _ in range(total_attempts):
+            modelo = self.modelos[model_index]
+            entregado = False
+            async with _obtener_semaforo():
+                llave = self.llaves.elegir()
+                inicio = time.perf_counter()
+                try:
+                    async for fragmento in self.backend.generar_stream(
+                        modelo, llave, prompt,
+                        generation_config, safety_settings
+                    ):
+                        entregado = True
+                        yield fragmento
+                except ERRORES_REINTENTABLES as e:
+                    self._registrar_fallo(modelo, llave, e)
+                    if entregado:
+                        raise ErrorIA("La respuesta se interrumpio.") from e
+                except GeneratorExit:
+                    # El cliente cerro la conexion; no es falla de la llave
+                    self.llaves.liberar(llave)
+                    raise
+                except BaseException:
+                    _registrar_latencia(modelo, 0.0, exito=False)
+                    self.llaves.liberar(llave, exito=False)
+                    raise
+                else:
+                    _registrar_latencia(
+                        modelo, time.perf_counter() - inicio, exito=True
+                    )
+                    self.llaves.liberar(llave)
+                    return
+
+            model_index = await self._siguiente_intento(model_index)
+
+        raise ErrorIA("Se agotaron los modelos y llaves disponibles.")
+
+    def _registrar_fallo(self, modelo: str, llave: str, error: Exception):
+        """Registra un error de cuota/disponibilidad del modelo."""
+        print(f"Fallo en {modelo}: {error}")
+        _registrar_latencia(modelo, 0.0, exito=False)
+        agotada = isinstance(error, exceptions.ResourceExhausted)
+        self.llaves.liberar(llave, exito=False, agotada=agotada)
+        if agotada:
+            self.backend.invalidar_llave(llave)
+
+    async def _siguiente_intento(self, model_index: int) -> int:
+        """Espera antes de reintentar y devuelve el modelo a usar."""
+        # Intenta cambiar de modelo primero
+        if model_index < len(self.modelos) - 1:
+            await asyncio.sleep(1)
+            return model_index + 1
+
+        # Si fallan los modelos, la siguiente ronda elige otra llave
+        # (la agotada quedo en enfriamiento)
+        await asyncio.sleep(2)
+        return 0
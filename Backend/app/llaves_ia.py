@@ -0,0 +1,180 @@
+import os
+import threading
+import time
+from typing import Any, Dict, List
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Segundos que una llave queda en reposo tras agotar su cuota
+ENFRIAMIENTO_SEGUNDOS = float(os.getenv("IA_LLAVE_ENFRIAMIENTO", "60"))
+
+# Registro de pools creados, para exponer sus contadores
+_pools: Dict[str, "PoolLlaves"] = {}
+
+
+class PoolLlaves:
+    """
+    Conjunto de API Keys de Google Gemini con seguimiento de salud.
+
+    Sustituye a los KeyManager que tenian el Chatbot y el Analisis de
+    WhatsApp. En lugar de un indice global que se rota (y de reconfigurar
+    'genai' para todo el proceso), cada llamada pide una llave con
+    elegir() y la devuelve con liberar(). Una llave que agota su cuota
+    queda en enfriamiento y no se vuelve a elegir hasta que termine.
+
+    Es seguro entre hilos y corrutinas: el estado solo se modifica dentro
+    de un candado y ninguna operacion espera mientras lo tiene.
+    """
+
+    def __init__(self, nombre: str, variables: List[str]):
+        """
+        Carga las llaves desde las variables de entorno indicadas.
+
+        Si ninguna esta definida se usa GEMINI_API_KEY. Las llaves
+        repetidas se usan una sola vez.
+
+        Args:
+            nombre (str): Nombre del pool (para logs y estadisticas).
+            variables (List[str]): Variables de entorno con las llaves.
+
+        Raises:
+            ValueError: Si no se encuentran claves configuradas.
+        """
+        keys = [os.getenv(v) for v in variables]
+        # Filtrar claves vacías o None
+        keys = [k for k in keys if k]
+
+        # El estado se guarda por llave: una llave repetida se contaria
+        # como dos y compartiria sus contadores y su enfriamiento
+        unicas = list(dict.fromkeys(keys))
+        if len(unicas) < len(keys):
+            print(
+                f"{nombre}: {len(keys) - len(unicas)} API Keys repetidas "
+                f"en .env; se usan {len(unicas)} distintas."
+            )
+        keys = unicas
+
+        if not keys:
+            single = os.getenv("GEMINI_API_KEY")
+            if single:
+                keys = [single]
+            else:
+                raise ValueError(
+                    f"{nombre}: No hay API Keys configuradas en .env"
+                )
+
+        self.nombre = nombre
+        self.keys = keys
+        self._lock = threading.Lock()
+        self._estado = {
+            key: {
+                "en_vuelo": 0,
+                "usos": 0,
+                "exitos": 0,
+                "fallos": 0,
+                "agotada": 0,
+                "enfriamiento_hasta": 0.0,
+                "ultimo_uso": 0.0,
+            }
+            for key in keys
+        }
+        _pools[nombre] = self
+
+    def elegir(self) -> str:
+        """
+        Elige la llave mas sana y la marca como en uso.
+
+        Prefiere llaves fuera de enfriamiento, con menos llamadas en vuelo
+        y que lleven mas tiempo sin usarse. Si todas estan en enfriamiento
+        devuelve la que salga antes de el.
+
+        Returns:
+            str: Llave a usar. Debe devolverse con liberar().
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            sanas = [
+                k for k in self.keys
+                if self._estado[k]["enfriamiento_hasta"] <= ahora
+            ]
+            if sanas:
+                key = min(
+                    sanas,
+                    key=lambda k: (
+                        self._estado[k]["en_vuelo"],
+                        self._estado[k]["ultimo_uso"]
+                    )
+                )
+            else:
+                key = min(
+                    self.keys,
+                    key=lambda k: self._estado[k]["enfriamiento_hasta"]
+                )
+
+            estado = self._estado[key]
+            estado["en_vuelo"] += 1
+            estado["usos"] += 1
+            estado["ultimo_uso"] = ahora
+            return key
+
+    def liberar(self, key: str, exito: bool = True, agotada: bool = False):
+        """
+        Devuelve una llave al pool y registra el resultado de la llamada.
+
+        Args:
+            key (str): Llave obtenida con elegir().
+            exito (bool): True si la llamada respondio correctamente.
+            agotada (bool): True si fallo por cuota (ResourceExhausted);
+                la llave entra en enfriamiento.
+        """
+        with self._lock:
+            estado = self._estado[key]
+            estado["en_vuelo"] = max(0, estado["en_vuelo"] - 1)
+            if exito:
+                estado["exitos"] += 1
+                return
+
+            estado["fallos"] += 1
+            if agotada:
+                estado["agotada"] += 1
+                estado["enfriamiento_hasta"] = (
+                    time.monotonic() + ENFRIAMIENTO_SEGUNDOS
+                )
+                print(
+                    f"{self.nombre}: Llave {self.keys.index(key) + 1} en "
+                    f"enfriamiento por {ENFRIAMIENTO_SEGUNDOS:.0f}s."
+                )
+
+    def obtener_estadisticas(self) -> List[Dict[str, Any]]:
+        """
+        Devuelve los contadores de uso de cada llave.
+
+        Las llaves se identifican por su posicion y sus ultimos caracteres,
+        nunca completas.
+        """
+        with self._lock:
+            ahora = time.monotonic()
+            datos = []
+            for i, key in enumerate(self.keys):
+                estado = self._estado[key]
+                restante = max(0.0, estado["enfriamiento_hasta"] - ahora)
+                datos.append({
+                    "llave": f"{i + 1} (...{key[-4:]})",
+                    "en_vuelo": estado["en_vuelo"],
+                    "usos": estado["usos"],
+                    "exitos": estado["exitos"],
+                    "fallos": estado["fallos"],
+                    "agotada": estado["agotada"],
+                    "enfriamiento_restante": round(restante, 1),
+                })
+            return datos
+
+
+def obtener_estadisticas() -> Dict[str, List[Dict[str, Any]]]:
+    """Devuelve los contadores de todos los pools de llaves creados."""
+    return {
+        nombre: pool.obtener_estadisticas()
+        for nombre, pool in _pools.items()
+    }
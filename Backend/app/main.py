@@ -4,13 +4,18 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 
+from app.Analisis_IA import jobs as ai_jobs
 from app.Analisis_IA import router as ai_router
+from app.Chatbot import historial as chat_historial
+from app.Chatbot import indice_materias, limitador, retencion
 from app.Chatbot import router as chatbot_router
 from app.Creacion_mats_prof import router as catalogos_router
 from app.database import Base, engine
+from app.Estadistica import crud as stats_crud
 from app.Estadistica import router as stats_router
 from app.Horarios import router as horarios_router
 from app.Porta_Estudio import router as study_router
+from app.Reviews import crud as reviews_crud
 from app.Reviews import router as reviews_router
 from app.Usuarios import router as user_router
 
@@ -45,6 +50,10 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cuota restante del Chatbot (ver app.Chatbot.limitador)
+    expose_headers=[
+        "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset"
+    ],
 )
 
 # 3. Configuración de Archivos Estáticos (Uploads)
@@ -103,6 +112,36 @@ app.include_router(
     tags=["Dashboard Estadísticas"]
 )
 
+# 5. Tareas en Segundo Plano
+# Los workers de analisis de WhatsApp arrancan con la aplicacion y
+# reanudan los trabajos que quedaron inconclusos en un reinicio.
+# Tambien se precargan los indices en memoria del Chatbot y se inician
+# el guardado y la retencion (archivo/purga) de su historial. La tabla
+# profesor_stats se calcula si aun esta vacia.
+
+@app.on_event("startup")
+async def iniciar_tareas_segundo_plano():
+    """Inicia los workers de analisis y reanuda trabajos pendientes."""
+    indice_materias.cargar_indice()
+    reviews_crud.asegurar_contadores_votos()
+    stats_crud.asegurar_profesor_stats()
+    limitador.cargar_contadores()
+    chat_historial.iniciar_volcado()
+    retencion.iniciar_retencion()
+    await ai_jobs.iniciar_workers()
+
+
+@app.on_event("shutdown")
+async def detener_tareas_segundo_plano():
+    """
+    Detiene los workers de analisis y guarda el historial pendiente y
+    los contadores de limite del Chatbot al apagar el servidor.
+    """
+    await ai_jobs.detener_workers()
+    retencion.detener_retencion()
+    await chat_historial.detener_volcado()
+    limitador.guardar_contadores()
+
 
 @app.get("/")
 def read_root():
@@ -0,0 +1,74 @@
+"""
+Configuracion comun de las pruebas.
+
+Las pruebas usan una base de datos SQLite temporal y el backend falso de
+IA (app.cliente_ia.BackendFalso), por lo que no necesitan MySQL, red ni
+API Keys. Las variables de entorno se definen antes de importar 'app'.
+"""
+import os
+import tempfile
+
+_DIRECTORIO = tempfile.mkdtemp(prefix="ets_pruebas_")
+
+os.environ["DATABASE_URL"] = f"sqlite:///{_DIRECTORIO}/ets.db"
+os.environ["IA_BACKEND"] = "falso"
+os.environ["IA_BACKEND_FALSO_LATENCIA"] = "0"
+os.environ["INDICE_RECURSOS_DIR"] = os.path.join(_DIRECTORIO, "indices")
+os.environ.setdefault("GEMINI_API_KEY", "llave-de-prueba")
+os.environ.setdefault("MAIL_USERNAME", "pruebas")
+os.environ.setdefault("MAIL_PASSWORD", "pruebas")
+os.environ.setdefault("MAIL_FROM", "pruebas@example.com")
+os.environ.setdefault("MAIL_SERVER", "localhost")
+
+import pytest  # noqa: E402
+from sqlalchemy import event  # noqa: E402
+from sqlalchemy.dialects.mysql import LONGTEXT  # noqa: E402
+from sqlalchemy.ext.compiler import compiles  # noqa: E402
+
+
+@compiles(LONGTEXT, "sqlite")
+def _longtext_sqlite(tipo, compilador, **kw):
+    """SQLite no tiene LONGTEXT; se usa TEXT."""
+    return "TEXT"
+
+
+from app.database import Base, SessionLocal, engine  # noqa: E402
+from app import main  # noqa: E402,F401  (registra todos los modelos)
+
+
+@event.listens_for(engine, "connect")
+def _activar_llaves_foraneas(conexion, registro):
+    """SQLite ignora las llaves foraneas salvo que se activen (como MySQL)."""
+    cursor = conexion.cursor()
+    cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.close()
+
+
+@pytest.fixture
+def db():
+    """Sesion sobre una base de datos vacia con todas las tablas."""
+    engine.dispose()
+    Base.metadata.drop_all(bind=engine)
+    Base.metadata.create_all(bind=engine)
+    sesion = SessionLocal()
+    try:
+        yield sesion
+    finally:
+        sesion.close()
+
+
+@pytest.fixture
+def usuario(db):
+    """Usuario estudiante registrado."""
+    from app.Usuarios.modelos import User
+
+    user = User(
+        email="alumno@example.com",
+        full_name="Alumno Prueba",
+        career="ISC",
+        hashed_password="x",
+        role="student"
+    )
+    db.add(user)
+    db.commit()
+    return user
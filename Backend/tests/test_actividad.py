@@ -0,0 +1,77 @@
+"""
+Pruebas del feed de actividad reciente del dashboard
+(app.Estadistica.actividad y GET /api/stats/actividad-reciente).
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event
+
+from app.Creacion_mats_prof import esquemas as esquemas_catalogos
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.database import engine
+from app.Estadistica import actividad
+from app.main import app
+from app.Reviews import crud as crud_reviews
+from app.Reviews import esquemas
+
+
+@pytest.fixture
+def cliente():
+    actividad.feed.invalidar()
+    yield TestClient(app)
+    actividad.feed.invalidar()
+
+
+def _resena(db, usuario, profesor_id, materia_id, comentario):
+    return crud_reviews.create_resena(db, esquemas.ResenaCreate(
+        comentario=comentario, calificacion=9.0, dificultad=5,
+        profesor_id=profesor_id, materia_nombre="Redes"
+    ), materia_id, usuario.id)
+
+
+@pytest.mark.parametrize("limit", [0, -1, actividad.TAMANO_FEED + 1])
+def test_limite_fuera_del_feed_se_rechaza(db, cliente, limit):
+    respuesta = cliente.get(
+        "/api/stats/actividad-reciente", params={"limit": limit}
+    )
+
+    assert respuesta.status_code == 422
+
+
+def test_feed_se_sirve_desde_memoria(db, usuario, cliente):
+    profesor_id = crud_catalogos.create_profesor(
+        db, esquemas_catalogos.ProfesorCreate(nombre="Lopez Juan")
+    ).id
+    materia_id = crud_catalogos.create_materia(
+        db, esquemas_catalogos.MateriaCreate(nombre="Redes")
+    ).id
+    for i in range(3):
+        _resena(db, usuario, profesor_id, materia_id, f"Reseña {i}")
+
+    primera = cliente.get("/api/stats/actividad-reciente")
+    nueva = _resena(db, usuario, profesor_id, materia_id, "La mas nueva")
+
+    consultas = []
+
+    def registrar(conexion, cursor, sql, *args):
+        consultas.append(sql)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        respuesta = cliente.get(
+            "/api/stats/actividad-reciente",
+            params={"limit": actividad.TAMANO_FEED}
+        )
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert [r["comentario"] for r in primera.json()] == [
+        "Reseña 2", "Reseña 1", "Reseña 0"
+    ]
+    assert respuesta.status_code == 200
+    assert consultas == []
+    items = respuesta.json()
+    assert len(items) == 4
+    assert items[0]["id"] == nueva.id
+    assert items[0]["profesor"] == "Lopez Juan"
+    assert items[0]["materia"] == "Redes"
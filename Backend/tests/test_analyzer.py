@@ -0,0 +1,378 @@
+"""
+Pruebas y benchmark del Analisis de WhatsApp (app.Analisis_IA.analyzer)
+con un modelo local falso que simula la latencia de Gemini.
+"""
+import asyncio
+import json
+import random
+import re
+import time
+
+import pytest
+from sqlalchemy import event
+
+from app.Analisis_IA import analyzer, cache, crud, jobs, modelos
+from app.Analisis_IA import router as analisis_router
+from app.cliente_ia import BackendFalso, ErrorIA, RespuestaIA
+from app.database import engine
+
+# Latencia simulada de cada llamada al modelo (segundos)
+LATENCIA_MODELO = 0.02
+
+
+class BackendEco(BackendFalso):
+    """
+    Modelo falso que devuelve una reseña por lote, con el numero del
+    primer mensaje, tras una latencia aleatoria (los lotes terminan
+    en desorden).
+    """
+
+    async def generar(self, modelo, llave, prompt, generation_config=None,
+                      safety_settings=None):
+        self.llamadas += 1
+        numero = re.search(r"\[0\] .*?: mensaje (\d+) ", prompt).group(1)
+        await asyncio.sleep(self.latencia * random.uniform(0.5, 1.5))
+        texto = json.dumps([
+            {"n": f"Lopez {numero}", "c": "Explica bien", "s": 9, "d": 3,
+             "id": 0}
+        ])
+        return RespuestaIA(text=texto)
+
+
+class BackendAgotado(BackendEco):
+    """Contesta los primeros lotes y luego agota modelos y llaves."""
+
+    def __init__(self, lotes_exitosos, **kwargs):
+        super().__init__(**kwargs)
+        self.lotes_exitosos = lotes_exitosos
+
+    async def generar(self, modelo, llave, prompt, *args, **kwargs):
+        if self.llamadas >= self.lotes_exitosos:
+            self.llamadas += 1
+            raise ErrorIA("Se agotaron los modelos y llaves disponibles.")
+        return await super().generar(modelo, llave, prompt)
+
+
+class BackendCorte(BackendFalso):
+    """
+    Corta la respuesta (MAX_TOKENS) de los lotes con mas de
+    'max_mensajes' mensajes y extrae una reseña por mensaje del resto.
+    """
+
+    def __init__(self, max_mensajes, **kwargs):
+        super().__init__(latencia=0, **kwargs)
+        self.max_mensajes = max_mensajes
+        self.tamanos = []
+
+    async def generar(self, modelo, llave, prompt, *args, **kwargs):
+        self.llamadas += 1
+        numeros = re.findall(r"\[(\d+)\] .*?: mensaje (\d+) ", prompt)
+        self.tamanos.append(len(numeros))
+        if len(numeros) > self.max_mensajes:
+            return RespuestaIA(text="[", finish_reason=2)
+        texto = json.dumps([
+            {"n": f"Lopez {numero}", "c": "Explica bien", "s": 9, "d": 3,
+             "id": int(local)}
+            for local, numero in numeros
+        ])
+        return RespuestaIA(text=texto, tokens_entrada=100, tokens_salida=50)
+
+
+def _mensajes(total, prefijo):
+    return [
+        {"date": "01/01/2024", "time": "10:00", "author": f"Autor {i % 7}",
+         "message": f"mensaje {i} {prefijo} sobre la clase de hoy"}
+        for i in range(total)
+    ]
+
+
+def _analizar(monkeypatch, mensajes, concurrencia):
+    backend = BackendEco(latencia=LATENCIA_MODELO)
+    monkeypatch.setattr(analyzer.cliente_ia, "backend", backend)
+    monkeypatch.setattr(analyzer, "MAX_CONCURRENT_BATCHES", concurrencia)
+    monkeypatch.setattr(analyzer, "MAX_BATCH_MESSAGES", 50)
+
+    inicio = time.perf_counter()
+    resenas = asyncio.run(analyzer.analyze_reviews(mensajes))
+    return resenas, time.perf_counter() - inicio, backend.llamadas
+
+
+def test_lotes_en_paralelo_conservan_el_orden(db, monkeypatch):
+    resenas, _, llamadas = _analizar(
+        monkeypatch, _mensajes(1000, "orden"), concurrencia=8
+    )
+
+    numeros = [int(r["profesor_nombre"].split()[1]) for r in resenas]
+    assert len(resenas) == llamadas == 20
+    assert numeros == sorted(numeros)
+    assert resenas[0]["autor_original"] == "Autor 0"
+
+
+def test_modelos_agotados_no_cuentan_el_lote_como_analizado(
+    db, usuario, monkeypatch
+):
+    monkeypatch.setattr(
+        analyzer.cliente_ia, "backend", BackendAgotado(1, latencia=0)
+    )
+    monkeypatch.setattr(analyzer, "MAX_CONCURRENT_BATCHES", 1)
+    monkeypatch.setattr(analyzer, "MAX_BATCH_MESSAGES", 50)
+    mensajes = [
+        dict(m, timestamp=f"01/01/2024 10:{i % 60:02d}")
+        for i, m in enumerate(_mensajes(150, "agotado"))
+    ]
+    trabajo = crud.create_trabajo(db, "admin@example.com", "chat.txt")
+    analisis_router._guardar_bloque(db, trabajo.id, mensajes, 0)
+    crud.activar_trabajo(db, trabajo.id, len(mensajes))
+
+    asyncio.run(jobs.procesar_trabajo(trabajo.id))
+
+    db.expire_all()
+    trabajo = crud.get_trabajo(db, trabajo.id)
+    assert trabajo.estado == "error"
+    # Solo avanza el lote que si se analizo
+    assert trabajo.mensajes_analizados == 50
+    assert trabajo.lotes_completados == 1
+    # Las huellas se liberan: una nueva subida analiza todo el chat
+    assert db.query(modelos.MensajeProcesado).count() == 0
+    assert len(cache.reservar_mensajes_nuevos(db, mensajes)) == 150
+
+
+def test_lotes_respetan_el_presupuesto_de_tokens(monkeypatch):
+    monkeypatch.setattr(analyzer, "MAX_BATCH_MESSAGES", 30)
+    mensajes = analyzer.prepare_messages(_mensajes(200, "presupuesto"))
+    # Un mensaje enorme que por si solo excede el presupuesto
+    mensajes[50]["message"] = "x" * 4000
+    batcher = analyzer.AdaptiveBatcher(token_budget=200)
+
+    lotes = list(batcher.batches(mensajes))
+
+    def costo(lote):
+        return sum(
+            analyzer.estimar_tokens(analyzer._message_line(j, m))
+            for j, m in enumerate(lote)
+        )
+
+    assert [m for _, lote in lotes for m in lote] == mensajes
+    assert lotes[-1][0] == len(mensajes)
+    for _, lote in lotes:
+        assert 1 <= len(lote) <= 30
+        assert len(lote) == 1 or costo(lote) <= 200
+    assert [lote for _, lote in lotes if mensajes[50] in lote] == [
+        [mensajes[50]]
+    ]
+    # Con un presupuesto holgado manda el tope de mensajes por lote
+    holgado = analyzer.AdaptiveBatcher(token_budget=100_000)
+    assert [len(lote) for _, lote in holgado.batches(mensajes)] == [
+        30, 30, 30, 30, 30, 30, 20
+    ]
+
+
+def test_lote_cortado_se_divide_y_reduce_el_presupuesto(db, monkeypatch):
+    backend = BackendCorte(max_mensajes=10)
+    monkeypatch.setattr(analyzer.cliente_ia, "backend", backend)
+    mensajes = analyzer.prepare_messages(_mensajes(40, "corte"))
+    batcher = analyzer.AdaptiveBatcher(token_budget=4000)
+
+    resenas = asyncio.run(
+        analyzer.analyze_batch_with_retry(mensajes, batcher=batcher)
+    )
+
+    # 40 -> 20 + 20 -> cuatro lotes de 10 que si se contestan
+    assert sorted(backend.tamanos) == [10, 10, 10, 10, 20, 20, 40]
+    assert [r["autor_original_id"] for r in resenas] == [
+        m["id"] for m in mensajes
+    ]
+    assert batcher.stats["divisiones"] == 3
+    assert batcher.stats["lotes"] == 4
+    assert batcher.stats["tokens_entrada"] == 400
+    assert batcher.stats["tokens_salida"] == 200
+    # Tres divisiones (4000 -> 500) y luego cuatro respuestas cortas
+    esperado = 4000 // 8
+    for _ in range(4):
+        esperado = int(esperado * analyzer.GROWTH_FACTOR)
+    assert batcher.token_budget == esperado
+
+
+def test_estadisticas_del_analisis(db, monkeypatch):
+    monkeypatch.setattr(
+        analyzer.cliente_ia, "backend", BackendCorte(max_mensajes=10)
+    )
+    monkeypatch.setattr(analyzer, "MAX_BATCH_MESSAGES", 20)
+    stats = {}
+
+    resenas = asyncio.run(analyzer.analyze_reviews(
+        _mensajes(60, "estadisticas"), stats=stats
+    ))
+
+    assert len(resenas) == 60
+    assert stats["lotes"] == 6
+    assert stats["divisiones"] == 3
+    assert stats["tokens_entrada"] == 600
+    assert stats["presupuesto_tokens"] > 0
+
+
+def test_presupuesto_se_ajusta_entre_limites():
+    batcher = analyzer.AdaptiveBatcher(token_budget=4000)
+
+    batcher.record_split()
+    assert batcher.token_budget == 2000
+    for _ in range(20):
+        batcher.record_split()
+    assert batcher.token_budget == analyzer.MIN_BATCH_TOKEN_BUDGET
+
+    # Respuestas cortas: el presupuesto crece un 25% por lote
+    batcher.record_response(1000, 10)
+    assert batcher.token_budget == int(
+        analyzer.MIN_BATCH_TOKEN_BUDGET * analyzer.GROWTH_FACTOR
+    )
+    # Respuestas largas: el presupuesto se mantiene
+    presupuesto = batcher.token_budget
+    batcher.record_response(1000, analyzer.MAX_OUTPUT_TOKENS // 2)
+    assert batcher.token_budget == presupuesto
+    for _ in range(50):
+        batcher.record_response(1000, 10)
+    assert batcher.token_budget == analyzer.MAX_BATCH_TOKEN_BUDGET
+
+    assert batcher.stats == {
+        "lotes": 52,
+        "divisiones": 21,
+        "tokens_entrada": 52_000,
+        "tokens_salida": 10 * 51 + analyzer.MAX_OUTPUT_TOKENS // 2,
+        "presupuesto_tokens": analyzer.MAX_BATCH_TOKEN_BUDGET,
+    }
+
+
+@pytest.mark.benchmark
+def test_benchmark_lotes_concurrentes(db, monkeypatch):
+    _, secuencial, llamadas = _analizar(
+        monkeypatch, _mensajes(2000, "secuencial"), concurrencia=1
+    )
+    _, paralelo, _ = _analizar(
+        monkeypatch, _mensajes(2000, "paralelo"), concurrencia=4
+    )
+
+    print(
+        f"\n{llamadas} lotes con {LATENCIA_MODELO * 1000:.0f} ms por "
+        f"llamada: secuencial {secuencial:.2f} s, "
+        f"4 concurrentes {paralelo:.2f} s "
+        f"({secuencial / paralelo:.1f}x)"
+    )
+    assert paralelo * 1.5 < secuencial
+
+
+def _tiempo_reasociacion(total_mensajes, total_resenas=2000):
+    mensajes = analyzer.prepare_messages(
+        _mensajes(total_mensajes, "autores")
+    )
+    messages_by_id = {m["id"]: m for m in mensajes}
+    resenas = [
+        {"profesor_nombre": "Lopez", "autor_original_id": str(i)}
+        for i in random.sample(range(total_mensajes), total_resenas)
+    ]
+
+    inicio = time.perf_counter()
+    analyzer.reattach_authors(resenas, messages_by_id)
+    return time.perf_counter() - inicio
+
+
+def test_reasociacion_de_autores():
+    resenas = [
+        {"autor_original_id": "3"},
+        {"autor_original_id": "999"},
+        {"autor_original_id": "abc"},
+    ]
+    mensajes = analyzer.prepare_messages(_mensajes(10, "ids"))
+    analyzer.reattach_authors(resenas, {m["id"]: m for m in mensajes})
+
+    assert [r["autor_original"] for r in resenas] == [
+        "Autor 3", "Desconocido", "abc"
+    ]
+    assert all("autor_original_id" not in r for r in resenas)
+
+
+@pytest.mark.benchmark
+def test_benchmark_reasociacion_no_crece_con_el_chat():
+    pequeno = min(_tiempo_reasociacion(10_000) for _ in range(3))
+    grande = min(_tiempo_reasociacion(150_000) for _ in range(3))
+
+    print(
+        f"\nReasociar 2000 reseñas: chat de 10k mensajes "
+        f"{pequeno * 1000:.2f} ms, chat de 150k {grande * 1000:.2f} ms"
+    )
+    # Con la busqueda lineal anterior el chat 15 veces mayor tardaba
+    # del orden de 15 veces mas
+    assert grande < pequeno * 5
+
+
+def _resenas_lote(lote, total=20):
+    return [
+        {"profesor_nombre": f"Lopez {lote}-{i}", "comentario": "Explica bien",
+         "calificacion": 9, "dificultad": 3, "autor_original": "Autor 0"}
+        for i in range(total)
+    ]
+
+
+def test_registrar_lote_agrega_sin_reescribir_las_anteriores(db):
+    trabajo = crud.create_trabajo(db, "admin@example.com", "chat.txt")
+    consultas = []
+
+    def registrar(conexion, cursor, sql, *args):
+        consultas.append(sql.lower())
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        for lote in range(3):
+            crud.registrar_lote(
+                db, trabajo, (lote + 1) * 50, _resenas_lote(lote), {}
+            )
+        # Un lote sin reseñas no agrega fila
+        crud.registrar_lote(db, trabajo, 200, [], {})
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert sum("insert into resenas_lote" in sql for sql in consultas) == 3
+    assert not any(
+        "resenas_json" in sql for sql in consultas
+        if sql.startswith("update trabajos_analisis")
+    )
+    db.expire_all()
+    assert trabajo.resenas_encontradas == 60
+    assert trabajo.lotes_completados == 4
+    assert [r["profesor_nombre"] for r in crud.get_resenas_trabajo(
+        db, trabajo
+    )] == [f"Lopez {lote}-{i}" for lote in range(3) for i in range(20)]
+
+
+def test_trabajo_antiguo_conserva_sus_resenas(db):
+    trabajo = crud.create_trabajo(db, "admin@example.com", "chat.txt")
+    # Trabajo interrumpido antes de la tabla 'resenas_lote'
+    trabajo.resenas_json = json.dumps(_resenas_lote("antiguo", 2))
+    trabajo.resenas_encontradas = 2
+    db.commit()
+
+    crud.registrar_lote(db, trabajo, 100, _resenas_lote("nuevo", 1), {})
+
+    assert trabajo.resenas_encontradas == 3
+    assert [r["profesor_nombre"] for r in crud.get_resenas_trabajo(
+        db, trabajo
+    )] == ["Lopez antiguo-0", "Lopez antiguo-1", "Lopez nuevo-0"]
+
+
+@pytest.mark.benchmark
+def test_benchmark_registrar_lote_no_crece_con_el_trabajo(db):
+    trabajo = crud.create_trabajo(db, "admin@example.com", "chat.txt")
+    tiempos = []
+    for lote in range(400):
+        resenas = _resenas_lote(lote)
+        inicio = time.perf_counter()
+        crud.registrar_lote(db, trabajo, (lote + 1) * 50, resenas, {})
+        tiempos.append(time.perf_counter() - inicio)
+
+    primeros = sorted(tiempos[:50])[25]
+    ultimos = sorted(tiempos[-50:])[25]
+    print(
+        f"\nregistrar_lote con 20 reseñas por lote (mediana): lotes 1-50 "
+        f"{primeros * 1000:.2f} ms, lotes 351-400 {ultimos * 1000:.2f} ms "
+        f"({trabajo.resenas_encontradas} reseñas en total)"
+    )
+    assert ultimos < primeros * 3
@@ -0,0 +1,50 @@
+"""
+Pruebas de la deduplicacion de mensajes entre subidas de chats
+(app.Analisis_IA.cache).
+"""
+from app.Analisis_IA import cache, crud, jobs, modelos
+
+
+def _mensajes(inicio, fin):
+    return [
+        {"timestamp": f"01/02/2024 10:{i % 60:02d}",
+         "author": f"Alumno {i}", "message": f"Opinion {i} del profe"}
+        for i in range(inicio, fin)
+    ]
+
+
+def _encolar(db, mensajes):
+    trabajo = crud.create_trabajo(db, "admin@example.com", "chat.txt")
+    nuevos = cache.reservar_mensajes_nuevos(db, mensajes)
+    crud.agregar_mensajes_trabajo(db, trabajo.id, nuevos, 0)
+    return trabajo, nuevos
+
+
+def test_subidas_solapadas_no_repiten_mensajes(db):
+    # El segundo chat incluye los primeros 50 mensajes del primero, y se
+    # sube antes de que el primer trabajo termine
+    _, primeros = _encolar(db, _mensajes(0, 100) + _mensajes(0, 10))
+    _, segundos = _encolar(db, _mensajes(50, 150))
+
+    assert len(primeros) == 100
+    assert segundos == _mensajes(100, 150)
+    assert db.query(modelos.MensajeProcesado).count() == 150
+
+
+def test_trabajo_fallido_libera_sus_mensajes(db):
+    trabajo, _ = _encolar(db, _mensajes(0, 20))
+
+    jobs._marcar_error(db, trabajo.id, RuntimeError("sin cuota"))
+
+    assert crud.get_trabajo(db, trabajo.id).estado == "error"
+    _, de_nuevo = _encolar(db, _mensajes(0, 20))
+    assert len(de_nuevo) == 20
+
+
+def test_subida_cancelada_libera_sus_mensajes(db):
+    trabajo, _ = _encolar(db, _mensajes(0, 20))
+
+    crud.eliminar_trabajo(db, trabajo.id)
+
+    assert db.query(modelos.MensajeProcesado).count() == 0
+    assert db.query(modelos.MensajeTrabajo).count() == 0
@@ -0,0 +1,77 @@
+"""
+Pruebas del cache de respuestas del Chatbot
+(app.Chatbot.cache_respuestas).
+"""
+from app.Chatbot import cache_respuestas
+
+HISTORIAL = [
+    {"role": "user", "content": "Estoy viendo derivadas"},
+    {"role": "assistant", "content": "Perfecto, ¿que duda tienes?"},
+]
+
+
+def _guardar(cache, materia_id, pregunta, respuesta, huella=""):
+    cache.guardar(
+        materia_id, pregunta, respuesta,
+        version=cache.version(materia_id), huella=huella
+    )
+
+
+def test_respuestas_separadas_por_historial():
+    cache = cache_respuestas.CacheRespuestas()
+    con_historial = cache_respuestas.huella_historial(HISTORIAL)
+    _guardar(cache, 1, "Explica la regla de la cadena", "Sin contexto")
+    _guardar(
+        cache, 1, "Explica la regla de la cadena", "Con contexto",
+        huella=con_historial
+    )
+
+    assert cache_respuestas.huella_historial([]) == ""
+    assert cache.obtener(1, "explica la regla de la cadena") == (
+        "Sin contexto"
+    )
+    assert cache.obtener(
+        1, "Explica la regla de la cadena", con_historial
+    ) == "Con contexto"
+    otro = cache_respuestas.huella_historial(HISTORIAL[:1])
+    assert cache.obtener(1, "Explica la regla de la cadena", otro) is None
+
+
+def test_busqueda_de_parecidas_acotada(monkeypatch):
+    monkeypatch.setattr(cache_respuestas, "CACHE_MAX_COMPARACIONES", 10)
+    cache = cache_respuestas.CacheRespuestas()
+    for i in range(100):
+        _guardar(
+            cache, 1, f"Como resuelvo el ejercicio numero{i} de limites",
+            f"Respuesta {i}"
+        )
+
+    # Solo se comparan las 10 entradas mas recientes del grupo
+    assert cache.obtener(
+        1, "Como resuelvo el ejercicio numero95 de limites?"
+    ) == "Respuesta 95"
+    assert cache.obtener(
+        1, "Oye como resuelvo el ejercicio numero3 de limites"
+    ) is None
+    # Otra materia no entra en la comparacion
+    assert cache.obtener(
+        2, "Como resuelvo el ejercicio numero99 de limites?"
+    ) is None
+
+
+def test_expulsion_e_invalidacion_mantienen_los_grupos(monkeypatch):
+    monkeypatch.setattr(cache_respuestas, "CACHE_MAX_ENTRADAS", 5)
+    cache = cache_respuestas.CacheRespuestas()
+    for i in range(8):
+        _guardar(cache, i % 2, f"pregunta distinta {i}", f"r{i}")
+
+    assert cache.obtener_estadisticas()["entradas"] == 5
+    assert sum(len(g) for g in cache._grupos.values()) == 5
+
+    cache.invalidar_materia(0)
+    assert all(clave[0] == 1 for clave in cache._entradas)
+    assert all(grupo[0] == 1 for grupo in cache._grupos)
+    assert cache.obtener(1, "pregunta distinta 7") == "r7"
+
+    cache.invalidar_todo()
+    assert not cache._entradas and not cache._grupos
@@ -0,0 +1,174 @@
+"""
+Pruebas del Chatbot con respuesta en streaming (Server-Sent Events):
+POST /api/bot/preguntar/stream.
+"""
+import asyncio
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from google.api_core import exceptions
+from starlette.requests import Request
+
+from app import cliente_ia as modulo_cliente
+from app.Chatbot import esquemas, historial
+from app.Chatbot import router as chatbot_router
+from app.cliente_ia import BackendFalso
+from app.main import app
+
+PREGUNTA = "Como organizo mejor mis tiempos de estudio"
+
+
+class BackendStream(BackendFalso):
+    """
+    Entrega, en cada llamada, los fragmentos del guion y luego lanza su
+    error (si tiene).
+    """
+
+    def __init__(self, guion):
+        super().__init__(latencia=0)
+        self.guion = list(guion)
+        self.modelos = []
+
+    async def generar_stream(self, modelo, llave, prompt, *args, **kwargs):
+        self.modelos.append(modelo)
+        fragmentos, error = self.guion.pop(0)
+        for fragmento in fragmentos:
+            await asyncio.sleep(0)
+            yield fragmento
+        if error is not None:
+            raise error
+
+
+@pytest.fixture
+def buffer(monkeypatch):
+    """Historial vacio en memoria para cada prueba."""
+    nuevo = historial.BufferHistorial()
+    monkeypatch.setattr(historial, "buffer", nuevo)
+    return nuevo
+
+
+@pytest.fixture
+def backend(monkeypatch):
+    """Instala un BackendStream con el guion indicado."""
+    # Sin esperas reales entre reintentos
+    dormir = asyncio.sleep
+    monkeypatch.setattr(
+        modulo_cliente.asyncio, "sleep", lambda *a, **k: dormir(0)
+    )
+
+    def instalar(*guion):
+        falso = BackendStream(guion)
+        monkeypatch.setattr(chatbot_router.cliente_ia, "backend", falso)
+        return falso
+
+    return instalar
+
+
+def _eventos(cuerpo):
+    eventos = []
+    for bloque in cuerpo.strip().split("\n\n"):
+        nombre = None
+        for linea in bloque.split("\n"):
+            if linea.startswith("event: "):
+                nombre = linea[len("event: "):]
+            elif linea.startswith("data: "):
+                eventos.append((nombre, json.loads(linea[len("data: "):])))
+    return eventos
+
+
+def _preguntar(user_id):
+    respuesta = TestClient(app).post("/api/bot/preguntar/stream", json={
+        "texto": PREGUNTA, "user_id": user_id
+    })
+    assert respuesta.status_code == 200
+    assert respuesta.headers["content-type"].startswith("text/event-stream")
+    return _eventos(respuesta.text)
+
+
+def _historial(buffer, db, user_id):
+    return [
+        (m["role"], m["content"])
+        for m in buffer.recientes(user_id, 10, db)
+    ]
+
+
+def test_secuencia_de_eventos_y_respuesta_guardada(
+    db, usuario, buffer, backend
+):
+    falso = backend((["Planea ", "bloques ", "de 25 minutos."], None))
+
+    eventos = _preguntar(usuario.id)
+
+    assert eventos == [
+        (None, {"texto": "Planea "}),
+        (None, {"texto": "bloques "}),
+        (None, {"texto": "de 25 minutos."}),
+        ("fin", {"respuesta": "Planea bloques de 25 minutos."}),
+    ]
+    assert falso.modelos == [chatbot_router.AVAILABLE_MODELS[0]]
+    assert _historial(buffer, db, usuario.id) == [
+        ("user", PREGUNTA), ("model", "Planea bloques de 25 minutos.")
+    ]
+
+
+def test_cambia_de_modelo_antes_del_primer_fragmento(
+    db, usuario, buffer, backend
+):
+    falso = backend(
+        ([], exceptions.ResourceExhausted("cuota")),
+        (["Usa ", "un calendario."], None),
+    )
+
+    eventos = _preguntar(usuario.id)
+
+    assert falso.modelos == chatbot_router.AVAILABLE_MODELS[:2]
+    assert [datos for nombre, datos in eventos if nombre is None] == [
+        {"texto": "Usa "}, {"texto": "un calendario."}
+    ]
+    assert eventos[-1] == ("fin", {"respuesta": "Usa un calendario."})
+
+
+def test_aviso_si_la_respuesta_se_interrumpe(db, usuario, buffer, backend):
+    falso = backend(
+        (["Primero ", "descansa "], exceptions.ServiceUnavailable("caido"))
+    )
+
+    eventos = _preguntar(usuario.id)
+
+    aviso = f"\n\n{chatbot_router.RESPUESTA_SATURADO}"
+    completa = f"Primero descansa {aviso}"
+    # No se reintenta con otro modelo: ya se habia enviado texto
+    assert len(falso.modelos) == 1
+    assert eventos == [
+        (None, {"texto": "Primero "}),
+        (None, {"texto": "descansa "}),
+        (None, {"texto": aviso}),
+        ("fin", {"respuesta": completa}),
+    ]
+    assert _historial(buffer, db, usuario.id)[-1] == ("model", completa)
+
+
+def test_desconexion_guarda_lo_generado(db, usuario, buffer, backend):
+    backend((["Divide ", "el temario ", "por semanas."], None))
+    peticion = Request({
+        "type": "http", "headers": [], "client": ("10.0.0.5", 50000)
+    })
+
+    async def desconectar_a_medias():
+        respuesta = await chatbot_router.preguntar_al_bot_stream(
+            esquemas.PreguntaChat(texto=PREGUNTA, user_id=usuario.id),
+            peticion, db
+        )
+        eventos = respuesta.body_iterator
+        recibidos = [await eventos.__anext__() for _ in range(2)]
+        # El cliente cierra la conexion: el servidor cierra el generador
+        await eventos.aclose()
+        return recibidos
+
+    recibidos = asyncio.run(desconectar_a_medias())
+
+    assert len(recibidos) == 2
+    assert _historial(buffer, db, usuario.id) == [
+        ("user", PREGUNTA), ("model", "Divide el temario ")
+    ]
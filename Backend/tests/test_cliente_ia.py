@@ -0,0 +1,181 @@
+"""
+Pruebas del cliente compartido de IA (app.cliente_ia.ClienteIA): limite
+global de llamadas y cambio de modelo y de llave ante errores.
+"""
+import asyncio
+
+import pytest
+from google.api_core import exceptions
+
+from app import cliente_ia, llaves_ia
+from app.cliente_ia import BackendFalso, ClienteIA, ErrorIA, RespuestaIA
+from app.llaves_ia import PoolLlaves
+
+
+@pytest.fixture
+def pool(monkeypatch):
+    """Pool de dos llaves que no se registra en las estadisticas."""
+    monkeypatch.setattr(llaves_ia, "_pools", {})
+    monkeypatch.setenv("PRUEBA_LLAVE_1", "llave-uno")
+    monkeypatch.setenv("PRUEBA_LLAVE_2", "llave-dos")
+    return PoolLlaves("Pruebas", ["PRUEBA_LLAVE_1", "PRUEBA_LLAVE_2"])
+
+
+@pytest.fixture
+def esperas(monkeypatch):
+    """Registra las esperas entre reintentos sin dormir de verdad."""
+    registradas = []
+    dormir = asyncio.sleep
+
+    async def sin_esperar(segundos, *args, **kwargs):
+        registradas.append(segundos)
+        await dormir(0)
+
+    monkeypatch.setattr(cliente_ia.asyncio, "sleep", sin_esperar)
+    return registradas
+
+
+class BackendGuion(BackendFalso):
+    """Responde o falla segun un guion de errores por llamada."""
+
+    def __init__(self, errores):
+        super().__init__(latencia=0)
+        self.errores = list(errores)
+        self.intentos = []
+
+    async def generar(self, modelo, llave, prompt, *args, **kwargs):
+        self.intentos.append((modelo, llave))
+        if self.errores:
+            error = self.errores.pop(0)
+            if error is not None:
+                raise error
+        return RespuestaIA(text=f"{modelo} con {llave}")
+
+
+class BackendMedidor(BackendFalso):
+    """Cuenta cuantas llamadas estan en curso al mismo tiempo."""
+
+    def __init__(self):
+        super().__init__(latencia=0.01)
+        self.en_curso = 0
+        self.maximo = 0
+
+    async def generar(self, *args, **kwargs):
+        self.en_curso += 1
+        self.maximo = max(self.maximo, self.en_curso)
+        try:
+            return await super().generar(*args, **kwargs)
+        finally:
+            self.en_curso -= 1
+
+
+def test_limite_global_de_llamadas_concurrentes(pool, monkeypatch):
+    monkeypatch.setattr(cliente_ia, "MAX_LLAMADAS_CONCURRENTES", 3)
+    monkeypatch.setattr(cliente_ia, "_semaforo", None)
+    backend = BackendMedidor()
+    # El Chatbot y el Analisis comparten el mismo limite
+    chatbot = ClienteIA(backend, ["modelo-a"], pool)
+    analisis = ClienteIA(backend, ["modelo-b"], pool)
+
+    async def lanzar():
+        return await asyncio.gather(*(
+            (chatbot if i % 2 else analisis).generar(f"pregunta {i}")
+            for i in range(20)
+        ))
+
+    respuestas = asyncio.run(lanzar())
+
+    assert len(respuestas) == backend.llamadas == 20
+    assert backend.maximo == 3
+    assert all(e["en_vuelo"] == 0 for e in pool.obtener_estadisticas())
+
+
+def test_cambia_de_modelo_si_no_esta_disponible(pool, esperas):
+    backend = BackendGuion([exceptions.ServiceUnavailable("saturado")])
+    cliente = ClienteIA(backend, ["modelo-a", "modelo-b"], pool)
+
+    respuesta = asyncio.run(cliente.generar("hola"))
+
+    assert [modelo for modelo, _ in backend.intentos] == [
+        "modelo-a", "modelo-b"
+    ]
+    assert respuesta.text.startswith("modelo-b")
+    assert esperas == [1]
+
+
+def test_cuota_agotada_recorre_modelos_y_llaves_en_orden(pool, esperas):
+    backend = BackendGuion(
+        [exceptions.ResourceExhausted("cuota")] * 3 + [None]
+    )
+    cliente = ClienteIA(backend, ["modelo-a", "modelo-b"], pool)
+
+    respuesta = asyncio.run(cliente.generar("hola", max_retries=2))
+
+    # Cada llave agotada entra en enfriamiento: el siguiente intento
+    # usa la otra
+    assert backend.intentos == [
+        ("modelo-a", "llave-uno"),
+        ("modelo-b", "llave-dos"),
+        ("modelo-a", "llave-uno"),
+        ("modelo-b", "llave-dos"),
+    ]
+    assert respuesta.text == "modelo-b con llave-dos"
+    assert esperas == [1, 2, 1]
+    estadisticas = pool.obtener_estadisticas()
+    assert [e["agotada"] for e in estadisticas] == [2, 1]
+    assert [e["exitos"] for e in estadisticas] == [0, 1]
+
+
+def test_error_ia_al_agotar_todos_los_intentos(pool, esperas):
+    backend = BackendGuion([exceptions.ResourceExhausted("cuota")] * 6)
+    cliente = ClienteIA(backend, ["modelo-a", "modelo-b"], pool)
+
+    with pytest.raises(ErrorIA):
+        asyncio.run(cliente.generar("hola", max_retries=3))
+
+    assert [modelo for modelo, _ in backend.intentos] == [
+        "modelo-a", "modelo-b"
+    ] * 3
+
+
+def test_error_no_reintentable_se_propaga(pool, esperas):
+    backend = BackendGuion([ValueError("prompt invalido")])
+    cliente = ClienteIA(backend, ["modelo-a", "modelo-b"], pool)
+
+    with pytest.raises(ValueError):
+        asyncio.run(cliente.generar("hola"))
+
+    assert len(backend.intentos) == 1
+    assert sum(e["fallos"] for e in pool.obtener_estadisticas()) == 1
+    assert esperas == []
+
+
+def test_modelos_de_gemini_se_reutilizan_con_lru(monkeypatch):
+    monkeypatch.setattr(cliente_ia, "MAX_MODELOS_EN_CACHE", 2)
+    backend = cliente_ia.BackendGemini()
+    config = {"temperature": 0.0}
+
+    def modelo(nombre, llave):
+        return backend._modelo(nombre, llave, config, None)
+
+    async def usar_cache():
+        # Los clientes asincronos de la API se crean dentro del event loop
+        primero = modelo("modelo-a", "llave-uno")
+        assert modelo("modelo-a", "llave-uno") is primero
+        # El modelo usa el cliente de su llave, no el global de genai
+        assert primero._async_client is backend._cliente("llave-uno")
+        assert modelo("modelo-a", "llave-dos") is not primero
+
+        # Usar el primero lo vuelve el mas reciente: se expulsa el otro
+        modelo("modelo-a", "llave-uno")
+        modelo("modelo-b", "llave-uno")
+        assert [clave[:2] for clave in backend._modelos] == [
+            ("modelo-a", "llave-uno"), ("modelo-b", "llave-uno")
+        ]
+        assert modelo("modelo-a", "llave-uno") is primero
+
+        backend.invalidar_llave("llave-uno")
+        assert not backend._modelos
+        assert modelo("modelo-a", "llave-uno") is not primero
+
+    asyncio.run(usar_cache())
@@ -0,0 +1,127 @@
+"""
+Pruebas y benchmark de los totales del dashboard servidos desde memoria
+(app.Estadistica.contadores y GET /api/stats/general).
+"""
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, func, insert
+
+from app.Creacion_mats_prof import esquemas
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.Creacion_mats_prof.modelos import Profesor
+from app.database import engine
+from app.Estadistica import contadores
+from app.main import app
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj simulado para controlar el vencimiento de los totales."""
+    ahora = [1000.0]
+    monkeypatch.setattr(
+        contadores, "time", SimpleNamespace(monotonic=lambda: ahora[0])
+    )
+    contadores.contadores.invalidar()
+    yield ahora
+    contadores.contadores.invalidar()
+
+
+def _contar_consultas(accion):
+    consultas = []
+
+    def registrar(conexion, cursor, sql, *args):
+        consultas.append(sql)
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        resultado = accion()
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+    return resultado, consultas
+
+
+def _contar_por_separado(db):
+    """Totales como antes: un COUNT por entidad en cada peticion."""
+    return {
+        nombre: db.query(func.count()).select_from(modelo).scalar()
+        for nombre, modelo in contadores.MODELOS_CONTADOS.items()
+    }
+
+
+def test_incrementos_y_reconciliacion(db, usuario, reloj):
+    valores, etag = contadores.contadores.obtener(db)
+    assert valores == _contar_por_separado(db)
+
+    crud_catalogos.create_materia(db, esquemas.MateriaCreate(nombre="Redes"))
+    valores, nuevo_etag = contadores.contadores.obtener(db)
+    assert valores["materias"] == 1
+    assert nuevo_etag != etag
+
+    # Lo creado fuera de la API aparece al reconciliar
+    db.execute(insert(Profesor), [{"nombre": "Fuera de la API"}])
+    db.commit()
+    assert contadores.contadores.obtener(db)[0]["profesores"] == 0
+    reloj[0] += contadores.RECONCILIACION_SEGUNDOS
+    assert contadores.contadores.obtener(db)[0] == _contar_por_separado(db)
+
+
+def test_general_responde_304_con_el_mismo_etag(db, usuario, reloj):
+    cliente = TestClient(app)
+
+    primera = cliente.get("/api/stats/general")
+    etag = primera.headers["etag"]
+    repetida, consultas = _contar_consultas(lambda: cliente.get(
+        "/api/stats/general", headers={"If-None-Match": etag}
+    ))
+
+    assert primera.status_code == 200
+    assert primera.json()["usuarios"] == 1
+    assert primera.headers["cache-control"] == (
+        f"public, max-age={contadores.CACHE_MAX_AGE_SEGUNDOS}"
+    )
+    assert repetida.status_code == 304
+    assert repetida.content == b""
+    assert repetida.headers["etag"] == etag
+    assert consultas == []
+
+    crud_catalogos.create_materia(db, esquemas.MateriaCreate(nombre="Redes"))
+    cambiada = cliente.get(
+        "/api/stats/general", headers={"If-None-Match": etag}
+    )
+    assert cambiada.status_code == 200
+    assert cambiada.json()["materias"] == 1
+
+
+@pytest.mark.benchmark
+def test_benchmark_sondeo_del_dashboard(db, usuario, reloj, monkeypatch):
+    # 500 peticiones por segundo durante 4 s simulados, con reconciliacion
+    # cada 2 s
+    monkeypatch.setattr(contadores, "RECONCILIACION_SEGUNDOS", 2.0)
+    peticiones, intervalo = 2000, 1 / 500
+    cliente = TestClient(app)
+
+    def sondear():
+        for _ in range(peticiones):
+            assert cliente.get("/api/stats/general").status_code == 200
+            reloj[0] += intervalo
+
+    inicio = time.perf_counter()
+    _, consultas = _contar_consultas(sondear)
+    transcurrido = time.perf_counter() - inicio
+
+    _, consultas_antes = _contar_consultas(
+        lambda: [_contar_por_separado(db) for _ in range(100)]
+    )
+
+    por_peticion_antes = len(consultas_antes) / 100
+    print(
+        f"\n{peticiones} sondeos en {transcurrido:.2f} s: "
+        f"{len(consultas)} consultas a la BD (antes "
+        f"{por_peticion_antes * peticiones:.0f})"
+    )
+    assert por_peticion_antes == 5
+    # Una consulta al inicio y una por cada vencimiento del TTL
+    assert len(consultas) <= 1 + peticiones * intervalo / 2.0
@@ -0,0 +1,94 @@
+"""
+Pruebas de la generacion de recursos del Chatbot en segundo plano
+(app.Chatbot.router.iniciar_generacion_recursos).
+"""
+import asyncio
+import json
+
+import httpx
+
+from app.Chatbot import router as chatbot_router
+from app.cliente_ia import BackendFalso, RespuestaIA
+from app.Creacion_mats_prof import esquemas
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.main import app
+from app.Porta_Estudio import modelos as study_models
+
+RECURSOS = json.dumps([
+    {"titulo": f"Recurso {i}", "tipo": "link",
+     "url": f"https://example.com/{i}", "desc": "Introduccion al tema"}
+    for i in range(3)
+])
+
+
+class BackendRecursos(BackendFalso):
+    """Devuelve recursos en JSON a los prompts de generacion."""
+
+    def __init__(self):
+        super().__init__(latencia=0.3, respuesta="Respuesta del tutor")
+        self.generaciones = 0
+
+    async def generar(self, modelo, llave, prompt, *args, **kwargs):
+        if "Genera 3 recursos" not in prompt:
+            return await super().generar(modelo, llave, prompt)
+        self.generaciones += 1
+        await asyncio.sleep(self.latencia)
+        return RespuestaIA(text=RECURSOS, tokens_entrada=0, tokens_salida=0)
+
+
+async def _preguntar_a_la_vez(total, materia_id, user_id):
+    transporte = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transporte, base_url="http://prueba"
+    ) as cliente:
+        respuestas = await asyncio.gather(*(
+            cliente.post("/api/bot/preguntar", json={
+                "texto": f"Duda {i} sobre el tema",
+                "materia_id": materia_id, "user_id": user_id
+            })
+            for i in range(total)
+        ))
+        # Se espera a que termine la generacion en segundo plano
+        tarea = chatbot_router._generaciones_en_curso.get(materia_id)
+        if tarea is not None:
+            await asyncio.wait({tarea})
+    return respuestas
+
+
+def test_preguntas_simultaneas_generan_una_vez(db, usuario, monkeypatch):
+    backend = BackendRecursos()
+    monkeypatch.setattr(chatbot_router.cliente_ia, "backend", backend)
+    materia_id = crud_catalogos.create_materia(
+        db, esquemas.MateriaCreate(nombre="Teoria de la Computacion")
+    ).id
+
+    respuestas = asyncio.run(_preguntar_a_la_vez(20, materia_id, usuario.id))
+
+    assert [r.status_code for r in respuestas] == [200] * 20
+    assert backend.generaciones == 1
+    assert db.query(study_models.Resource).filter(
+        study_models.Resource.materia_id == materia_id
+    ).count() == 3
+    assert materia_id not in chatbot_router._generaciones_en_curso
+
+
+def test_generacion_fallida_se_reporta(capsys, monkeypatch):
+    async def falla(materia_id, materia_nombre):
+        raise RuntimeError("cuota agotada")
+
+    monkeypatch.setattr(
+        chatbot_router, "_generar_recursos_segundo_plano", falla
+    )
+
+    async def iniciar():
+        tarea = chatbot_router.iniciar_generacion_recursos(99, "Redes")
+        await asyncio.wait({tarea})
+        # Los callbacks corren en la siguiente vuelta del loop
+        await asyncio.sleep(0)
+
+    asyncio.run(iniciar())
+
+    assert "materia 99: RuntimeError('cuota agotada')" in (
+        capsys.readouterr().out
+    )
+    assert 99 not in chatbot_router._generaciones_en_curso
@@ -0,0 +1,202 @@
+"""
+Pruebas del historial del Chatbot con escritura diferida
+(app.Chatbot.historial).
+"""
+import threading
+import time
+from datetime import datetime
+from types import SimpleNamespace
+
+import pytest
+from sqlalchemy import desc, event
+from sqlalchemy.exc import OperationalError
+
+from app.Chatbot import historial
+from app.Chatbot.modelos import HistorialChat
+from app.database import engine
+from app.Usuarios.modelos import User
+
+
+def test_fila_invalida_no_bloquea_el_historial(db, usuario):
+    buffer = historial.BufferHistorial()
+    buffer.agregar(usuario.id, "hola", "que tal")
+    # Usuario borrado: su user_id ya no existe (llave foranea)
+    buffer.agregar(999, "sigo aqui?", "si")
+    buffer.agregar(usuario.id, "adios", "hasta luego")
+
+    assert buffer.volcar() == 4
+
+    estadisticas = buffer.obtener_estadisticas()
+    assert estadisticas["pendientes"] == 0
+    assert estadisticas["filas_descartadas"] == 2
+    assert [m.content for m in db.query(HistorialChat).order_by(
+        HistorialChat.id
+    )] == ["hola", "que tal", "adios", "hasta luego"]
+
+    # Los siguientes volcados ya no arrastran la fila invalida
+    buffer.agregar(usuario.id, "otra", "pregunta")
+    assert buffer.volcar() == 2
+
+
+def test_bd_caida_reencola_con_reintentos_acotados(
+    db, usuario, monkeypatch
+):
+    monkeypatch.setattr(historial, "MAX_INTENTOS_VOLCADO", 3)
+
+    class SesionCaida:
+        def execute(self, *args, **kwargs):
+            raise OperationalError("INSERT", {}, Exception("sin conexion"))
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            pass
+
+    buffer = historial.BufferHistorial()
+    buffer.agregar(usuario.id, "hola", "que tal")
+    sesion_original = historial.SessionLocal
+    monkeypatch.setattr(historial, "SessionLocal", SesionCaida)
+
+    for _ in range(2):
+        assert buffer.volcar() == 0
+        assert buffer.obtener_estadisticas()["pendientes"] == 2
+
+    # Si la BD vuelve antes de agotar los intentos, se guarda todo
+    monkeypatch.setattr(historial, "SessionLocal", sesion_original)
+    buffer.agregar(usuario.id, "y ahora?", "ya funciona")
+    assert buffer.volcar() == 4
+
+    monkeypatch.setattr(historial, "SessionLocal", SesionCaida)
+    buffer.agregar(usuario.id, "se cayo otra vez", "ups")
+    for _ in range(3):
+        buffer.volcar()
+    estadisticas = buffer.obtener_estadisticas()
+    assert estadisticas["pendientes"] == 0
+    assert estadisticas["filas_descartadas"] == 2
+    assert estadisticas["errores_volcado"] == 5
+
+
+def test_pendientes_acotados(usuario, monkeypatch):
+    monkeypatch.setattr(historial, "MAX_PENDIENTES", 5)
+    buffer = historial.BufferHistorial()
+
+    for i in range(4):
+        buffer.agregar(usuario.id, f"pregunta {i}", f"respuesta {i}")
+
+    estadisticas = buffer.obtener_estadisticas()
+    assert estadisticas["pendientes"] == 5
+    assert estadisticas["filas_descartadas"] == 3
+    assert buffer._pendientes[0]["content"] == "respuesta 1"
+
+
+def test_pregunta_antes_que_su_respuesta_al_leer_la_bd(
+    db, usuario, monkeypatch
+):
+    # Pregunta y respuesta comparten la fecha; aqui todas la comparten
+    fijo = datetime(2024, 5, 1, 12, 0, 0)
+    monkeypatch.setattr(
+        historial, "datetime", SimpleNamespace(utcnow=lambda: fijo)
+    )
+    buffer = historial.BufferHistorial()
+    for i in range(3):
+        buffer.agregar(usuario.id, f"pregunta {i}", f"respuesta {i}")
+    buffer.volcar()
+
+    consultas = []
+
+    def registrar(conexion, cursor, sql, *args):
+        consultas.append(sql.lower())
+
+    event.listen(engine, "before_cursor_execute", registrar)
+    try:
+        # Otro proceso (o tras un reinicio): el usuario no esta en memoria
+        mensajes = historial.BufferHistorial().recientes(usuario.id, 6, db)
+    finally:
+        event.remove(engine, "before_cursor_execute", registrar)
+
+    assert [m["content"] for m in mensajes] == [
+        f"{tipo} {i}" for i in range(3) for tipo in ("pregunta", "respuesta")
+    ]
+    assert any(
+        "order by historial_chat.timestamp desc, historial_chat.id desc"
+        in sql for sql in consultas
+    )
+
+
+def _percentil(tiempos, p):
+    tiempos = sorted(tiempos)
+    return tiempos[min(len(tiempos) - 1, int(len(tiempos) * p / 100))]
+
+
+@pytest.mark.benchmark
+def test_benchmark_latencia_p99(db, usuario):
+    usuarios = [usuario.id]
+    for i in range(49):
+        user = User(
+            email=f"alumno{i}@example.com", full_name="Alumno",
+            career="ISC", hashed_password="x", role="student"
+        )
+        db.add(user)
+        db.commit()
+        usuarios.append(user.id)
+    peticiones = [usuarios[i % 50] for i in range(2000)]
+
+    def sincrono(user_id, i):
+        """Como antes: lee el historial y guarda con dos INSERT."""
+        sesion = historial.SessionLocal()
+        try:
+            sesion.query(HistorialChat).filter(
+                HistorialChat.user_id == user_id
+            ).order_by(desc(HistorialChat.timestamp)).limit(6).all()
+            sesion.add(HistorialChat(
+                user_id=user_id, role="user", content=f"pregunta {i}"
+            ))
+            sesion.add(HistorialChat(
+                user_id=user_id, role="model", content=f"respuesta {i}"
+            ))
+            sesion.commit()
+        finally:
+            sesion.close()
+
+    buffer = historial.BufferHistorial()
+    detener = threading.Event()
+
+    def volcado_de_fondo():
+        while not detener.is_set():
+            if buffer.debe_volcar():
+                buffer.volcar()
+            time.sleep(historial.REVISION_SEGUNDOS)
+
+    def diferido(user_id, i):
+        buffer.recientes(user_id, 6, db)
+        buffer.agregar(user_id, f"pregunta {i}", f"respuesta {i}")
+
+    def medir(guardar):
+        tiempos = []
+        for i, user_id in enumerate(peticiones):
+            inicio = time.perf_counter()
+            guardar(user_id, i)
+            tiempos.append(time.perf_counter() - inicio)
+        return _percentil(tiempos, 50), _percentil(tiempos, 99)
+
+    antes = medir(sincrono)
+    db.query(HistorialChat).delete()
+    db.commit()
+
+    hilo = threading.Thread(target=volcado_de_fondo)
+    hilo.start()
+    try:
+        ahora = medir(diferido)
+    finally:
+        detener.set()
+        hilo.join()
+    buffer.volcar()
+
+    print(
+        f"\nHistorial por pregunta (p50 / p99): sincrono "
+        f"{antes[0] * 1000:.2f} / {antes[1] * 1000:.2f} ms, en memoria "
+        f"{ahora[0] * 1000:.3f} / {ahora[1] * 1000:.3f} ms"
+    )
+    assert db.query(HistorialChat).count() == 4000
+    assert ahora[1] * 3 < antes[1]
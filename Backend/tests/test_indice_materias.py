@@ -0,0 +1,151 @@
+"""
+Pruebas y benchmark del indice de materias del Chatbot
+(app.Chatbot.indice_materias).
+"""
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from sqlalchemy import insert
+
+from app.Chatbot import indice_materias
+from app.Creacion_mats_prof import modelos
+
+TEMAS = ["Calculo", "Fisica", "Quimica", "Redes", "Bases", "Compiladores"]
+
+
+def _crear_materias(db, total):
+    db.execute(insert(modelos.Materia), [
+        {"nombre": f"{TEMAS[i % len(TEMAS)]} Seccion{i:05d}"}
+        for i in range(1, total + 1)
+    ])
+    db.commit()
+
+
+def _detectar_original(texto, db):
+    """Deteccion anterior al indice: recorre todas las materias."""
+    texto = texto.lower()
+    tokens_usuario = set(re.findall(r'\w+', texto))
+    materias = db.query(modelos.Materia.id, modelos.Materia.nombre).all()
+    candidato = None
+    max_matches = 0
+    for mat_id, mat_nombre in materias:
+        nombre_clean = mat_nombre.lower()
+        if nombre_clean in texto:
+            return mat_id, mat_nombre
+        tokens_importantes = {
+            t for t in re.findall(r'\w+', nombre_clean) if len(t) > 2
+        }
+        coincidencias = len(tokens_usuario & tokens_importantes)
+        if coincidencias > max_matches:
+            max_matches = coincidencias
+            candidato = (mat_id, mat_nombre)
+    return candidato if candidato else (None, None)
+
+
+def _preguntas(total, materias):
+    preguntas = []
+    for i in range(total):
+        n = i % materias + 1
+        if i % 2:
+            preguntas.append(
+                f"Que temas entran en {TEMAS[n % len(TEMAS)]} "
+                f"seccion{n:05d}?"
+            )
+        else:
+            preguntas.append(f"Quien da la seccion{n:05d} este semestre")
+    return preguntas
+
+
+def test_buscar_igual_a_la_deteccion_original(db):
+    _crear_materias(db, 300)
+    indice = indice_materias.IndiceMaterias()
+
+    for pregunta in _preguntas(600, 300) + ["hola", "no se nada"]:
+        assert indice.buscar(pregunta, db) == _detectar_original(
+            pregunta, db
+        )
+
+
+def test_solo_un_hilo_recarga_al_vencer_el_ttl(db, monkeypatch):
+    _crear_materias(db, 50)
+    indice = indice_materias.IndiceMaterias()
+    indice.cargar(db)
+
+    cargas = []
+    cargar_original = indice.cargar
+
+    def cargar_lento(sesion):
+        cargas.append(threading.get_ident())
+        time.sleep(0.2)
+        cargar_original(sesion)
+
+    monkeypatch.setattr(indice, "cargar", cargar_lento)
+    monkeypatch.setattr(indice_materias, "INDICE_TTL_SEGUNDOS", 0)
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        resultados = list(pool.map(
+            lambda _: indice.buscar("dudas de seccion00007", db), range(8)
+        ))
+
+    assert len(cargas) == 1
+    assert {r[0] for r in resultados} == {7}
+
+
+def test_busquedas_durante_recargas_y_altas(db):
+    _crear_materias(db, 200)
+    indice = indice_materias.IndiceMaterias()
+    indice.cargar(db)
+    materias = db.query(modelos.Materia.id, modelos.Materia.nombre).all()
+    fin = threading.Event()
+
+    def modificar():
+        # Alterna entre el catalogo completo y uno recortado
+        for vuelta in range(200):
+            if vuelta % 2:
+                indice.cargar(db)
+            else:
+                with indice._lock:
+                    indice._nombres = dict(materias[:10])
+                    indice._por_token = {}
+                    indice._automata = None
+            indice.agregar(10_000 + vuelta, f"Optativa{vuelta}")
+        fin.set()
+
+    hilo = threading.Thread(target=modificar)
+    hilo.start()
+    while not fin.is_set():
+        for pregunta in _preguntas(50, 200):
+            indice.buscar(pregunta, None)
+    hilo.join()
+
+
+@pytest.mark.benchmark
+def test_benchmark_deteccion_de_materia(db):
+    total_materias = 5000
+    _crear_materias(db, total_materias)
+    preguntas = _preguntas(10_000, total_materias)
+    indice = indice_materias.IndiceMaterias()
+
+    inicio = time.perf_counter()
+    for pregunta in preguntas:
+        indice.buscar(pregunta, db)
+    t_indice = (time.perf_counter() - inicio) / len(preguntas)
+
+    # La deteccion original consulta todas las materias por pregunta; se
+    # mide sobre una muestra para no alargar la prueba
+    muestra = preguntas[:200]
+    inicio = time.perf_counter()
+    for pregunta in muestra:
+        _detectar_original(pregunta, db)
+    t_original = (time.perf_counter() - inicio) / len(muestra)
+
+    print(
+        f"\n{total_materias} materias: original "
+        f"{t_original * 1000:.2f} ms/pregunta, indice "
+        f"{t_indice * 1000:.3f} ms/pregunta "
+        f"({t_original / t_indice:.0f}x)"
+    )
+    assert t_indice * 20 < t_original
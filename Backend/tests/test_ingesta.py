@@ -0,0 +1,109 @@
+"""
+Pruebas y benchmark de la ingesta masiva de reseñas del Analisis de
+WhatsApp (app.Analisis_IA.crud.guardar_resenas_extraidas).
+"""
+import time
+
+import pytest
+
+from app.Analisis_IA import crud
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.Creacion_mats_prof import esquemas, modelos
+from app.Reviews import modelos as modelos_reviews
+
+
+def _profesor(db, nombre):
+    return crud_catalogos.create_profesor(
+        db, esquemas.ProfesorCreate(nombre=nombre)
+    )
+
+
+def _resenas(nombres):
+    return [
+        {"profesor_nombre": nombre, "comentario": "Explica bien",
+         "calificacion": 9, "dificultad": 4, "autor_original": "Alumno"}
+        for nombre in nombres
+    ]
+
+
+def test_busqueda_parcial_de_profesores(db):
+    lopez = _profesor(db, "LOPEZ JUAN")
+
+    profesores, creados = crud_catalogos.get_or_create_profesores_bulk(
+        db, ["Lopez", " lopez juan ", "Perez"]
+    )
+
+    assert creados == 1
+    assert profesores["lopez"].id == lopez.id
+    assert profesores["lopez juan"].id == lopez.id
+    assert profesores["perez"].nombre == "Perez"
+
+
+def test_nombres_nuevos_contenidos_en_otro_se_reusan(db):
+    profesores, creados = crud_catalogos.get_or_create_profesores_bulk(
+        db, ["Martinez Ana", "martinez", "Ana"]
+    )
+
+    assert creados == 1
+    assert {p.id for p in profesores.values()} == {
+        profesores["martinez ana"].id
+    }
+
+
+def test_ingesta_no_duplica_profesores(db, usuario):
+    _profesor(db, "LOPEZ JUAN")
+
+    guardadas, nuevos, errores = crud.guardar_resenas_extraidas(
+        db, _resenas(["Lopez", "LOPEZ", "Garcia"])
+    )
+
+    assert (guardadas, nuevos, errores) == (3, 1, [])
+    assert db.query(modelos.Profesor).count() == 2
+
+
+def _ingesta_uno_por_uno(db, resenas):
+    """Ingesta original: una busqueda (y un INSERT) por reseña."""
+    materia = crud_catalogos.get_materia_by_name(db, crud.MATERIA_GENERICA)
+    for datos in resenas:
+        nombre = datos["profesor_nombre"]
+        profesor = crud_catalogos.get_profesor_by_name(db, nombre)
+        if not profesor:
+            profesor = _profesor(db, nombre)
+        db.add(modelos_reviews.Resena(
+            comentario=datos["comentario"],
+            calificacion=datos["calificacion"],
+            dificultad=datos["dificultad"],
+            profesor_id=profesor.id,
+            materia_id=materia.id,
+            user_id=crud.SYSTEM_USER_ID
+        ))
+        db.commit()
+
+
+@pytest.mark.benchmark
+def test_benchmark_ingesta_masiva(db, usuario):
+    # 2000 reseñas sobre 200 profesores; la mitad ya existe
+    nombres = [f"Profesor {i % 200:03d}" for i in range(2000)]
+    for i in range(0, 200, 2):
+        _profesor(db, f"PROFESOR {i:03d} APELLIDO")
+    crud_catalogos.create_materia(
+        db, esquemas.MateriaCreate(nombre=crud.MATERIA_GENERICA)
+    )
+
+    inicio = time.perf_counter()
+    _ingesta_uno_por_uno(db, _resenas(nombres))
+    uno_por_uno = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    guardadas, nuevos, errores = crud.guardar_resenas_extraidas(
+        db, _resenas(nombres)
+    )
+    masiva = time.perf_counter() - inicio
+
+    print(
+        f"\n{len(nombres)} reseñas: una por una {uno_por_uno:.2f} s, "
+        f"masiva {masiva:.2f} s ({uno_por_uno / masiva:.1f}x)"
+    )
+    assert (guardadas, nuevos, errores) == (2000, 0, [])
+    assert db.query(modelos.Profesor).count() == 200
+    assert masiva * 2 < uno_por_uno
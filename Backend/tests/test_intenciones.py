@@ -0,0 +1,82 @@
+"""
+Pruebas del motor de intenciones del Chatbot (app.Chatbot.intenciones).
+"""
+import json
+
+from sqlalchemy import event
+
+from app.Chatbot import intenciones
+from app.Creacion_mats_prof import esquemas
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.Estadistica.contadores import contadores
+
+VALIDAS = [
+    {"nombre": "saludo", "frases": ["hola"], "respuesta": "Hola!"},
+    {"nombre": "total_materias", "frases": ["cuantas materias"],
+     "conteo": "materias", "respuesta": "Tenemos {total} materias."},
+]
+
+
+def _motor(tmp_path, contenido):
+    ruta = tmp_path / "intenciones.json"
+    ruta.write_text(json.dumps(contenido), encoding="utf-8")
+    return intenciones.MotorIntenciones(str(ruta))
+
+
+def test_intenciones_invalidas_se_omiten(tmp_path, capsys):
+    motor = _motor(tmp_path, [
+        {"nombre": "sin_frases", "respuesta": "x"},
+        {"nombre": "conteo_raro", "frases": ["cuantos gatos"],
+         "conteo": "gatos", "respuesta": "{total} gatos"},
+        {"nombre": "formato", "frases": ["cuantos profes"],
+         "conteo": "profesores", "respuesta": "Hay {cantidad}"},
+        "no soy un objeto",
+        *VALIDAS,
+    ])
+
+    salida = capsys.readouterr().out
+    assert "'sin_frases'" in salida
+    assert "conteo 'gatos' desconocido" in salida
+    assert "'formato'" in salida
+    assert "Intencion 3 omitida" in salida
+    assert motor.obtener_estadisticas()["intenciones"] == 2
+    assert motor.responder("hola", None) == "Hola!"
+    assert motor.responder("cuantos gatos hay", None) is None
+
+
+def test_archivo_invalido_conserva_la_version_anterior(tmp_path):
+    motor = _motor(tmp_path, VALIDAS)
+
+    (tmp_path / "intenciones.json").write_text(
+        '{"nombre": "no es lista"}', encoding="utf-8"
+    )
+    motor.recargar()
+
+    assert motor.obtener_estadisticas()["intenciones"] == 2
+
+
+def test_conteo_usa_los_contadores_del_dashboard(tmp_path, db):
+    contadores.invalidar()
+    motor = _motor(tmp_path, VALIDAS)
+    crud_catalogos.create_materia(db, esquemas.MateriaCreate(nombre="Redes"))
+
+    consultas = []
+
+    def registrar(conexion, cursor, sql, *args):
+        consultas.append(sql)
+
+    event.listen(db.get_bind(), "before_cursor_execute", registrar)
+    try:
+        respuestas = [
+            motor.responder("cuantas materias hay?", db) for _ in range(20)
+        ]
+        crud_catalogos.create_materia(
+            db, esquemas.MateriaCreate(nombre="Compiladores")
+        )
+        despues = motor.responder("cuantas materias hay?", db)
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", registrar)
+
+    assert set(respuestas) == {"Tenemos 1 materias."}
+    assert despues == "Tenemos 2 materias."
+    assert sum("count" in c.lower() for c in consultas) == 1
@@ -0,0 +1,66 @@
+"""
+Pruebas del limitador de preguntas del Chatbot (app.Chatbot.limitador).
+"""
+from starlette.requests import Request
+
+from app.Chatbot import limitador
+
+
+def _peticion(ip, reenviadas=None):
+    encabezados = []
+    if reenviadas is not None:
+        encabezados.append((b"x-forwarded-for", reenviadas.encode()))
+    return Request({
+        "type": "http", "headers": encabezados, "client": (ip, 50000)
+    })
+
+
+def test_usuario_inexistente_se_limita_como_invitado(
+    db, usuario, monkeypatch
+):
+    monkeypatch.setattr(limitador, "LIMITE_INVITADO", 3)
+    chatbot = limitador.LimitadorChatbot()
+
+    # Inventar IDs no da cuotas nuevas: todos comparten la de la IP
+    cuotas = [
+        chatbot.verificar(1000 + i, "10.0.0.5", db) for i in range(4)
+    ]
+    registrado = chatbot.verificar(usuario.id, "10.0.0.5", db)
+
+    assert [c.permitido for c in cuotas] == [True, True, True, False]
+    assert cuotas[0].limite == 3
+    assert registrado.permitido
+    assert registrado.limite == limitador.LIMITES_POR_ROL["student"]
+
+
+def test_cache_de_roles_acotado(db, usuario, monkeypatch):
+    monkeypatch.setattr(limitador, "MAX_ROLES_EN_CACHE", 10)
+    chatbot = limitador.LimitadorChatbot()
+
+    for user_id in range(1, 50):
+        chatbot.verificar(user_id, "10.0.0.5", db)
+    chatbot.verificar(usuario.id, "10.0.0.5", db)
+
+    assert len(chatbot._roles) == 10
+    assert next(reversed(chatbot._roles)) == usuario.id
+
+
+def test_ip_del_cliente_detras_de_proxies(monkeypatch):
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 0)
+    # Sin proxies configurados, el encabezado se ignora
+    assert limitador.ip_cliente(
+        _peticion("10.0.0.1", "1.2.3.4")
+    ) == "10.0.0.1"
+
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 1)
+    # El cliente intenta hacerse pasar por 6.6.6.6; el proxy agrega la IP
+    # real a la derecha
+    assert limitador.ip_cliente(
+        _peticion("10.0.0.1", "6.6.6.6, 200.1.1.7")
+    ) == "200.1.1.7"
+    assert limitador.ip_cliente(_peticion("10.0.0.1")) == "10.0.0.1"
+
+    monkeypatch.setattr(limitador, "PROXIES_CONFIABLES", 2)
+    assert limitador.ip_cliente(
+        _peticion("10.0.0.1", "6.6.6.6, 200.1.1.7, 10.0.0.9")
+    ) == "200.1.1.7"
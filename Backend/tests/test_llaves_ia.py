@@ -0,0 +1,107 @@
+"""
+Pruebas del pool de API Keys (app.llaves_ia.PoolLlaves): rotacion,
+enfriamiento por cuota y estadisticas.
+"""
+from types import SimpleNamespace
+
+import pytest
+
+from app import llaves_ia
+from app.llaves_ia import PoolLlaves
+
+
+@pytest.fixture
+def reloj(monkeypatch):
+    """Reloj simulado para controlar el enfriamiento de las llaves."""
+    ahora = [1000.0]
+    monkeypatch.setattr(
+        llaves_ia, "time", SimpleNamespace(monotonic=lambda: ahora[0])
+    )
+    monkeypatch.setattr(llaves_ia, "ENFRIAMIENTO_SEGUNDOS", 60.0)
+    monkeypatch.setattr(llaves_ia, "_pools", {})
+    return ahora
+
+
+def _pool(monkeypatch, *llaves):
+    variables = []
+    for i, llave in enumerate(llaves):
+        monkeypatch.setenv(f"PRUEBA_LLAVE_{i}", llave)
+        variables.append(f"PRUEBA_LLAVE_{i}")
+    return PoolLlaves("Pruebas", variables)
+
+
+def test_rota_entre_llaves_libres(monkeypatch, reloj):
+    pool = _pool(monkeypatch, "llave-a", "llave-b", "llave-c")
+
+    elegidas = []
+    for _ in range(6):
+        llave = pool.elegir()
+        elegidas.append(llave)
+        pool.liberar(llave)
+        reloj[0] += 1
+
+    assert elegidas == ["llave-a", "llave-b", "llave-c"] * 2
+
+    # Con llamadas en vuelo se prefiere la llave menos ocupada
+    ocupadas = [pool.elegir() for _ in range(3)]
+    pool.liberar("llave-b")
+    assert sorted(ocupadas) == ["llave-a", "llave-b", "llave-c"]
+    assert pool.elegir() == "llave-b"
+
+
+def test_enfriamiento_y_su_vencimiento(monkeypatch, reloj):
+    pool = _pool(monkeypatch, "llave-a", "llave-b")
+
+    llave = pool.elegir()
+    pool.liberar(llave, exito=False, agotada=True)
+
+    for _ in range(3):
+        reloj[0] += 10
+        elegida = pool.elegir()
+        pool.liberar(elegida)
+        assert elegida == "llave-b"
+
+    reloj[0] += 30
+    assert pool.elegir() == "llave-a"
+
+
+def test_todas_en_enfriamiento_usa_la_que_sale_primero(monkeypatch, reloj):
+    pool = _pool(monkeypatch, "llave-a", "llave-b")
+
+    pool.liberar(pool.elegir(), exito=False, agotada=True)
+    reloj[0] += 5
+    pool.liberar(pool.elegir(), exito=False, agotada=True)
+
+    assert pool.elegir() == "llave-a"
+    estadisticas = pool.obtener_estadisticas()
+    assert [e["enfriamiento_restante"] for e in estadisticas] == [55.0, 60.0]
+
+
+def test_estadisticas_sin_exponer_las_llaves(monkeypatch, reloj):
+    pool = _pool(monkeypatch, "secreta-1234", "secreta-5678")
+
+    llave = pool.elegir()
+    pool.liberar(llave)
+    llave = pool.elegir()
+    pool.liberar(llave, exito=False)
+    pool.elegir()
+
+    assert pool.obtener_estadisticas() == [
+        {"llave": "1 (...1234)", "en_vuelo": 1, "usos": 2, "exitos": 1,
+         "fallos": 0, "agotada": 0, "enfriamiento_restante": 0.0},
+        {"llave": "2 (...5678)", "en_vuelo": 0, "usos": 1, "exitos": 0,
+         "fallos": 1, "agotada": 0, "enfriamiento_restante": 0.0},
+    ]
+    assert llaves_ia.obtener_estadisticas() == {
+        "Pruebas": pool.obtener_estadisticas()
+    }
+
+
+def test_llaves_repetidas_se_usan_una_vez(monkeypatch, reloj, capsys):
+    pool = _pool(monkeypatch, "llave-a", "llave-b", "llave-a")
+
+    assert pool.keys == ["llave-a", "llave-b"]
+    assert "1 API Keys repetidas" in capsys.readouterr().out
+    # Agotar la llave no deja a su duplicado como si estuviera sana
+    pool.liberar(pool.elegir(), exito=False, agotada=True)
+    assert [pool.elegir(), pool.elegir()] == ["llave-b", "llave-b"]
@@ -0,0 +1,150 @@
+"""
+Pruebas y micro-benchmark del parser de chats de WhatsApp y de la
+subida por bloques de /api/ia/process_reviews.
+"""
+import asyncio
+import io
+import time
+from types import SimpleNamespace
+
+import pytest
+from fastapi import UploadFile
+from fastapi.testclient import TestClient
+
+from app import dependencias
+from app.Analisis_IA import jobs, modelos, parser, router as ai_router
+from app.main import app
+
+
+def _chat(total, formato):
+    """Genera un chat sintetico de WhatsApp (Android o iOS)."""
+    lineas = []
+    for i in range(total):
+        hora = f"{10 + i % 12}:{i % 60:02d}"
+        autor = f"Alumno {i % 13}"
+        texto = f"El profe Lopez {i} enseña bien, califico {i % 10}"
+        if formato == "android":
+            lineas.append(f"01/02/2024, {hora} - {autor}: {texto}")
+        else:
+            lineas.append(f"[01/02/2024, {hora}:00] {autor}: {texto}")
+        if i % 5 == 0:
+            lineas.append("continuacion del mensaje en otra linea")
+    return "\n".join(lineas) + "\n"
+
+
+def _parsear_upload(contenido: bytes, chunk_size=parser.CHUNK_SIZE):
+    async def leer():
+        archivo = UploadFile(file=io.BytesIO(contenido), filename="c.txt")
+        mensajes = []
+        async for linea_msg in parser.parse_whatsapp_upload(archivo):
+            mensajes.append(linea_msg)
+        return mensajes
+
+    original = parser.CHUNK_SIZE
+    parser.CHUNK_SIZE = chunk_size
+    try:
+        return asyncio.run(leer())
+    finally:
+        parser.CHUNK_SIZE = original
+
+
+@pytest.mark.parametrize("formato", ["android", "ios"])
+def test_streaming_igual_al_parser_completo(formato):
+    texto = _chat(500, formato)
+
+    completo = parser.parse_whatsapp_chat(texto)
+    # Bloques de 1 KB: los mensajes y los caracteres multibyte (ñ)
+    # quedan partidos entre bloques
+    streaming = _parsear_upload(texto.encode("utf-8"), chunk_size=1023)
+
+    assert len(completo) == 500
+    assert streaming == completo
+    assert completo[0]["author"] == "Alumno 0"
+    assert completo[0]["message"].endswith("en otra linea")
+
+
+def test_detecta_latin1():
+    texto = "01/02/2024, 10:00 - José: Está muy difícil la materia\n"
+    mensajes = _parsear_upload(texto.encode("latin-1"))
+    assert mensajes[0]["author"] == "José"
+
+
+@pytest.mark.benchmark
+@pytest.mark.parametrize("formato", ["android", "ios"])
+def test_benchmark_parser(formato):
+    texto = _chat(50_000, formato)
+    contenido = texto.encode("utf-8")
+
+    inicio = time.perf_counter()
+    completo = parser.parse_whatsapp_chat(texto)
+    t_completo = time.perf_counter() - inicio
+
+    inicio = time.perf_counter()
+    streaming = _parsear_upload(contenido)
+    t_streaming = time.perf_counter() - inicio
+
+    print(
+        f"\n{formato}: {len(contenido) / 1e6:.1f} MB, "
+        f"{len(completo)} mensajes | completo {t_completo:.2f} s "
+        f"({len(completo) / t_completo:,.0f} msg/s) | streaming "
+        f"{t_streaming:.2f} s ({len(streaming) / t_streaming:,.0f} msg/s)"
+    )
+    assert len(streaming) == len(completo) == 50_000
+
+
+@pytest.fixture
+def cliente_admin(db, monkeypatch):
+    # Sin el evento 'startup': los workers y la retencion seguirian usando
+    # la BD en otros hilos despues de la prueba. Los trabajos solo se
+    # registran en la lista.
+    encolados = []
+
+    async def encolar(trabajo_id):
+        encolados.append(trabajo_id)
+
+    monkeypatch.setattr(jobs, "encolar_trabajo", encolar)
+    admin = SimpleNamespace(id=1, email="admin@example.com", role="admin")
+    app.dependency_overrides[dependencias.require_admin] = lambda: admin
+    try:
+        yield TestClient(app)
+    finally:
+        app.dependency_overrides.clear()
+
+
+def test_subida_se_guarda_por_bloques(cliente_admin, db, monkeypatch):
+    monkeypatch.setattr(ai_router, "BLOQUE_MENSAJES", 100)
+    bloques = []
+    original = ai_router._guardar_bloque
+
+    def guardar_bloque(sesion, trabajo_id, bloque, posicion, *args):
+        bloques.append(len(bloque))
+        return original(sesion, trabajo_id, bloque, posicion, *args)
+
+    monkeypatch.setattr(ai_router, "_guardar_bloque", guardar_bloque)
+    # El mismo chat dos veces en un archivo: los repetidos se descartan
+    # aunque esten en bloques distintos
+    texto = _chat(250, "android") * 2
+
+    respuesta = cliente_admin.post(
+        "/api/ia/process_reviews",
+        files={"file": ("chat.txt", texto.encode("utf-8"))}
+    ).json()
+
+    assert respuesta["success"], respuesta
+    assert max(bloques) <= 100 and len(bloques) == 6
+    posiciones = [
+        fila.posicion for fila in db.query(modelos.MensajeTrabajo).filter(
+            modelos.MensajeTrabajo.trabajo_id == respuesta["job_id"]
+        ).order_by(modelos.MensajeTrabajo.posicion)
+    ]
+    assert posiciones == list(range(250))
+
+
+def test_subida_vacia_no_deja_trabajo(cliente_admin, db):
+    respuesta = cliente_admin.post(
+        "/api/ia/process_reviews",
+        files={"file": ("chat.txt", b"sin mensajes de whatsapp\n")}
+    ).json()
+
+    assert not respuesta["success"]
+    assert db.query(modelos.TrabajoAnalisis).count() == 0
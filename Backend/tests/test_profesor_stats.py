@@ -0,0 +1,142 @@
+"""
+Pruebas y benchmark de los agregados por profesor (profesor_stats) que
+alimentan el ranking del dashboard (app.Estadistica.crud).
+"""
+import random
+import time
+
+import pytest
+from sqlalchemy import desc, func, insert
+
+from app.Creacion_mats_prof.modelos import Materia, Profesor
+from app.Estadistica import crud
+from app.Estadistica.modelos import ProfesorStats
+from app.Reviews import crud as crud_reviews
+from app.Reviews import esquemas
+from app.Reviews.modelos import Resena
+
+COLUMNAS = (
+    "total_resenas", "suma_calificacion", "suma_dificultad",
+    "promedio_calificacion", "promedio_dificultad", "ultima_resena_id",
+)
+
+
+def _catalogo(db, profesores):
+    db.execute(insert(Profesor), [
+        {"nombre": f"Profesor {i}"} for i in range(profesores)
+    ])
+    materia = Materia(nombre="General")
+    db.add(materia)
+    db.commit()
+    ids = [p.id for p in db.query(Profesor.id)]
+    return ids, materia.id
+
+
+def _fila(aleatorio, profesor_id, materia_id, user_id):
+    return {
+        "comentario": aleatorio.choice([None, "", "Explica muy bien"]),
+        "calificacion": aleatorio.choice([5.0, 6.5, 8.0, 9.5, 10.0]),
+        "dificultad": aleatorio.randint(1, 10),
+        "profesor_id": profesor_id,
+        "materia_id": materia_id,
+        "user_id": user_id,
+    }
+
+
+def _agregados(db):
+    def valor(fila, columna):
+        dato = getattr(fila, columna)
+        return round(dato, 6) if isinstance(dato, float) else dato
+
+    return {
+        fila.profesor_id: tuple(valor(fila, c) for c in COLUMNAS)
+        for fila in db.query(ProfesorStats)
+    }
+
+
+def test_incremental_igual_a_reconstruir(db, usuario):
+    aleatorio = random.Random(7)
+    profesores, materia_id = _catalogo(db, 12)
+
+    for _ in range(30):
+        if aleatorio.random() < 0.5:
+            datos = _fila(
+                aleatorio, aleatorio.choice(profesores), materia_id,
+                usuario.id
+            )
+            crud_reviews.create_resena(db, esquemas.ResenaCreate(
+                comentario=datos["comentario"],
+                calificacion=datos["calificacion"],
+                dificultad=datos["dificultad"],
+                profesor_id=datos["profesor_id"],
+                materia_nombre="General"
+            ), materia_id, usuario.id)
+        else:
+            crud_reviews.bulk_create_resenas(db, [
+                _fila(
+                    aleatorio, aleatorio.choice(profesores), materia_id,
+                    usuario.id
+                )
+                for _ in range(aleatorio.randint(1, 20))
+            ])
+            db.commit()
+
+    incremental = _agregados(db)
+    ranking = [tuple(r) for r in crud.get_top_profesores(db, 12)]
+
+    crud.reconstruir_profesor_stats(db)
+
+    assert incremental == _agregados(db)
+    assert ranking == [tuple(r) for r in crud.get_top_profesores(db, 12)]
+
+
+def _top_agrupando(db, limit):
+    """Ranking anterior: agrupa toda la tabla de reseñas por consulta."""
+    resultados = db.query(
+        Profesor.id,
+        Profesor.nombre,
+        func.avg(Resena.calificacion).label("promedio"),
+        func.count(Resena.id).label("total")
+    ).join(Resena).group_by(Profesor.id).order_by(
+        desc("promedio")
+    ).limit(limit).all()
+    for r in resultados:
+        db.query(Resena).filter(
+            Resena.profesor_id == r.id,
+            Resena.comentario.is_not(None),
+            Resena.comentario != ""
+        ).order_by(desc(Resena.id)).first()
+    return resultados
+
+
+@pytest.mark.benchmark
+def test_benchmark_ranking(db, usuario):
+    aleatorio = random.Random(3)
+    profesores, materia_id = _catalogo(db, 500)
+    for _ in range(5):
+        crud_reviews.bulk_create_resenas(db, [
+            _fila(
+                aleatorio, aleatorio.choice(profesores), materia_id,
+                usuario.id
+            )
+            for _ in range(10_000)
+        ])
+    db.commit()
+
+    def medir(consulta):
+        tiempos = []
+        for _ in range(5):
+            inicio = time.perf_counter()
+            consulta()
+            tiempos.append(time.perf_counter() - inicio)
+        return min(tiempos)
+
+    t_agrupando = medir(lambda: _top_agrupando(db, 5))
+    t_stats = medir(lambda: crud.get_top_profesores(db, 5))
+
+    print(
+        f"\nTop 5 sobre 50k reseñas: agrupando "
+        f"{t_agrupando * 1000:.1f} ms, profesor_stats "
+        f"{t_stats * 1000:.2f} ms ({t_agrupando / t_stats:.0f}x)"
+    )
+    assert t_stats * 5 < t_agrupando
@@ -0,0 +1,133 @@
+"""
+Pruebas del armado de prompts con presupuesto de tokens
+(app.Chatbot.prompts).
+"""
+from app.Chatbot import prompts
+from app.cliente_ia import estimar_tokens
+
+SISTEMA = "Eres un tutor experto.\n"
+PREGUNTA = "PREGUNTA: 'Que es una derivada?'\nResponde."
+
+
+def _historial(total, largo=400):
+    return [
+        {"role": "user" if i % 2 == 0 else "model",
+         "content": f"mensaje {i} " + "x" * largo}
+        for i in range(total)
+    ]
+
+
+def _fragmento(titulo, largo):
+    return {"titulo": titulo, "texto": "y" * largo}
+
+
+def test_historial_descarta_primero_lo_mas_antiguo():
+    historial = _historial(10)
+
+    prompt = prompts.armar_prompt(
+        SISTEMA, PREGUNTA, historial=historial, presupuesto=400
+    )
+
+    incluidos = [
+        i for i in range(10) if f"mensaje {i} " in prompt.texto
+    ]
+    assert incluidos == list(range(10 - len(incluidos), 10))
+    assert 0 < len(incluidos) < 10
+    assert prompt.descartados == {
+        "historial": 10 - len(incluidos), "fragmentos": 0
+    }
+    assert prompt.tokens <= 400
+    assert prompt.texto.endswith(PREGUNTA)
+
+
+def test_fragmentos_de_menor_relevancia_se_descartan():
+    fragmentos = [
+        _fragmento("Primero", 700),
+        _fragmento("Segundo", 700),
+        _fragmento("Tercero", 700),
+        _fragmento("Grande", 4000),
+        _fragmento("Pequeno", 100),
+        _fragmento("Ultimo", 700),
+    ]
+
+    prompt = prompts.armar_prompt(
+        SISTEMA, PREGUNTA, historial=_historial(6), fragmentos=fragmentos,
+        presupuesto=800
+    )
+
+    incluidos = [
+        f["titulo"] for f in fragmentos
+        if f"--- {f['titulo']} ---" in prompt.texto
+    ]
+    # Se respetan los mejor clasificados; uno que no cabe se salta y
+    # los siguientes que si caben se incluyen
+    assert incluidos == ["Primero", "Segundo", "Tercero", "Pequeno"]
+    assert prompt.descartados["fragmentos"] == 2
+    # Con referencias, el historial solo usa su fraccion del presupuesto
+    libre = (
+        800 - estimar_tokens(SISTEMA) - estimar_tokens(PREGUNTA)
+        - estimar_tokens(prompts.ENCABEZADO_REFERENCIAS)
+    )
+    assert 0 < prompt.tokens_por_seccion["historial"] <= int(
+        libre * prompts.FRACCION_HISTORIAL
+    )
+    assert prompt.tokens <= 800
+
+
+def test_la_pregunta_nunca_se_descarta():
+    pregunta = "PREGUNTA: '" + "z" * 2000 + "'"
+
+    prompt = prompts.armar_prompt(
+        SISTEMA, pregunta, historial=_historial(4),
+        fragmentos=[_fragmento("Unico", 400)], presupuesto=100
+    )
+
+    assert prompt.texto.endswith(pregunta)
+    assert prompt.descartados == {"historial": 4, "fragmentos": 1}
+    assert prompt.tokens_por_seccion["pregunta"] == estimar_tokens(pregunta)
+
+
+def test_mensaje_reciente_demasiado_largo_se_recorta():
+    historial = _historial(3, largo=200)
+    historial.append({"role": "model", "content": "respuesta " * 2000})
+
+    prompt = prompts.armar_prompt(
+        SISTEMA, PREGUNTA, historial=historial, presupuesto=600
+    )
+
+    # Se conserva el inicio de la ultima respuesta, no todo se pierde
+    assert "Asistente: respuesta respuesta" in prompt.texto
+    assert "respuesta ..." in prompt.texto or "respuesta..." in (
+        prompt.texto
+    )
+    assert "mensaje 2 " not in prompt.texto
+    assert prompt.descartados["historial"] == 3
+    assert prompt.tokens <= 600
+
+
+def test_estadisticas_de_prompts():
+    estadisticas = prompts.EstadisticasPrompts()
+    armados = [
+        prompts.armar_prompt(
+            SISTEMA, PREGUNTA, historial=_historial(total),
+            fragmentos=[_fragmento("A", 800), _fragmento("B", 8000)],
+            presupuesto=1000
+        )
+        for total in (0, 4, 12)
+    ]
+    for prompt in armados:
+        estadisticas.registrar(prompt)
+
+    datos = estadisticas.obtener_estadisticas()
+
+    tokens = [p.tokens for p in armados]
+    assert datos["prompts"] == 3
+    assert datos["tokens_total"] == sum(tokens)
+    assert datos["tokens_max"] == max(tokens)
+    assert datos["tokens_promedio"] == round(sum(tokens) / 3)
+    assert datos["tokens_p50"] == sorted(tokens)[1]
+    assert datos["mensajes_historial_descartados"] == sum(
+        p.descartados["historial"] for p in armados
+    )
+    assert datos["fragmentos_descartados"] == 3
+    assert datos["presupuesto"] == prompts.PRESUPUESTO_PROMPT_TOKENS
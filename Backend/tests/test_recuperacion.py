@@ -0,0 +1,64 @@
+"""
+Pruebas del indice de recuperacion de recursos del Chatbot
+(app.Chatbot.recuperacion).
+"""
+import threading
+import time
+from types import SimpleNamespace
+
+from app.Chatbot import recuperacion
+
+
+def _recurso(recurso_id, texto):
+    return SimpleNamespace(
+        id=recurso_id, title=f"Recurso {recurso_id}", content_text=texto
+    )
+
+
+def test_construir_una_materia_no_bloquea_a_las_demas(
+    db, tmp_path, monkeypatch
+):
+    indice = recuperacion.IndiceRecursos(str(tmp_path))
+    construir_original = indice._construir_de_bd
+    empezo = threading.Event()
+
+    def construir_lento(materia_id, sesion):
+        if materia_id == 1:
+            empezo.set()
+            time.sleep(1)
+        return construir_original(materia_id, sesion)
+
+    monkeypatch.setattr(indice, "_construir_de_bd", construir_lento)
+
+    lenta = threading.Thread(
+        target=indice.buscar, args=(1, "derivadas", db)
+    )
+    lenta.start()
+    empezo.wait()
+
+    inicio = time.perf_counter()
+    assert indice.buscar(2, "derivadas", db) == []
+    transcurrido = time.perf_counter() - inicio
+    lenta.join()
+
+    assert transcurrido < 0.5
+
+
+def test_procesos_que_agregan_a_la_vez_no_se_pisan(db, tmp_path):
+    # Dos instancias sobre la misma carpeta simulan dos workers
+    worker_a = recuperacion.IndiceRecursos(str(tmp_path))
+    worker_b = recuperacion.IndiceRecursos(str(tmp_path))
+    worker_a.buscar(7, "algo", db)
+    worker_b.buscar(7, "algo", db)
+
+    worker_a.agregar_recursos(7, [_recurso(1, "Limites y continuidad")])
+    worker_b.agregar_recursos(7, [_recurso(2, "Derivadas parciales")])
+
+    nuevo = recuperacion.IndiceRecursos(str(tmp_path))
+    assert [f["recurso_id"] for f in nuevo.buscar(7, "limites", db)] == [1]
+    assert [
+        f["recurso_id"] for f in nuevo.buscar(7, "derivadas", db)
+    ] == [2]
+    assert [
+        f["recurso_id"] for f in worker_a.buscar(7, "derivadas", db)
+    ] == [2]
@@ -0,0 +1,152 @@
+"""
+Pruebas y benchmark de los recursos del Portal de Estudio
+(app.Porta_Estudio): los listados no deben leer content_text y la subida
+no debe indexar dentro del event loop.
+"""
+import asyncio
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+from sqlalchemy import event, insert
+from sqlalchemy.orm import undefer
+
+from app import dependencias
+from app.Chatbot import recuperacion
+from app.Creacion_mats_prof import esquemas
+from app.Creacion_mats_prof import crud as crud_catalogos
+from app.main import app
+from app.Porta_Estudio import crud, modelos
+
+
+def _crear_recursos(db, usuario, total, tamano_texto):
+    materia_id = crud_catalogos.create_materia(
+        db, esquemas.MateriaCreate(nombre="Calculo")
+    ).id
+    db.execute(insert(modelos.Resource), [
+        {"title": f"Apuntes {i}", "description": "Tema",
+         "type": modelos.ResourceType.LINK,
+         "url_or_path": f"https://example.com/{i}",
+         "materia_id": materia_id, "user_id": usuario.id,
+         "content_text": "derivadas " * (tamano_texto // 10)}
+        for i in range(total)
+    ])
+    db.commit()
+    db.expunge_all()
+    return materia_id
+
+
+def _capturar_sql(db, accion):
+    consultas = []
+
+    def registrar(conexion, cursor, sql, *args):
+        consultas.append(sql.lower())
+
+    event.listen(db.get_bind(), "before_cursor_execute", registrar)
+    try:
+        resultado = accion()
+    finally:
+        event.remove(db.get_bind(), "before_cursor_execute", registrar)
+    return resultado, consultas
+
+
+def test_listado_y_descarga_no_leen_el_texto(db, usuario):
+    materia_id = _crear_recursos(db, usuario, 3, 1000)
+
+    recursos, consultas = _capturar_sql(
+        db, lambda: crud.get_resources_by_materia(db, materia_id)
+    )
+    descarga, consultas_descarga = _capturar_sql(
+        db, lambda: crud.get_resource_for_download(db, recursos[0].id)
+    )
+
+    assert len(recursos) == 3
+    assert descarga.url_or_path == "https://example.com/0"
+    assert all(
+        "content_text" not in sql
+        for sql in consultas + consultas_descarga
+    )
+
+
+def test_endpoint_de_listado(db, usuario):
+    _crear_recursos(db, usuario, 2, 1000)
+
+    respuesta = TestClient(app).get(
+        "/api/portal/buscar_por_nombre/", params={"nombre": "calculo"}
+    )
+
+    assert respuesta.status_code == 200
+    assert [r["title"] for r in respuesta.json()] == [
+        "Apuntes 0", "Apuntes 1"
+    ]
+    assert "content_text" not in respuesta.json()[0]
+
+
+@pytest.mark.benchmark
+def test_benchmark_listado_sin_texto(db, usuario):
+    # 200 recursos con ~200 KB de texto extraido cada uno
+    materia_id = _crear_recursos(db, usuario, 200, 200_000)
+
+    def listado_completo():
+        # Como antes de diferir la columna: se lee el texto de cada fila
+        return db.query(modelos.Resource).options(
+            undefer(modelos.Resource.content_text)
+        ).filter(
+            modelos.Resource.materia_id == materia_id
+        ).all()
+
+    def medir(consulta):
+        # Mejor de 5 corridas, para que una pausa del GC no decida
+        tiempos = []
+        for _ in range(5):
+            inicio = time.perf_counter()
+            recursos = consulta()
+            tiempos.append(time.perf_counter() - inicio)
+            db.expunge_all()
+        return recursos, min(tiempos)
+
+    completo, t_completo = medir(listado_completo)
+    ligero, t_ligero = medir(
+        lambda: crud.get_resources_by_materia(db, materia_id)
+    )
+
+    print(
+        f"\n{len(ligero)} recursos: con texto {t_completo * 1000:.1f} ms, "
+        f"sin texto {t_ligero * 1000:.1f} ms "
+        f"({t_completo / t_ligero:.1f}x)"
+    )
+    assert len(completo) == len(ligero) == 200
+    assert t_ligero * 3 < t_completo
+
+
+def test_subir_recurso_indexa_fuera_del_event_loop(
+    db, usuario, monkeypatch
+):
+    materia_id = crud_catalogos.create_materia(
+        db, esquemas.MateriaCreate(nombre="Calculo")
+    ).id
+    indexados = []
+
+    def agregar_recursos(materia, recursos):
+        # En un hilo del pool no hay event loop corriendo
+        with pytest.raises(RuntimeError):
+            asyncio.get_running_loop()
+        indexados.append((materia, [r.title for r in recursos]))
+
+    monkeypatch.setattr(
+        recuperacion.indice, "agregar_recursos", agregar_recursos
+    )
+    app.dependency_overrides[dependencias.get_current_user] = (
+        lambda: usuario
+    )
+    try:
+        respuesta = TestClient(app).post("/api/portal/", data={
+            "title": "Clase de limites", "materia_nombre": "Calculo",
+            "type": modelos.ResourceType.VIDEO.value,
+            "url_externa": "https://example.com/limites",
+        })
+    finally:
+        app.dependency_overrides.clear()
+
+    assert respuesta.status_code == 200
+    assert indexados == [(materia_id, ["Clase de limites"])]
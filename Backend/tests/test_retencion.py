@@ -0,0 +1,176 @@
+"""
+Pruebas y benchmark de la retencion del historial del Chatbot
+(app.Chatbot.retencion).
+"""
+import json
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import insert, text
+
+from app.Chatbot import historial, limitador, retencion
+from app.Chatbot.modelos import HistorialChat, HistorialChatArchivo
+from app.Usuarios.modelos import User
+
+
+def _usuario(db, email, role="student"):
+    user = User(
+        email=email, full_name=email, career="ISC",
+        hashed_password="x", role=role
+    )
+    db.add(user)
+    db.commit()
+    return user.id
+
+
+def _mensajes(db, user_id, dias, cantidad):
+    momento = datetime.utcnow() - timedelta(days=dias)
+    db.execute(insert(HistorialChat), [
+        {"user_id": user_id, "role": "user" if i % 2 == 0 else "model",
+         "content": f"mensaje {i}",
+         "timestamp": momento + timedelta(seconds=i)}
+        for i in range(cantidad)
+    ])
+    db.commit()
+
+
+def test_compacta_por_usuario_y_dia(db, usuario, monkeypatch):
+    monkeypatch.setattr(retencion, "LOTE_COMPACTACION", 7)
+    otro = _usuario(db, "otro@example.com")
+    _mensajes(db, usuario.id, 40, 10)
+    _mensajes(db, usuario.id, 35, 4)
+    _mensajes(db, otro, 40, 6)
+    _mensajes(db, usuario.id, 2, 8)
+
+    assert retencion.compactar(db) == 20
+
+    assert db.query(HistorialChat).count() == 8
+    archivo = {
+        (fila.user_id, fila.total_mensajes): json.loads(fila.mensajes_json)
+        for fila in db.query(HistorialChatArchivo)
+    }
+    # Los lotes de 7 parten los dias; cada parte se archiva por separado
+    assert sum(total for _, total in archivo) == 20
+    assert {user_id for user_id, _ in archivo} == {usuario.id, otro}
+    mensajes = [
+        m["content"] for (user_id, _), lista in sorted(archivo.items())
+        if user_id == otro for m in lista
+    ]
+    assert mensajes == [f"mensaje {i}" for i in range(6)]
+
+
+def test_purga_segun_el_rol(db, usuario, monkeypatch):
+    monkeypatch.setitem(retencion.DIAS_ARCHIVO_POR_ROL, "student", 365)
+    monkeypatch.setitem(retencion.DIAS_ARCHIVO_POR_ROL, "admin", 0)
+    admin = _usuario(db, "admin@example.com", role="admin")
+    for user_id in (usuario.id, admin):
+        _mensajes(db, user_id, 400, 2)
+        _mensajes(db, user_id, 100, 2)
+    retencion.compactar(db)
+
+    assert retencion.purgar_archivo(db) == 1
+
+    corte = (datetime.utcnow() - timedelta(days=365)).date()
+    restantes = sorted(
+        (fila.user_id, fila.fecha < corte)
+        for fila in db.query(HistorialChatArchivo)
+    )
+    assert restantes == sorted([
+        (usuario.id, False), (admin, True), (admin, False)
+    ])
+
+
+@pytest.mark.benchmark
+def test_benchmark_compactacion(db, usuario):
+    # 200 usuarios x 30 dias x 10 mensajes (60k filas), escala reducida
+    usuarios = [
+        _usuario(db, f"alumno{i}@example.com") for i in range(200)
+    ]
+    for dia in range(31, 61):
+        momento = datetime.utcnow() - timedelta(days=dia)
+        db.execute(insert(HistorialChat), [
+            {"user_id": user_id, "role": "user", "content": "x" * 200,
+             "timestamp": momento + timedelta(seconds=i)}
+            for user_id in usuarios for i in range(10)
+        ])
+    db.commit()
+
+    inicio = time.perf_counter()
+    archivados = retencion.compactar(db)
+    transcurrido = time.perf_counter() - inicio
+
+    registros = db.query(HistorialChatArchivo).count()
+    print(
+        f"\n{archivados} mensajes compactados en {transcurrido:.2f} s "
+        f"({archivados / transcurrido:,.0f} msg/s) en {registros} "
+        f"registros de archivo"
+    )
+    assert archivados == 60_000
+    assert db.query(HistorialChat).count() == 0
+    # Un registro por usuario y dia (mas los dias partidos entre lotes)
+    assert 6000 <= registros < 6000 + 60_000 // retencion.LOTE_COMPACTACION
+
+
+def _tiempos_por_usuario(db, usuarios):
+    """Lectura del historial y verificacion de cuota, por usuario (ms)."""
+    def medir(accion):
+        mejores = []
+        for _ in range(3):
+            inicio = time.perf_counter()
+            for user_id in usuarios:
+                accion(user_id)
+            mejores.append(time.perf_counter() - inicio)
+        return min(mejores) / len(usuarios) * 1000
+
+    # Un buffer nuevo en cada lectura: el historial se lee de la BD, como
+    # tras un reinicio. La cuota no consulta el historial (solo el rol,
+    # una vez por usuario)
+    lectura = medir(
+        lambda user_id: historial.BufferHistorial().recientes(
+            user_id, 6, db
+        )
+    )
+    chatbot = limitador.LimitadorChatbot()
+    cuota = medir(lambda user_id: chatbot.verificar(user_id, "10.0.0.5", db))
+    return lectura, cuota
+
+
+@pytest.mark.benchmark
+def test_benchmark_historial_no_crece_con_la_tabla(db, usuario):
+    usuarios = [
+        _usuario(db, f"alumno{i}@example.com") for i in range(100)
+    ]
+
+    def llenar(por_usuario):
+        momento = datetime.utcnow() - timedelta(days=1)
+        db.execute(insert(HistorialChat), [
+            {"user_id": user_id, "role": "user" if i % 2 else "model",
+             "content": "x" * 200,
+             "timestamp": momento + timedelta(seconds=i)}
+            for user_id in usuarios for i in range(por_usuario)
+        ])
+        db.commit()
+
+    llenar(20)
+    pequena = db.query(HistorialChat).count()
+    lectura_pequena, cuota_pequena = _tiempos_por_usuario(db, usuarios)
+    llenar(1000)
+    grande = db.query(HistorialChat).count()
+    lectura_grande, cuota_grande = _tiempos_por_usuario(db, usuarios)
+
+    plan = db.execute(text(
+        "EXPLAIN QUERY PLAN SELECT role, content FROM historial_chat "
+        "WHERE user_id = 1 ORDER BY timestamp DESC, id DESC LIMIT 20"
+    )).all()
+    print(
+        f"\nPor usuario, tabla de {pequena} / {grande} filas: historial "
+        f"{lectura_pequena:.3f} / {lectura_grande:.3f} ms, cuota "
+        f"{cuota_pequena:.4f} / {cuota_grande:.4f} ms"
+    )
+    assert any(
+        "ix_historial_chat_user_timestamp" in fila[-1] for fila in plan
+    )
+    # 50 veces mas filas por usuario; con el indice el costo se mantiene
+    assert lectura_grande < lectura_pequena * 3
+    assert cuota_grande < cuota_pequena * 3 + 0.01
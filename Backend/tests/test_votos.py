@@ -0,0 +1,164 @@
+"""
+Pruebas de los votos de utilidad y de sus contadores desnormalizados
+(app.Reviews.crud: votar_resena, reconciliar_votos y
+asegurar_contadores_votos).
+"""
+import pytest
+from sqlalchemy import event, func, inspect, insert, text, update
+
+from app.database import SessionLocal, engine
+from app.Creacion_mats_prof.modelos import Materia, Profesor
+from app.Reviews import crud
+from app.Reviews.modelos import Resena, Voto
+from app.Usuarios.modelos import User
+
+
+@pytest.fixture
+def resena_id(db, usuario):
+    profesor = Profesor(nombre="Lopez Juan")
+    materia = Materia(nombre="Redes")
+    db.add_all([profesor, materia])
+    db.flush()
+    resena = Resena(
+        comentario="Explica bien", calificacion=9.0, dificultad=5,
+        profesor_id=profesor.id, materia_id=materia.id, user_id=usuario.id
+    )
+    db.add(resena)
+    db.commit()
+    return resena.id
+
+
+def _usuarios(db, total):
+    db.execute(insert(User), [
+        {"email": f"votante{i}@example.com", "full_name": f"Votante {i}",
+         "career": "ISC", "hashed_password": "x", "role": "student"}
+        for i in range(total)
+    ])
+    db.commit()
+    return [u.id for u in db.query(User.id).filter(
+        User.email.like("votante%")
+    ).order_by(User.id)]
+
+
+def _contadores(db, resena_id):
+    db.expire_all()
+    return db.query(Resena.utiles, Resena.no_utiles).filter(
+        Resena.id == resena_id
+    ).one()
+
+
+def _contar_votos(db, resena_id):
+    def contar(es_util):
+        return db.query(func.count(Voto.id)).filter(
+            Voto.resena_id == resena_id, Voto.es_util == es_util
+        ).scalar()
+
+    return contar(True), contar(False)
+
+
+def test_voto_nuevo_repetido_y_cambiado(db, usuario, resena_id):
+    pasos = [
+        (True, "registrado", (1, 0)),
+        (True, "eliminado", (0, 0)),
+        (False, "registrado", (0, 1)),
+        (True, "actualizado", (1, 0)),
+        (False, "actualizado", (0, 1)),
+        (False, "eliminado", (0, 0)),
+    ]
+    for es_util, accion_esperada, esperado in pasos:
+        total, accion = crud.votar_resena(db, resena_id, usuario.id, es_util)
+
+        assert accion == accion_esperada
+        assert total == esperado[0]
+        assert tuple(_contadores(db, resena_id)) == esperado
+        assert _contar_votos(db, resena_id) == esperado
+
+
+def test_votos_de_varios_usuarios(db, resena_id):
+    votantes = _usuarios(db, 6)
+    for i, user_id in enumerate(votantes):
+        crud.votar_resena(db, resena_id, user_id, i % 3 != 0)
+    # Dos cambian de opinion y uno retira su voto
+    crud.votar_resena(db, resena_id, votantes[0], True)
+    crud.votar_resena(db, resena_id, votantes[1], False)
+    crud.votar_resena(db, resena_id, votantes[2], True)
+
+    assert tuple(_contadores(db, resena_id)) == (3, 2)
+    assert _contar_votos(db, resena_id) == (3, 2)
+
+
+def test_reintento_si_el_insert_choca_con_el_indice_unico(
+    db, usuario, resena_id, monkeypatch
+):
+    llamadas = []
+    aplicar = crud._aplicar_voto
+
+    def contar_llamadas(*args):
+        llamadas.append(args)
+        return aplicar(*args)
+
+    monkeypatch.setattr(crud, "_aplicar_voto", contar_llamadas)
+
+    # Entre la lectura y el INSERT, otra peticion del mismo usuario
+    # registra su voto primero
+    def votar_antes(sesion, contexto, instancias):
+        otra = SessionLocal()
+        try:
+            crud.votar_resena(otra, resena_id, usuario.id, True)
+        finally:
+            otra.close()
+
+    event.listen(db, "before_flush", votar_antes, once=True)
+
+    total, accion = crud.votar_resena(db, resena_id, usuario.id, True)
+
+    # La votacion de la otra sesion y los dos intentos de esta
+    assert len(llamadas) == 3
+    # El reintento ve el voto ajeno y lo interpreta como conmutacion
+    assert accion == "eliminado"
+    assert total == 0
+    assert tuple(_contadores(db, resena_id)) == (0, 0)
+    assert _contar_votos(db, resena_id) == (0, 0)
+
+
+def test_reconciliar_corrige_contadores(db, resena_id):
+    votantes = _usuarios(db, 5)
+    for i, user_id in enumerate(votantes):
+        crud.votar_resena(db, resena_id, user_id, i < 3)
+    db.execute(update(Resena).values(utiles=40, no_utiles=-7))
+    db.commit()
+
+    assert crud.reconciliar_votos(db) == 1
+
+    assert tuple(_contadores(db, resena_id)) == (3, 2)
+
+
+def test_asegurar_contadores_en_bd_existente(db, resena_id):
+    votantes = _usuarios(db, 3)
+    # Base de datos anterior: sin indice unico ni columnas de contadores
+    db.execute(text("DROP INDEX uq_votos_resena_usuario"))
+    db.execute(insert(Voto), [
+        {"resena_id": resena_id, "user_id": votantes[0], "es_util": False},
+        {"resena_id": resena_id, "user_id": votantes[0], "es_util": True},
+        {"resena_id": resena_id, "user_id": votantes[1], "es_util": True},
+        {"resena_id": resena_id, "user_id": votantes[2], "es_util": False},
+    ])
+    db.execute(text("ALTER TABLE resenas DROP COLUMN utiles"))
+    db.execute(text("ALTER TABLE resenas DROP COLUMN no_utiles"))
+    db.commit()
+    db.close()
+
+    crud.asegurar_contadores_votos()
+
+    inspector = inspect(engine)
+    assert {"utiles", "no_utiles"} <= {
+        c["name"] for c in inspector.get_columns("resenas")
+    }
+    assert "uq_votos_resena_usuario" in {
+        i["name"] for i in inspector.get_indexes("votos")
+    }
+    # Se conserva el voto mas reciente de cada usuario
+    assert sorted(
+        (v.user_id, v.es_util) for v in db.query(Voto)
+    ) == [(votantes[0], True), (votantes[1], True), (votantes[2], False)]
+    assert tuple(_contadores(db, resena_id)) == (2, 1)
@@ -12,6 +12,7 @@ const Pagina_Analisis = () => {
   const [reviews, setReviews] = useState([]); 
   const [error, setError] = useState(null);
   const [successMsg, setSuccessMsg] = useState(null);
+  const [progresoMsg, setProgresoMsg] = useState(null);
 
   const inputRef = useRef(null);
   const navigate = useNavigate();
@@ -67,6 +68,7 @@ const Pagina_Analisis = () => {
     setLoading(true);
     setError(null);
     setSuccessMsg(null);
+    setProgresoMsg(null);
 
     const formData = new FormData();
     formData.append('file', archivo);
@@ -78,8 +80,32 @@ const Pagina_Analisis = () => {
             }
         });
 
-        setSuccessMsg(response.data.message); 
-        setReviews(response.data.data); 
+        if (!response.data.success) {
+            setError(response.data.message);
+            return;
+        }
+
+        // El análisis corre en segundo plano: consultamos el progreso
+        // del trabajo hasta que termine y luego pedimos el resultado.
+        const jobId = response.data.job_id;
+        let progreso = null;
+        do {
+            await new Promise((resolve) => setTimeout(resolve, 3000));
+            const respProgreso = await api.get(`/ia/jobs/${jobId}`);
+            progreso = respProgreso.data;
+            setProgresoMsg(
+                `Mensajes analizados: ${progreso.mensajes_analizados}/${progreso.total_mensajes} · ` +
+                `Reseñas encontradas: ${progreso.resenas_encontradas}`
+            );
+        } while (progreso.estado === 'pendiente' || progreso.estado === 'procesando');
+
+        const resultado = await api.get(`/ia/jobs/${jobId}/resultado`);
+        if (resultado.data.success) {
+            setSuccessMsg(resultado.data.message);
+            setReviews(resultado.data.data);
+        } else {
+            setError(resultado.data.message);
+        }
 
     } catch (err) {
         console.error("Error en el análisis:", err);
@@ -98,6 +124,7 @@ const Pagina_Analisis = () => {
         }
     } finally {
         setLoading(false);
+        setProgresoMsg(null);
     }
   };
 
@@ -167,6 +194,7 @@ const Pagina_Analisis = () => {
                    <div className="spinner-container">
                        <div className="spinner"></div>
                        <p>La IA está leyendo el chat...</p>
+                       {progresoMsg && <p>{progresoMsg}</p>}
                    </div>
                ) : reviews && reviews.length > 0 ? (
                    <div className="reviews-list">
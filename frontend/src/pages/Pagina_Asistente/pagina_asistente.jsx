@@ -66,10 +66,43 @@ const Pagina_Asistente = () => {
               materia_id: 0 // 0 para que la IA detecte la materia automáticamente
           };
 
-          const response = await api.post('/bot/preguntar', payload);
-          
-          // Guardar la respuesta
-          setAnswer(response.data.respuesta);
+          // La respuesta llega por partes (Server-Sent Events) y se va
+          // mostrando conforme el modelo la genera
+          const token = localStorage.getItem('token');
+          const response = await fetch(`${api.defaults.baseURL}/bot/preguntar/stream`, {
+              method: 'POST',
+              headers: {
+                  'Content-Type': 'application/json',
+                  ...(token ? { Authorization: `Bearer ${token}` } : {})
+              },
+              body: JSON.stringify(payload)
+          });
+          if (!response.ok || !response.body) throw new Error(`HTTP ${response.status}`);
+
+          const reader = response.body.getReader();
+          const decoder = new TextDecoder();
+          let buffer = "";
+          let texto = "";
+          while (true) {
+              const { done, value } = await reader.read();
+              if (done) break;
+              buffer += decoder.decode(value, { stream: true });
+
+              // Cada evento termina con una linea en blanco
+              const eventos = buffer.split("\n\n");
+              buffer = eventos.pop();
+              for (const evento of eventos) {
+                  const linea = evento.split("\n").find((l) => l.startsWith("data: "));
+                  if (!linea) continue;
+                  const datos = JSON.parse(linea.slice(6));
+                  if (evento.startsWith("event: fin")) {
+                      texto = datos.respuesta;
+                  } else {
+                      texto += datos.texto;
+                  }
+                  setAnswer(texto);
+              }
+          }
 
       } catch (error) {
           console.error("Error del bot:", error);
@@ -109,7 +142,7 @@ const Pagina_Asistente = () => {
             <section className="answer-section">
                 <h2 className="section-label">Respuesta del Asistente:</h2>
                 <div className="answer-bar">
-                    {loading ? (
+                    {loading && !answer ? (
                         <p className="typing-indicator">Pensando... 🧠</p>
                     ) : answer ? (
                         // Usamos white-space: pre-wrap en CSS para respetar saltos de línea